@@ -0,0 +1,5 @@
+"""Benchmarks for pytype's internals. Not part of the installed package.
+
+Run them from the root of a source checkout, e.g.
+  python -m benchmarks.cfg_reachability
+"""
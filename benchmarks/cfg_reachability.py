@@ -0,0 +1,115 @@
+"""Benchmark for the reachability queries of the CFG solver.
+
+Usage:
+  python -m benchmarks.cfg_reachability
+
+Builds synthetic CFGs (chains of diamonds, and nested loops), and times
+Solver._FindSupernodeBackwards, which uses the ReachabilityIndex computed by
+Program.Freeze, against the plain backwards walk over supernodes that the
+solver used before the index existed.
+"""
+
+import optparse
+import random
+import time
+
+from pytype.pytd import cfg
+
+
+def _diamonds(program, n):
+  """A chain of n if/else diamonds."""
+  node = program.NewCFGNode("entry")
+  program.entrypoint = node
+  for i in range(n):
+    left = node.ConnectNew("left%d" % i)
+    right = node.ConnectNew("right%d" % i)
+    node = left.ConnectNew("join%d" % i)
+    right.ConnectTo(node)
+    node = node.ConnectNew("stmt%d" % i)
+
+
+def _loops(program, n):
+  """n loops, each containing a diamond and a nested loop."""
+  node = program.NewCFGNode("entry")
+  program.entrypoint = node
+  for i in range(n):
+    head = node.ConnectNew("head%d" % i)
+    inner = head.ConnectNew("inner%d" % i)
+    left = inner.ConnectNew("left%d" % i)
+    right = inner.ConnectNew("right%d" % i)
+    join = left.ConnectNew("join%d" % i)
+    right.ConnectTo(join)
+    join.ConnectTo(inner)
+    join.ConnectTo(head)
+    node = head.ConnectNew("exit%d" % i)
+
+
+def _walk_supernodes_backwards(start, finish, blocked_supernodes):
+  """The search that Solver used before ReachabilityIndex, uncached."""
+  stack = list(start.incoming)
+  seen = set()
+  while stack:
+    node = stack.pop().supernode[0]
+    if node is finish:
+      return True
+    if node in seen:
+      continue
+    seen.add(node)
+    if node in blocked_supernodes:
+      continue
+    stack.extend(node.incoming)
+  return False
+
+
+def _queries(program, count, rand):
+  """Random queries between supernodes, with a few blocked nodes each."""
+  firsts = [node for node in program.cfg_nodes if node.position == 0]
+  queries = []
+  for _ in range(count):
+    start, finish = rand.choice(firsts), rand.choice(firsts)
+    blocked = frozenset(rand.sample(firsts, 3)) - {start, finish}
+    queries.append((start, finish, blocked))
+  return queries
+
+
+def _time(f, queries):
+  start = time.clock()
+  results = [f(*query) for query in queries]
+  return time.clock() - start, results
+
+
+def main():
+  parser = optparse.OptionParser(usage=__doc__)
+  parser.add_option("--size", type="int", default=200,
+                    help="Number of diamonds or loops per CFG.")
+  parser.add_option("--queries", type="int", default=20000,
+                    help="Number of queries per CFG.")
+  options, _ = parser.parse_args()
+  rand = random.Random(0)
+  for name, build in [("diamonds", _diamonds), ("loops", _loops)]:
+    program = cfg.Program()
+    build(program, options.size)
+    start = time.clock()
+    program.Freeze()
+    freeze_time = time.clock() - start
+    queries = _queries(program, options.queries, rand)
+    walk_time, expected = _time(_walk_supernodes_backwards, queries)
+    solver = program.solver
+    def find_with_index(start, finish, blocked):
+      blocked_supernodes = 0
+      for node in blocked:
+        blocked_supernodes |= 1 << node.supernode_id
+      return solver._FindSupernodeBackwards(  # pylint: disable=protected-access
+          start.supernode_id, finish.supernode_id, blocked_supernodes)
+    index_time, results = _time(find_with_index, queries)
+    assert results == expected
+    print "%s (%d nodes, %d supernodes):" % (
+        name, len(program.cfg_nodes), len(program.reachability.ancestors))
+    print "  Freeze:      %8.1f ms" % (1000 * freeze_time)
+    print "  walk:        %8.1f ms" % (1000 * walk_time)
+    print "  index:       %8.1f ms  (%d%% positive)" % (
+        1000 * index_time, 100 * sum(results) / len(results))
+
+
+if __name__ == "__main__":
+  main()
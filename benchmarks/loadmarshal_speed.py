@@ -0,0 +1,86 @@
+"""Benchmark for loadmarshal.py.
+
+Usage:
+  python -m benchmarks.loadmarshal_speed [--baseline=FILE]
+
+Times loadmarshal.loads on large marshalled code objects: a generated module
+with big constant tables, and pytype's own sources. To compare against another
+version of the loader, pass its source file as --baseline, e.g. after
+  git show HEAD~1:pytype/pyc/loadmarshal.py > /tmp/loadmarshal_old.py
+"""
+
+import imp
+import marshal
+import optparse
+import os
+import sys
+import time
+
+import pytype
+from pytype.pyc import loadmarshal
+
+
+def _generated_module():
+  """Source code of a module with large constant tables."""
+  lines = []
+  for i in range(20):
+    lines.append("INTS_%d = (%s)" % (
+        i, ", ".join(str(j * 7919 % 65536) for j in range(2000))))
+    lines.append("NAMES_%d = [%s]" % (
+        i, ", ".join(repr("name_%d_%d" % (i, j)) for j in range(500))))
+    lines.append("TABLE_%d = {%s}" % (
+        i, ", ".join("%r: (%d, %r)" % ("key%d" % j, j, "v%d" % j)
+                     for j in range(200))))
+  for i in range(200):
+    lines.append("def f_%d(a, b, c=%d):\n  return a.x_%d + b + c" % (i, i, i))
+  return "\n".join(lines) + "\n"
+
+
+def _pytype_sources():
+  """The concatenated sources of pytype's top-level modules."""
+  root = os.path.dirname(os.path.abspath(pytype.__file__))
+  codes = []
+  for filename in sorted(os.listdir(root)):
+    if filename.endswith(".py"):
+      with open(os.path.join(root, filename)) as fi:
+        codes.append(compile(fi.read(), filename, "exec"))
+  return tuple(codes)
+
+
+def _time(f, data, repeat):
+  """Return the best CPU time, in seconds, of repeated calls of f(data)."""
+  best = None
+  for _ in range(repeat):
+    start = time.clock()
+    f(data)
+    elapsed = time.clock() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+def main():
+  parser = optparse.OptionParser(usage=__doc__)
+  parser.add_option("--baseline", default=None,
+                    help="Source file of a loadmarshal version to compare to.")
+  parser.add_option("--repeat", type="int", default=5,
+                    help="Number of runs per input. The best one counts.")
+  options, _ = parser.parse_args()
+  version = sys.version_info[:2]
+  loaders = [("loadmarshal", lambda data: loadmarshal.loads(data, version))]
+  if options.baseline:
+    baseline = imp.load_source("loadmarshal_baseline", options.baseline)
+    loaders.append(("baseline", lambda data: baseline.loads(data, version)))
+  loaders.append(("marshal (C)", marshal.loads))
+  inputs = [
+      ("generated", marshal.dumps(compile(_generated_module(), "gen", "exec"))),
+      ("pytype", marshal.dumps(_pytype_sources())),
+  ]
+  for input_name, data in inputs:
+    print "%s (%d KB):" % (input_name, len(data) >> 10)
+    for loader_name, loader in loaders:
+      print "  %-12s %8.1f ms" % (
+          loader_name, 1000 * _time(loader, data, options.repeat))
+
+
+if __name__ == "__main__":
+  main()
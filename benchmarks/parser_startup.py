@@ -0,0 +1,97 @@
+"""Benchmark for the startup time of the pyi parser.
+
+Usage:
+  python -m benchmarks.parser_startup [input.pyi]
+
+Measures, in a fresh process, how long it takes to import the parser and to
+parse the first .pyi file (by default, a small stub), and how long the next
+parse of the same file takes. This is done twice: once with the lexer and
+parser tables computed at startup, as in a source checkout, and once with the
+tables generated by parser.generate_tables, as in an installed pytype.
+"""
+
+import imp
+import json
+import optparse
+import os
+import subprocess
+import sys
+import time
+
+from pytype import utils
+
+_SMALL_STUB = """
+from typing import List
+x = ...  # type: int
+class A(object):
+    def f(self, y: List[int]) -> str: ...
+"""
+
+
+def _load_tables(tables_dir):
+  """Make the generated tables in tables_dir importable by the parser."""
+  for name in ["pyi_lextab", "pyi_parsetab"]:
+    full_name = "pytype.pytd.parse." + name
+    sys.modules[full_name] = imp.load_source(
+        full_name, os.path.join(tables_dir, name + ".py"))
+
+
+def _measure(filename):
+  """Return a map from measurement name to seconds."""
+  if filename:
+    with open(filename) as fi:
+      src = fi.read()
+  else:
+    src = _SMALL_STUB
+  start = time.time()
+  from pytype.pytd.parse import parser  # pylint: disable=g-import-not-at-top
+  imported = time.time()
+  parser.parse_string(src, filename=filename)
+  parsed = time.time()
+  parser.parse_string(src, filename=filename)
+  reparsed = time.time()
+  return {"import": imported - start,
+          "first parse": parsed - imported,
+          "first parsed pyi": parsed - start,
+          "second parse": reparsed - parsed}
+
+
+def _run(filename, tables_dir):
+  args = [sys.executable, "-m", "benchmarks.parser_startup",
+          "--measure"]
+  if tables_dir:
+    args += ["--tables", tables_dir]
+  if filename:
+    args.append(filename)
+  output = subprocess.check_output(args)
+  return json.loads(output.splitlines()[-1])
+
+
+def _report(title, result):
+  print "%s:" % title
+  for name in ["import", "first parse", "first parsed pyi", "second parse"]:
+    print "  %-17s %8.1f ms" % (name, 1000 * result[name])
+
+
+def main():
+  parser = optparse.OptionParser(usage=__doc__)
+  parser.add_option("--measure", action="store_true",
+                    help=optparse.SUPPRESS_HELP)
+  parser.add_option("--tables", default=None, help=optparse.SUPPRESS_HELP)
+  options, args = parser.parse_args()
+  filename = args[0] if args else None
+  if options.measure:
+    # We're measuring one configuration, in a process of its own.
+    if options.tables:
+      _load_tables(options.tables)
+    print json.dumps(_measure(filename))
+    return
+  _report("tables computed at startup", _run(filename, None))
+  with utils.Tempdir() as d:
+    from pytype.pytd.parse import parser as pyi_parser  # pylint: disable=g-import-not-at-top
+    pyi_parser.generate_tables(d.path)
+    _report("generated tables", _run(filename, d.path))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,132 @@
+"""Benchmark for the memory use of the typegraph (see pytd/cfg.py).
+
+Usage:
+  python -m benchmarks.typegraph_memory [--baseline=FILE] [input.py]
+
+Analyzes a file (by default, test_data/pytree.py) the way infer.infer_types
+does, up to the point where the program gets frozen, and reports how many
+bytes the CFG nodes, variables, bindings, origins and source sets take up,
+including the lists, dicts and sets they own. The data of the bindings isn't
+counted. To compare against another version of the typegraph, pass its source
+file as --baseline, e.g. after
+  git show HEAD~1:pytype/pytd/cfg.py > /tmp/cfg_old.py
+"""
+
+import collections
+import gc
+import imp
+import json
+import optparse
+import os
+import subprocess
+import sys
+
+import pytype
+
+
+_CONTAINER_TYPES = (list, tuple, dict, set, frozenset,
+                    collections.defaultdict)
+
+
+def _use_cfg(filename):
+  """Replace pytype.pytd.cfg with the module in the given file."""
+  from pytype import pytd  # pylint: disable=g-import-not-at-top
+  pytd.cfg = imp.load_source("pytype.pytd.cfg", filename)
+
+
+def _analyze(filename):
+  """Run the analysis, and return the resulting CallTracer."""
+  # pylint: disable=g-import-not-at-top
+  from pytype import config
+  from pytype import errors
+  from pytype import infer
+  # pylint: enable=g-import-not-at-top
+  with open(filename) as fi:
+    src = fi.read()
+  tracer = infer.CallTracer(errorlog=errors.ErrorLog(),
+                            options=config.Options.create(),
+                            module_name="benchmark")
+  loc, defs, builtin_names = tracer.run_program(src, filename, True)
+  tracer.exitpoint = tracer.analyze(loc, defs, builtin_names)
+  return tracer
+
+
+def _owned_size(obj, counted):
+  """The size of obj, and of the containers it references, recursively."""
+  if id(obj) in counted:
+    return 0
+  counted.add(id(obj))
+  size = sys.getsizeof(obj)
+  if isinstance(obj, dict):
+    items = obj.keys() + obj.values()
+  elif isinstance(obj, _CONTAINER_TYPES):
+    items = obj
+  else:
+    items = [getattr(obj, name, None) for name in type(obj).__slots__]
+  for item in items:
+    if type(item) in _CONTAINER_TYPES:
+      size += _owned_size(item, counted)
+  return size
+
+
+def _measure():
+  """Return a map from type name to (number of objects, bytes)."""
+  from pytype.pytd import cfg  # pylint: disable=g-import-not-at-top
+  gc.collect()
+  objects = collections.defaultdict(list)
+  for obj in gc.get_objects():
+    if type(obj) in (cfg.CFGNode, cfg.Variable, cfg.Binding):
+      objects[type(obj).__name__].append(obj)
+  for binding in objects["Binding"]:
+    for origin in binding.origins:
+      objects["Origin"].append(origin)
+      objects["SourceSet"].extend(origin.source_sets)
+  counted = set()
+  result = {}
+  # SourceSets are counted on their own, so count them first.
+  for name in ["SourceSet", "Origin", "Binding", "Variable", "CFGNode"]:
+    count = len({id(obj) for obj in objects[name]})
+    size = sum(_owned_size(obj, counted) for obj in objects[name])
+    result[name] = (count, size)
+  return result
+
+
+def _report(title, result):
+  bindings, _ = result["Binding"]
+  total = sum(size for _, size in result.values())
+  print "%s: %d bytes per binding" % (title, total // bindings)
+  for name, (count, size) in sorted(result.items()):
+    print "  %-10s %8d objects %8d KB %6d bytes per binding" % (
+        name, count, size >> 10, size // bindings)
+
+
+def main():
+  parser = optparse.OptionParser(usage=__doc__)
+  parser.add_option("--baseline", default=None,
+                    help="Source file of a cfg.py version to compare to.")
+  parser.add_option("--cfg", default=None, help=optparse.SUPPRESS_HELP)
+  options, args = parser.parse_args()
+  if args:
+    filename, = args
+  else:
+    filename = os.path.join(os.path.dirname(os.path.abspath(pytype.__file__)),
+                            "test_data", "pytree.py")
+  if options.cfg:
+    # We're measuring the baseline, in a process of its own.
+    _use_cfg(options.cfg)
+    tracer = _analyze(filename)
+    print json.dumps(_measure())
+    del tracer
+    return
+  if options.baseline:
+    output = subprocess.check_output(
+        [sys.executable, "-m", "benchmarks.typegraph_memory",
+         "--cfg", options.baseline, filename])
+    _report("baseline", json.loads(output.splitlines()[-1]))
+  tracer = _analyze(filename)
+  _report("cfg.py", _measure())
+  del tracer
+
+
+if __name__ == "__main__":
+  main()
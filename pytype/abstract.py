@@ -16,6 +16,7 @@ import logging
 
 from pytype import exceptions
 from pytype import function
+from pytype import metrics
 from pytype import output
 from pytype import utils
 from pytype.pyc import loadmarshal
@@ -28,6 +29,9 @@ log = logging.getLogger(__name__)
 chain = itertools.chain  # pylint: disable=invalid-name
 WrapsDict = pytd_utils.WrapsDict  # pylint: disable=invalid-name
 
+_match_cache_metric = metrics.MapCounter("match_value_cache")
+_mro_cache_metric = metrics.MapCounter("mro_lookup_cache")
+
 
 class ConversionError(ValueError):
   pass
@@ -126,8 +130,20 @@ def match_value_against_type(value, other_type, subst, node, view):
   # TODO(kramm): Use view
 
   if isinstance(other_type, Class):
-    # Accumulate substitutions in "subst", or break in case of error:
-    return left.match_against_type(other_type, subst, node, view)
+    key = _get_match_cache_key(left, other_type)
+    if key is None:
+      _match_cache_metric.inc("uncached")
+      # Accumulate substitutions in "subst", or break in case of error:
+      return left.match_against_type(other_type, subst, node, view)
+    match_cache = left.vm.match_cache
+    if key in match_cache:
+      _match_cache_metric.inc("hit")
+      return subst if match_cache[key] else None
+    _match_cache_metric.inc("miss")
+    new_subst = left.match_against_type(other_type, subst, node, view)
+    assert new_subst is None or new_subst is subst
+    match_cache[key] = new_subst is not None
+    return new_subst
   elif isinstance(other_type, Union):
     for t in other_type.options:
       new_subst = match_value_against_type(value, t, subst, node, view)
@@ -170,6 +186,52 @@ def match_value_against_type(value, other_type, subst, node, view):
     return None
 
 
+def _get_instance_class(value):
+  """Get the class of an instance that is matched using its class only.
+
+  Args:
+    value: An AtomicAbstractValue.
+  Returns:
+    The class of value, or None if value has more than one class, or if it
+    overrides how it is matched against types.
+  """
+  if (not isinstance(value, SimpleAbstractValue) or
+      type(value).match_against_type.im_func is not
+      SimpleAbstractValue.match_against_type.im_func):
+    return None
+  if not value.cls or len(value.cls.bindings) != 1:
+    return None
+  return value.cls.data[0]
+
+
+def _get_match_cache_key(left, other_type):
+  """Get the key for memoizing matching left against other_type.
+
+  Matching an instance against a class that isn't parameterized only looks at
+  the MRO of the instance's class, for InterpreterClass and for a PyTDClass
+  that has no parameterized base classes. Neither the view nor the
+  substitution is used, and the result is either None or the unchanged
+  substitution. The MRO is computed when a class is created, so these results
+  stay valid when the class is mutated later, e.g. by set_attribute.
+
+  Args:
+    left: An AtomicAbstractValue.
+    other_type: A Class.
+  Returns:
+    A tuple of the class of left and other_type, or None if the match can't
+    be memoized.
+  """
+  if not isinstance(other_type, (PyTDClass, InterpreterClass)):
+    return None
+  cls = _get_instance_class(left)
+  if isinstance(cls, PyTDClass):
+    if not all(isinstance(base, PyTDClass) for base in cls.mro):
+      return None
+  elif not isinstance(cls, InterpreterClass):
+    return None
+  return (cls, other_type)
+
+
 class AtomicAbstractValue(object):
   """A single abstract value such as a type or function signature.
 
@@ -194,6 +256,8 @@ class AtomicAbstractValue(object):
     self.name = name
     self.module = None
     self.official_name = None
+    # (MonitorDict.global_changestamp, digest) of the last get_fullhash().
+    self._fullhash = None
 
   @property
   def full_name(self):
@@ -201,7 +265,12 @@ class AtomicAbstractValue(object):
 
   def get_fullhash(self):
     """Hash this value and all of its children."""
-    m = hashlib.md5()
+    # The hash only depends on the contents of the children maps, so it stays
+    # valid until any of them changes.
+    changestamp = utils.MonitorDict.global_changestamp
+    if self._fullhash and self._fullhash[0] == changestamp:
+      return self._fullhash[1]
+    parts = []
     seen_ids = set()
     stack = [self]
     while stack:
@@ -210,11 +279,13 @@ class AtomicAbstractValue(object):
       if data_id in seen_ids:
         continue
       seen_ids.add(data_id)
-      m.update(str(data_id))
+      parts.append(data_id)
       for mapping in data.get_children_maps():
-        m.update(str(mapping.changestamp))
+        parts.append(-mapping.changestamp)
         stack.extend(mapping.data)
-    return m.digest()
+    digest = hashlib.md5(repr(parts)).digest()
+    self._fullhash = (changestamp, digest)
+    return digest
 
   def get_children_maps(self):
     """Get this value's dictionaries of children.
@@ -1304,6 +1375,30 @@ class PyTDSignature(object):
     self._bound_sig_cache = {}
     self.signature = function.Signature.from_pytd(vm, name, pytd_sig)
 
+  def accepts_shape(self, num_posargs, keywords, has_star):
+    """Whether this signature can be called with arguments of this shape.
+
+    This does the checks of call_with_view that don't look at the values of
+    the arguments.
+
+    Args:
+      num_posargs: The number of positional arguments.
+      keywords: A set of the names of the keyword arguments.
+      has_star: Whether there are *args or **kwargs.
+    Returns:
+      False if calling this signature would certainly fail, True otherwise.
+    """
+    params = self.pytd_sig.params
+    passed = set(self.signature.param_names[:num_posargs]) | keywords
+    if not has_star and any(p.name not in passed for p in params):
+      return False
+    if not self.pytd_sig.has_optional:
+      if num_posargs > len(params):
+        return False
+      if keywords - {p.name for p in params}:
+        return False
+    return True
+
   # pylint: disable=unused-argument
   def call_with_view(self, node, func, view, posargs, namedargs, ret_map,
                      starargs=None, starstarargs=None,
@@ -1527,6 +1622,10 @@ class PyTDFunction(Function):
     self.bound_class = BoundPyTDFunction
     self.signatures = signatures
     self._signature_cache = {}
+    # Maps the shape of the arguments of a call, and optionally the class of
+    # the argument that distinguishes the signatures, to the signatures that
+    # might match. See _candidate_signatures.
+    self._dispatch_index = {}
     self._return_types = {sig.pytd_sig.return_type for sig in signatures}
     self._has_mutable = any(isinstance(param, pytd.MutableParameter)
                             for sig in signatures
@@ -1683,7 +1782,13 @@ class PyTDFunction(Function):
     # with the last signature only being used if none of the others match.
 
     error = None
-    for sig in self.signatures:
+    candidates = self._candidate_signatures(view, posargs, namedargs,
+                                            starargs, starstarargs)
+    if candidates[-1:] != self.signatures[-1:]:
+      # To report the same error as if we had tried all signatures, also try
+      # the last one. It fails, but only after all the candidates did.
+      candidates = candidates + self.signatures[-1:]
+    for sig in candidates:
       try:
         new_node, result, mutations = sig.call_with_view(
             node, func, view, posargs, namedargs, ret_map,
@@ -1694,6 +1799,80 @@ class PyTDFunction(Function):
         return new_node, result, mutations
     raise error  # pylint: disable=raising-bad-type
 
+  def _candidate_signatures(self, view, posargs, namedargs,
+                            starargs, starstarargs):
+    """Get the signatures that might match a call, in their original order.
+
+    Signatures are left out if they can't take the number and names of the
+    arguments, or if the argument at the first position where the signatures
+    have different parameter types is an instance of a class that doesn't
+    match the parameter type of the signature.
+
+    Args:
+      view: A mapping of Variable to Value.
+      posargs: The positional arguments, a list of Variables.
+      namedargs: The keyword arguments, a dict of str to Variable.
+      starargs: The *args Variable, or None.
+      starstarargs: The **kwargs Variable, or None.
+    Returns:
+      A list of PyTDSignature instances.
+    """
+    shape = (len(posargs), frozenset(namedargs),
+             starargs is not None or starstarargs is not None)
+    if shape not in self._dispatch_index:
+      candidates = [sig for sig in self.signatures if sig.accepts_shape(*shape)]
+      self._dispatch_index[shape] = (
+          candidates, self._get_dispatch_position(candidates, len(posargs)))
+    candidates, position = self._dispatch_index[shape]
+    if position is None:
+      return candidates
+    cls = self._get_dispatch_class(view[posargs[position]].data)
+    if cls is None:
+      return candidates
+    key = (shape, cls)
+    if key not in self._dispatch_index:
+      self._dispatch_index[key] = [
+          sig for sig in candidates
+          if not self._is_class_mismatch(sig, position, cls)]
+    return self._dispatch_index[key]
+
+  def _get_dispatch_position(self, signatures, num_posargs):
+    """Get the first positional argument that not all signatures agree on."""
+    for i in range(num_posargs):
+      annotations = {self._get_annotation(sig, i) for sig in signatures}
+      if len(annotations) > 1:
+        return i
+    return None
+
+  def _get_annotation(self, sig, position):
+    if position < len(sig.signature.param_names):
+      return sig.signature.annotations[sig.signature.param_names[position]]
+    else:
+      return None
+
+  def _get_dispatch_class(self, data):
+    """The class of data, if matching data against classes only uses the MRO.
+
+    Args:
+      data: An AtomicAbstractValue.
+    Returns:
+      A PyTDClass, or None if data isn't an instance of a single PyTDClass,
+      or if its MRO contains anything but PyTDClass instances.
+    """
+    cls = _get_instance_class(data)
+    if not isinstance(cls, PyTDClass):
+      return None
+    if not all(isinstance(base, PyTDClass) for base in cls.mro):
+      return None
+    return cls
+
+  def _is_class_mismatch(self, sig, position, cls):
+    """Whether an instance of cls can't match the given parameter of sig."""
+    annotation = self._get_annotation(sig, position)
+    # An instance of a class with an MRO consisting of PyTDClasses only matches
+    # a PyTDClass by identity. See PyTDClass._match_instance.
+    return isinstance(annotation, PyTDClass) and annotation not in cls.mro
+
   def to_pytd_def(self, _):
     return pytd.NamedType("__builtin__.function")
 
@@ -1704,6 +1883,11 @@ class PyTDFunction(Function):
 class Class(object):
   """Mix-in to mark all class-like values."""
 
+  # Incremented whenever an attribute is set on any class. This invalidates
+  # the caches of lookup_from_mro, since a new attribute on a base class can
+  # shadow attributes further down the MRO of its subclasses.
+  attributes_changestamp = 0
+
   def __new__(cls, *args, **kwds):
     """Prevent direct instantiation."""
     assert cls is not Class, "Cannot instantiate Class"
@@ -1711,7 +1895,10 @@ class Class(object):
 
   def init_mixin(self):
     """Mix-in equivalent of __init__."""
-    pass
+    # Maps attribute names to the position in the MRO of the first base class
+    # that might have them. All bases before it certainly don't.
+    self._mro_positions = {}
+    self._mro_positions_changestamp = Class.attributes_changestamp
 
   def get_attribute_computed(self, node, name, valself, valcls, condition):
     """Call __getattr__ (if defined) to compute an attribute."""
@@ -1738,7 +1925,7 @@ class Class(object):
       variablecls = valcls.AssignToNewVariable(valcls.variable.name, node)
       add_origins.append(valcls)
 
-    for base in self.mro:
+    for base in itertools.islice(self.mro, self._get_mro_position(name), None):
       # Potentially skip start of MRO, for super()
       if base is skip:
         continue
@@ -1753,6 +1940,23 @@ class Class(object):
       break  # we found a class which has this attribute
     return ret
 
+  def _get_mro_position(self, name):
+    """Get the position in the MRO at which to start looking for name."""
+    if self._mro_positions_changestamp != Class.attributes_changestamp:
+      self._mro_positions = {}
+      self._mro_positions_changestamp = Class.attributes_changestamp
+    if name in self._mro_positions:
+      _mro_cache_metric.inc("hit")
+      return self._mro_positions[name]
+    _mro_cache_metric.inc("miss")
+    position = 0
+    for base in self.mro:
+      if not _lacks_attribute_flat(base, name):
+        break
+      position += 1
+    self._mro_positions[name] = position
+    return position
+
   def get_attribute(self, node, name, valself=None, valcls=None,
                     condition=None):
     """Retrieve an attribute by looking at the MRO of this class."""
@@ -1765,6 +1969,28 @@ class Class(object):
     return pytd.Class(name, (), (), (), ())
 
 
+def _lacks_attribute_flat(cls, name):
+  """Whether get_attribute_flat on an MRO entry never finds this attribute.
+
+  This stays true until an attribute is set on a class.
+
+  Args:
+    cls: An entry of an MRO.
+    name: The name of an attribute.
+  Returns:
+    True if the class certainly doesn't have the attribute, False if it might.
+  """
+  if isinstance(cls, ParameterizedClass):
+    return True
+  elif isinstance(cls, (PyTDClass, InterpreterClass)):
+    # See SimpleAbstractValue.get_attribute.
+    # pylint: disable=protected-access
+    return (cls.cls is None and name not in cls.members and
+            not (cls.is_lazy and name in cls._member_map))
+  else:
+    return False
+
+
 class ParameterizedClass(AtomicAbstractValue, Class, FormalType):
   """A class that contains additional parameters. E.g. a container.
 
@@ -1873,6 +2099,10 @@ class PyTDClass(SimpleAbstractValue, Class):
     # get_attribute_flat ?
     return SimpleAbstractValue.get_attribute(self, node, name)
 
+  def set_attribute(self, node, name, value):
+    Class.attributes_changestamp += 1
+    return super(PyTDClass, self).set_attribute(node, name, value)
+
   def bases(self):
     return [self.vm.convert_constant_to_value(pytd.Print(parent), parent)
             for parent in self.pytd_cls.parents]
@@ -2051,6 +2281,7 @@ class InterpreterClass(SimpleAbstractValue, Class):
     # with this name, Python will still set the (possibly new) attribute
     # on this class, thus shadowing the one on the superclass. Hence MRO doesn't
     # come into play.
+    Class.attributes_changestamp += 1
     return super(InterpreterClass, self).set_attribute(node, name, value)
 
   def _new_instance(self, node, value):
@@ -2206,8 +2437,6 @@ class InterpreterFunction(Function):
     vm: TypegraphVirtualMachine instance.
   """
 
-  _function_cache = {}
-
   @staticmethod
   def make_function(name, code, f_locals, f_globals, defaults, closure,
                     annotations, vm):
@@ -2241,10 +2470,10 @@ class InterpreterFunction(Function):
                  for key, value in annotations.items()}, None),
                (dict(enumerate(defaults)), None),
                (dict(enumerate(closure or ())), None)))
-    if key not in InterpreterFunction._function_cache:
-      InterpreterFunction._function_cache[key] = InterpreterFunction(
+    if key not in vm.function_cache:
+      vm.function_cache[key] = InterpreterFunction(
           name, code, f_locals, f_globals, defaults, closure, annotations, vm)
-    return InterpreterFunction._function_cache[key]
+    return vm.function_cache[key]
 
   def __init__(self, name, code, f_locals, f_globals, defaults, closure,
                annotations, vm):
@@ -2464,16 +2693,20 @@ class InterpreterFunction(Function):
   def _get_call_combinations(self):
     signature_data = set()
     for callargs, ret, node_after_call in self._call_records.values():
-      for combination in utils.variable_product_dict(callargs):
-        for return_value in ret.bindings:
-          values = combination.values() + [return_value]
-          data = tuple(v.data for v in values)
-          if data in signature_data:
-            # This combination yields a signature we already know is possible
-            continue
-          if node_after_call.HasCombination(values):
-            signature_data.add(data)
-            yield combination, return_value
+      # A fixed order of the arguments lets the combinations share prefixes.
+      names = sorted(callargs)
+      def candidates(callargs=callargs, ret=ret, names=names):
+        for combination in utils.variable_product_dict(callargs):
+          for return_value in ret.bindings:
+            values = [combination[name] for name in names] + [return_value]
+            # Skip combinations that yield a signature we already know is
+            # possible.
+            if tuple(v.data for v in values) not in signature_data:
+              yield values
+      for values in node_after_call.FilterCombinations(candidates()):
+        # candidates() runs lazily, so it sees the data we add here.
+        signature_data.add(tuple(v.data for v in values))
+        yield dict(zip(names, values)), values[-1]
 
   def _fix_param_name(self, name):
     """Sanitize a parameter name; remove Python intrinstics."""
@@ -2698,6 +2931,8 @@ class Module(Instance):
 
   def _convert_member(self, name, ty):
     """Called to convert the items in _member_map to cfg.Variable."""
+    # The loader fills in the class pointers of module members on demand.
+    self.vm.loader.finish_member(ty)
     var = self.vm.convert_constant(name, ty)
     for value in var.data:
       # Only do this if this class isn't already part of a module.
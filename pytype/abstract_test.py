@@ -6,6 +6,7 @@ import unittest
 from pytype import abstract
 from pytype import config
 from pytype import errors
+from pytype import metrics
 from pytype import vm
 from pytype.pytd import cfg
 
@@ -82,6 +83,192 @@ class InstanceTest(AbstractTestBase):
     self.assertIs(True, i.compatible_with(False))
 
 
+class FullHashTest(AbstractTestBase):
+
+  def test_unchanged(self):
+    i = abstract.Instance(self._vm.list_type, self._vm)
+    i.init_type_parameters("T")
+    self.assertEqual(i.get_fullhash(), i.get_fullhash())
+
+  def test_set_member(self):
+    i = abstract.Instance(self._vm.object_type, self._vm)
+    fullhash = i.get_fullhash()
+    i.members["x"] = self.new_var("x", abstract.Unknown(self._vm))
+    self.assertNotEqual(fullhash, i.get_fullhash())
+
+  def test_add_binding_to_child(self):
+    i = abstract.Instance(self._vm.list_type, self._vm)
+    i.init_type_parameters("T")
+    fullhash = i.get_fullhash()
+    i.merge_type_parameter(self._node, "T", self._vm.object_type)
+    self.assertNotEqual(fullhash, i.get_fullhash())
+
+  def test_change_grandchild(self):
+    outer = abstract.Instance(self._vm.object_type, self._vm)
+    inner = abstract.Instance(self._vm.object_type, self._vm)
+    outer.members["x"] = self.new_var("x", inner)
+    fullhash = outer.get_fullhash()
+    inner.members["y"] = self.new_var("y", abstract.Unknown(self._vm))
+    self.assertNotEqual(fullhash, outer.get_fullhash())
+
+  def test_reinit_type_parameters(self):
+    i = abstract.Instance(self._vm.list_type, self._vm)
+    i.init_type_parameters("T")
+    i.merge_type_parameter(self._node, "T", self._vm.object_type)
+    fullhash = i.get_fullhash()
+    i.init_type_parameters("T")
+    self.assertNotEqual(fullhash, i.get_fullhash())
+
+
+class PyTDFunctionTest(AbstractTestBase):
+
+  def setUp(self):
+    super(PyTDFunctionTest, self).setUp()
+    self._int = self._vm.primitive_class_instances[int]
+    self._str = self._vm.primitive_class_instances[str]
+    self._float = self._vm.primitive_class_instances[float]
+    int_cls = self._vm.loader.builtins.Lookup("__builtin__.int")
+    self._add = self._vm.convert_constant_to_value(
+        "__add__", int_cls.Lookup("__add__"))
+    self._init = self._vm.convert_constant_to_value(
+        "__init__", int_cls.Lookup("__init__"))
+
+  def candidates(self, f, *posargs, **namedargs):
+    posargs = [self.new_var("arg", value) for value in posargs]
+    namedargs = {name: self.new_var(name, value)
+                 for name, value in namedargs.items()}
+    view = {var: var.bindings[0]
+            for var in posargs + namedargs.values()}
+    # pylint: disable=protected-access
+    return [f.signatures.index(sig)
+            for sig in f._candidate_signatures(view, posargs, namedargs,
+                                               None, None)]
+
+  def test_dispatch_on_class(self):
+    self.assertEqual([0], self.candidates(self._add, self._int, self._int))
+    self.assertEqual([1], self.candidates(self._add, self._int, self._float))
+    self.assertEqual([], self.candidates(self._add, self._int, self._str))
+
+  def test_dispatch_on_unknown(self):
+    self.assertEqual([0, 1, 2, 3],
+                     self.candidates(self._add, self._int,
+                                     abstract.Unknown(self._vm)))
+
+  def test_dispatch_on_shape(self):
+    self.assertEqual([1], self.candidates(self._init, self._int))
+    self.assertEqual([0], self.candidates(self._init, self._int, self._str))
+    self.assertEqual([0], self.candidates(self._init, self._int, x=self._int))
+    self.assertEqual([], self.candidates(self._add, self._int))
+    self.assertEqual([], self.candidates(self._add, self._int, z=self._int))
+
+  def test_find_matching_signature(self):
+    posargs = [self.new_var("self", self._int), self.new_var("y", self._float)]
+    view = {var: var.bindings[0] for var in posargs}
+    _, result, _ = self._add.find_matching_signature(
+        self._node, None, view, posargs, {}, {}, None, None)
+    self.assertEqual([self._vm.primitive_classes[float]],
+                     [value.cls for value in result.data])
+
+  def test_error_from_last_signature(self):
+    posargs = [self.new_var("self", self._int), self.new_var("y", self._str)]
+    view = {var: var.bindings[0] for var in posargs}
+    with self.assertRaises(abstract.WrongArgTypes) as ctx:
+      self._add.find_matching_signature(
+          self._node, None, view, posargs, {}, {}, None, None)
+    self.assertIs(self._add.signatures[-1].signature, ctx.exception.sig)
+
+
+class MatchCacheTest(AbstractTestBase):
+
+  def setUp(self):
+    super(MatchCacheTest, self).setUp()
+    metrics._prepare_for_test()
+    abstract._match_cache_metric._reset()  # pylint: disable=protected-access
+    self._int = self._vm.primitive_class_instances[int]
+    self._int_class = abstract.get_atomic_value(
+        self._vm.primitive_classes[int])
+    self._str_class = abstract.get_atomic_value(
+        self._vm.primitive_classes[str])
+    self._obj_class = abstract.get_atomic_value(
+        self._vm.primitive_classes[object])
+
+  def match(self, value, other_type):
+    binding = self.new_var("x", value).bindings[0]
+    subst = {}
+    result = abstract.match_value_against_type(
+        binding, other_type, subst, self._node, {})
+    if result is not None:
+      self.assertIs(subst, result)
+    return result is not None
+
+  def test_pytd_class(self):
+    for _ in range(2):
+      self.assertTrue(self.match(self._int, self._int_class))
+      self.assertTrue(self.match(self._int, self._obj_class))
+      self.assertFalse(self.match(self._int, self._str_class))
+    # pylint: disable=protected-access
+    self.assertEqual({"miss": 3, "hit": 3},
+                     abstract._match_cache_metric._counts)
+
+  def test_interpreter_class(self):
+    cls = abstract.InterpreterClass(
+        "X", [self._vm.primitive_classes[int]], {}, self._vm)
+    instance = abstract.Instance(cls.to_variable(self._node, "X"), self._vm)
+    self.assertTrue(self.match(instance, self._int_class))
+    self.assertTrue(self.match(instance, cls))
+    self.assertFalse(self.match(instance, self._str_class))
+    cls.set_attribute(self._node, "y", self.new_var("y", self._int))
+    self.assertTrue(self.match(instance, self._int_class))
+    self.assertTrue(self.match(instance, cls))
+    self.assertFalse(self.match(instance, self._str_class))
+    # pylint: disable=protected-access
+    self.assertEqual({"miss": 3, "hit": 3},
+                     abstract._match_cache_metric._counts)
+
+  def test_unknown(self):
+    self.assertTrue(self.match(abstract.Unknown(self._vm), self._str_class))
+    # pylint: disable=protected-access
+    self.assertEqual({"uncached": 1}, abstract._match_cache_metric._counts)
+
+
+class LookupFromMroTest(AbstractTestBase):
+
+  def setUp(self):
+    super(LookupFromMroTest, self).setUp()
+    self._int = self._vm.primitive_class_instances[int]
+    self._str = self._vm.primitive_class_instances[str]
+    self._base = abstract.InterpreterClass(
+        "Base", [self._vm.object_type], {"x": self.new_var("x", self._int)},
+        self._vm)
+    self._mid = abstract.InterpreterClass(
+        "Mid", [self._base.to_variable(self._node, "Base")], {}, self._vm)
+    self._derived = abstract.InterpreterClass(
+        "Derived", [self._mid.to_variable(self._node, "Mid")], {}, self._vm)
+
+  def lookup(self, cls, name):
+    return cls.lookup_from_mro(self._node, name, None, None).data
+
+  def test_lookup(self):
+    for _ in range(2):
+      self.assertEqual([self._int], self.lookup(self._derived, "x"))
+      self.assertEqual([], self.lookup(self._derived, "y"))
+
+  def test_set_attribute_on_base(self):
+    self.assertEqual([self._int], self.lookup(self._derived, "x"))
+    self.assertEqual([], self.lookup(self._derived, "y"))
+    self._mid.set_attribute(self._node, "x", self.new_var("x", self._str))
+    self._mid.set_attribute(self._node, "y", self.new_var("y", self._str))
+    self.assertEqual([self._str], self.lookup(self._derived, "x"))
+    self.assertEqual([self._str], self.lookup(self._derived, "y"))
+    self.assertEqual([self._int], self.lookup(self._base, "x"))
+
+  def test_skip(self):
+    self.lookup(self._derived, "x")
+    var = self._derived.lookup_from_mro(self._node, "x", None, None,
+                                        skip=self._base)
+    self.assertEqual([], var.data)
+
+
 class DictTest(AbstractTestBase):
 
   def setUp(self):
@@ -0,0 +1,158 @@
+"""Client for the pytype analysis server (see server.py).
+
+Client and server exchange JSON objects, each sent as a four byte big-endian
+length followed by the UTF-8 encoded JSON text. A request has the fields
+"argv" (the pytype command line), "cwd" (the directory pytype was started in)
+and "env" (the environment variables that influence pytype, see environment()).
+The response has the fields "exit_code", "stdout" and "stderr", or, if the
+server can't run the request the same way the client would, the field
+"fallback" with the reason.
+
+The socket lives in a directory that only the user can access, and the client
+only talks to servers run by the same user, so nobody else can see the
+requests or forge the responses.
+
+scripts/pytype imports this module before it knows whether it needs to run
+pytype in-process, so this mustn't import any of the analysis modules (only
+pytype.utils).
+"""
+
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+
+from pytype import utils
+
+
+# Environment variable to override the socket path with. Setting it to the
+# empty string disables the server.
+SOCKET_ENV_VAR = "PYTYPE_SERVER_SOCKET"
+
+# Environment variables that change what pytype does (where typeshed is, which
+# interpreter compiles the source, and how it imports modules).
+_ENVIRONMENT_VARIABLES = ("PATH", "PYTHONHOME", "PYTHONPATH", "TYPESHED_HOME")
+
+_HEADER = struct.Struct(">I")
+
+# Python 2 doesn't define SO_PEERCRED. This is its value on Linux. The
+# corresponding option value is a struct ucred: pid, uid, gid.
+_SO_PEERCRED = getattr(socket, "SO_PEERCRED",
+                       17 if sys.platform.startswith("linux") else None)
+_UCRED = struct.Struct("3i")
+
+
+def default_socket_path():
+  """Return the path of the socket the server is listening on."""
+  path = os.environ.get(SOCKET_ENV_VAR)
+  if path is None:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+      directory = os.path.join(runtime_dir, "pytype")
+    else:
+      directory = os.path.join(tempfile.gettempdir(),
+                               "pytype-%d" % os.getuid())
+    path = os.path.join(directory, "server.sock")
+  return path
+
+
+def environment():
+  """Return the environment variables a server has to agree with us on."""
+  return {name: os.environ.get(name) for name in _ENVIRONMENT_VARIABLES}
+
+
+def send_message(sock, message):
+  """Send a JSON-serializable object over a socket."""
+  data = json.dumps(message)
+  sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+  chunks = []
+  while size:
+    chunk = sock.recv(min(size, 1 << 16))
+    if not chunk:
+      raise EOFError("Connection closed by peer")
+    chunks.append(chunk)
+    size -= len(chunk)
+  return "".join(chunks)
+
+
+def recv_message(sock):
+  """Receive an object sent with send_message.
+
+  Args:
+    sock: A connected socket.
+
+  Returns:
+    The decoded JSON object. Strings are unicode.
+
+  Raises:
+    EOFError: If the connection was closed before the whole message arrived.
+    ValueError: If the message isn't valid JSON.
+  """
+  size, = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+  return json.loads(_recv_exactly(sock, size))
+
+
+def connect(socket_path):
+  """Connect to the server.
+
+  Args:
+    socket_path: The socket of the server.
+
+  Returns:
+    A connected socket, or None if no server run by the current user is
+    listening.
+  """
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(socket_path)
+    if _SO_PEERCRED is not None:
+      _, uid, _ = _UCRED.unpack(
+          sock.getsockopt(socket.SOL_SOCKET, _SO_PEERCRED, _UCRED.size))
+      if uid != os.getuid():
+        sock.close()
+        return None
+  except socket.error:
+    sock.close()
+    return None
+  return sock
+
+
+def run(argv, socket_path=None):
+  """Run pytype in the server, if one is running.
+
+  Args:
+    argv: The pytype command line, including the program name.
+    socket_path: The socket of the server. Defaults to default_socket_path().
+
+  Returns:
+    The exit code, or None if pytype couldn't be run in a server. In the latter
+    case, the caller should run pytype in-process.
+  """
+  if socket_path is None:
+    socket_path = default_socket_path()
+  if not socket_path or utils.private_directory_error(
+      os.path.dirname(os.path.abspath(socket_path))):
+    return None
+  sock = connect(socket_path)
+  if sock is None:
+    return None
+  try:
+    send_message(sock, {"argv": argv, "cwd": os.getcwd(),
+                        "env": environment()})
+    response = recv_message(sock)
+  except (EOFError, ValueError, socket.error):
+    # The server died while processing our request. Running the request again
+    # is harmless: pytype only ever (over)writes its outputs.
+    return None
+  finally:
+    sock.close()
+  if "fallback" in response:
+    return None
+  sys.stdout.write(response["stdout"].encode("utf-8"))
+  sys.stderr.write(response["stderr"].encode("utf-8"))
+  return response["exit_code"]
@@ -40,10 +40,13 @@ class Options(object):
       pythonpath
     The following are "inherited" from the command-line options as-is:
       api
+      cache_dir
+      cache_max_size
       cache_unknowns
       check
       disable
       imports_info
+      jobs
       nofail
       optimize
       output
@@ -120,6 +123,18 @@ class Options(object):
               "The default resolves to pytd/builtins/__builtin__.py. "
               "Note that this does not affect the PyTD for builtins, which "
               "is always in pytd/builtins/__builtin__.pytd."))
+    o.add_option(
+        "--cache-dir", type="string", action="store",
+        dest="cache_dir", default=None,
+        help=("Directory for caching analysis results across runs. A file "
+              "is only analyzed again if it, the pyi files it imports, or "
+              "the options changed. The directory is created with mode 0700, "
+              "and ignored if other users can access it."))
+    o.add_option(
+        "--cache-max-size", type="int", action="store",
+        dest="cache_max_size", default=1024,
+        help=("Size, in MB, that each kind of data in --cache-dir may take "
+              "up before the least recently used entries are evicted."))
     o.add_option(
         "-c", "--check", action="store_true",
         dest="check",
@@ -145,6 +160,12 @@ class Options(object):
         help=("TODO(pludemann): document this. "
               "Information for mapping import .pytd to files. "
               "This options is incompatible with --import_drop_prefixes."))
+    o.add_option(
+        "-j", "--jobs", type="int", action="store",
+        dest="jobs", default=1,
+        help=("Number of worker processes for analyzing independent input "
+              "files in parallel. Only useful if more than one input file "
+              "is given."))
     o.add_option(
         "-K", "--keep-unknowns", action="store_false",
         dest="solve_unknowns", default=True,
@@ -174,6 +195,11 @@ class Options(object):
         "--no-skip-calls", action="store_false",
         dest="skip_repeat_calls", default=True,
         help=("Don't reuse the results of previous function calls."))
+    o.add_option(
+        "--no-verify-pyi", action="store_false",
+        dest="verify_pyi", default=True,
+        help=("Don't check that the .pyi files pytype loads are fully "
+              "resolved. Faster, for production use."))
 # MOE:strip_line TODO(pludemann): remove when Bazel integration is done:
     o.add_option(
         "--nofail", action="store_true",
@@ -322,6 +348,14 @@ class Options(object):
         raise optparse.OptionConflictError(
             "Not allowed with --pythonpath", "imports_info")
 
+    if self.cache_max_size < 1:
+      raise optparse.OptionValueError(
+          "--cache-max-size must be at least 1: %d" % self.cache_max_size)
+
+    if self.jobs < 1:
+      raise optparse.OptionValueError("--jobs must be at least 1: %d" %
+                                      self.jobs)
+
     if self.disable:
       self.disable = self.disable.split(",")
     else:
@@ -0,0 +1,192 @@
+"""A size-capped on-disk cache, with least-recently-used eviction.
+
+Entries are stored as one file each, under the sha1 of their key. Writes go to
+a temporary file that is then renamed into place, so several processes (e.g.
+parallel builds) can use the same cache directory concurrently, and readers
+never see partially written entries. Reading an entry updates its
+modification time, which is what eviction uses to find the least recently used
+entries.
+
+A cache directory belongs to a single user: we create it, and everything in
+it, accessible only to its owner. Entries are trusted when read back (the pyi
+cache stores pickles), so sharing a cache directory with other users would let
+them run code as whoever reads it. get_cache hence refuses to use a directory
+that isn't private to the current user.
+
+Failing to write to the cache is logged, but never fatal.
+"""
+
+import errno
+import hashlib
+import logging
+import os
+import tempfile
+
+from pytype import utils
+
+
+log = logging.getLogger(__name__)
+
+
+# Map from (directory, max size) to DiskCache, or None if we can't use the
+# directory. A DiskCache only scans its directory once, so we keep using the
+# same instance.
+_caches = {}
+
+
+def get_cache(options, name):
+  """Return the cache for one kind of data.
+
+  Args:
+    options: config.Options object.
+    name: The kind of data. Used as subdirectory of options.cache_dir.
+
+  Returns:
+    A DiskCache, or None if the options don't enable caching, or the cache
+    directory is accessible by other users.
+  """
+  if not options.cache_dir:
+    return None
+  key = (os.path.join(options.cache_dir, name), options.cache_max_size << 20)
+  if key not in _caches:
+    error = _prepare_directory(options.cache_dir)
+    if error:
+      log.warning("Not using --cache-dir: %s", error)
+      _caches[key] = None
+    else:
+      _caches[key] = DiskCache(*key)
+  return _caches[key]
+
+
+def _prepare_directory(directory):
+  """Create the cache directory if needed, and check that it's private.
+
+  Args:
+    directory: A path.
+
+  Returns:
+    None if the directory is ready for use, an error message otherwise.
+  """
+  try:
+    os.makedirs(directory, 0o700)
+  except OSError as e:
+    if e.errno != errno.EEXIST:
+      return str(e)
+  return utils.private_directory_error(directory)
+
+
+class DiskCache(object):
+  """A cache that maps strings to strings, stored in a directory.
+
+  Attributes:
+    directory: Where the entries are stored.
+    max_size: The total size, in bytes, that the entries may take up.
+  """
+
+  # When the cache grows beyond max_size, evict entries until it's down to
+  # this fraction of max_size. That way, we don't need to rescan the directory
+  # on every write of a full cache.
+  LOW_WATER_MARK = 0.75
+
+  def __init__(self, directory, max_size):
+    self.directory = directory
+    self.max_size = max_size
+    # An estimate of the total size of all entries. None until the first write
+    # scans the directory.
+    self._size = None
+
+  def _path(self, key):
+    digest = hashlib.sha1(key).hexdigest()
+    return os.path.join(self.directory, digest[:2], digest[2:])
+
+  def get(self, key):
+    """Look up an entry.
+
+    Args:
+      key: A str.
+
+    Returns:
+      The str stored under this key, or None.
+    """
+    path = self._path(key)
+    try:
+      with open(path, "rb") as fi:
+        data = fi.read()
+    except IOError:
+      return None
+    try:
+      os.utime(path, None)  # Mark as recently used.
+    except OSError:
+      pass  # Evicted by someone else in the meantime.
+    return data
+
+  def put(self, key, data):
+    """Store an entry, evicting old entries if the cache is full.
+
+    Args:
+      key: A str.
+      data: A str.
+    """
+    path = self._path(key)
+    try:
+      old_size = os.stat(path).st_size
+    except OSError:
+      old_size = 0  # Not in the cache yet.
+    try:
+      self._write(path, data)
+    except (IOError, OSError) as e:
+      log.warning("Couldn't write cache entry %s: %s", path, e)
+      return
+    if self._size is None:
+      self._size = sum(size for _, size, _ in self._scan())
+    else:
+      self._size += len(data) - old_size
+    if self._size > self.max_size:
+      self._evict()
+
+  def _write(self, path, data):
+    dirname = os.path.dirname(path)
+    try:
+      os.makedirs(dirname, 0o700)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".tmp")
+    try:
+      with os.fdopen(fd, "wb") as fi:
+        fi.write(data)
+      os.rename(tmp_path, path)
+    except:
+      os.unlink(tmp_path)
+      raise
+
+  def _scan(self):
+    """Return (mtime, size, path) for every file in the cache."""
+    entries = []
+    for dirpath, _, filenames in os.walk(self.directory):
+      for filename in filenames:
+        path = os.path.join(dirpath, filename)
+        try:
+          st = os.stat(path)
+        except OSError:
+          continue  # Deleted concurrently.
+        entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+  def _evict(self):
+    """Remove the least recently used entries, until we're below the mark."""
+    entries = sorted(self._scan())
+    size = sum(size for _, size, _ in entries)
+    target = int(self.max_size * self.LOW_WATER_MARK)
+    removed = 0
+    for _, entry_size, path in entries:
+      if size <= target:
+        break
+      try:
+        os.unlink(path)
+      except OSError:
+        pass  # Removed concurrently, which is just as good.
+      size -= entry_size
+      removed += 1
+    log.info("Evicted %d entries from %s", removed, self.directory)
+    self._size = size
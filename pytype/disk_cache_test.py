@@ -0,0 +1,109 @@
+"""Tests for disk_cache.py."""
+
+import os
+import time
+
+from pytype import config
+from pytype import disk_cache
+from pytype import utils
+
+import unittest
+
+
+class DiskCacheTest(unittest.TestCase):
+  """Tests for disk_cache.DiskCache."""
+
+  def _set_mtime(self, cache, key, mtime):
+    path = cache._path(key)
+    os.utime(path, (mtime, mtime))
+
+  def testGetPut(self):
+    with utils.Tempdir() as d:
+      cache = disk_cache.DiskCache(d.path, 1000)
+      self.assertIsNone(cache.get("foo"))
+      cache.put("foo", "bar")
+      cache.put("", "\x00\xff")
+      self.assertEquals("bar", cache.get("foo"))
+      self.assertEquals("\x00\xff", cache.get(""))
+      cache.put("foo", "baz")
+      self.assertEquals("baz", cache.get("foo"))
+
+  def testOverwrite(self):
+    with utils.Tempdir() as d:
+      cache = disk_cache.DiskCache(d.path, 25)
+      cache.put("foo", "x" * 10)
+      cache.put("bar", "x" * 10)
+      # Replacing an entry doesn't grow the cache, so nothing is evicted.
+      cache.put("foo", "y" * 10)
+      self.assertEquals("y" * 10, cache.get("foo"))
+      self.assertEquals("x" * 10, cache.get("bar"))
+
+  def testPrivate(self):
+    with utils.Tempdir() as d:
+      directory = os.path.join(d.path, "cache")
+      disk_cache.DiskCache(directory, 1000).put("foo", "bar")
+      for dirpath, _, filenames in os.walk(directory):
+        for path in [dirpath] + [os.path.join(dirpath, f) for f in filenames]:
+          self.assertEquals(0, os.stat(path).st_mode & 0o077, path)
+
+  def testSharedDirectory(self):
+    with utils.Tempdir() as d:
+      disk_cache.DiskCache(d.path, 1000).put("foo", "bar")
+      self.assertEquals("bar", disk_cache.DiskCache(d.path, 1000).get("foo"))
+
+  def testNoTemporaryFiles(self):
+    with utils.Tempdir() as d:
+      cache = disk_cache.DiskCache(d.path, 1000)
+      cache.put("foo", "bar")
+      filenames = [f for _, _, files in os.walk(d.path) for f in files]
+      self.assertEquals(1, len(filenames))
+      self.assertFalse(filenames[0].startswith(".tmp"))
+
+  def testEvictLeastRecentlyUsed(self):
+    with utils.Tempdir() as d:
+      cache = disk_cache.DiskCache(d.path, 40)
+      now = time.time()
+      for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, "x" * 10)
+        self._set_mtime(cache, key, now - 100 + i)
+      # Reading "a" makes "b" the least recently used entry.
+      self.assertIsNotNone(cache.get("a"))
+      cache.put("d", "x" * 10)
+      cache.put("e", "x" * 10)
+      self.assertIsNone(cache.get("b"))
+      self.assertIsNone(cache.get("c"))
+      self.assertEquals("x" * 10, cache.get("a"))
+      self.assertEquals("x" * 10, cache.get("e"))
+
+  def testGetCache(self):
+    options = config.Options.create()
+    self.assertIsNone(disk_cache.get_cache(options, "foo"))
+    with utils.Tempdir() as d:
+      cache_dir = os.path.join(d.path, "cache")
+      options.tweak(cache_dir=cache_dir, cache_max_size=2)
+      cache = disk_cache.get_cache(options, "foo")
+      self.assertEquals(os.path.join(cache_dir, "foo"), cache.directory)
+      self.assertEquals(2 << 20, cache.max_size)
+      self.assertIs(cache, disk_cache.get_cache(options, "foo"))
+      self.assertIsNot(cache, disk_cache.get_cache(options, "bar"))
+      self.assertEquals(0o700, os.stat(cache_dir).st_mode & 0o777)
+
+  def testGetCacheInsecureDirectory(self):
+    with utils.Tempdir() as d:
+      cache_dir = os.path.join(d.path, "cache")
+      os.mkdir(cache_dir)
+      os.chmod(cache_dir, 0o777)
+      options = config.Options.create()
+      options.tweak(cache_dir=cache_dir)
+      self.assertIsNone(disk_cache.get_cache(options, "foo"))
+
+  def testUnwritableDirectory(self):
+    with utils.Tempdir() as d:
+      path = d.create_file("file")
+      cache = disk_cache.DiskCache(path, 1000)
+      cache.put("foo", "bar")  # Doesn't raise.
+      self.assertIsNone(cache.get("foo"))
+
+
+if __name__ == "__main__":
+  unittest.main()
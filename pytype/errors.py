@@ -171,6 +171,33 @@ class ErrorLogBase(object):
     assert checkpoint.log is self
     self._errors = self._errors[:checkpoint.position]
 
+  def dump_errors(self):
+    """Return the errors as a JSON-serializable list. See load_errors."""
+    # pylint: disable=protected-access
+    return [{"severity": e._severity, "message": e._message, "name": e._name,
+             "details": e._details, "filename": e._filename,
+             "lineno": e._lineno, "column": e._column,
+             "linetext": e._linetext, "methodname": e._methodname}
+            for e in self._errors]
+
+  def load_errors(self, data):
+    """Add errors that were saved with dump_errors.
+
+    The errors are added as they are: They went through an error filter before
+    they were saved, so we don't apply ours.
+
+    Args:
+      data: A list, as returned by dump_errors, possibly after a roundtrip
+        through JSON.
+    """
+    for fields in data:
+      # JSON turns our strings into unicode.
+      fields = {k: v.encode("utf-8") if isinstance(v, unicode) else v
+                for k, v in fields.items()}
+      name = fields.pop("name")
+      with _CURRENT_ERROR_NAME.bind(name):
+        self._errors.append(Error(**fields))
+
   def print_to_file(self, fi):
     seen = set()
     for error in self.sorted_errors():
@@ -1,6 +1,7 @@
 """Test errors.py."""
 
 import collections
+import json
 import textwrap
 
 from pytype import errors
@@ -127,6 +128,22 @@ class ErrorLogBaseTest(unittest.TestCase):
     self.assertEquals(2, len(errorlog))
     self.assertTrue(errorlog.has_error())
 
+  @errors._error_name(_TEST_ERROR)
+  def test_dump_load_errors(self):
+    errorlog = errors.ErrorLog()
+    errorlog.warn(FakeOpcode("foo.py", 123, "foo"), "A warning")
+    errorlog.error_with_details(None, "An error", "details")
+    data = json.loads(json.dumps(errorlog.dump_errors()))
+    loaded = errors.ErrorLog()
+    # Loaded errors were already filtered when they were first reported.
+    loaded.set_error_filter(lambda error: False)
+    loaded.load_errors(data)
+    self.assertEquals(2, len(loaded))
+    self.assertTrue(loaded.has_error())
+    self.assertEquals(str(errorlog), str(loaded))
+    self.assertEquals(_TEST_ERROR, list(loaded)[0].name)
+    self.assertIsInstance(list(loaded)[0].filename, str)
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,310 @@
+"""Compute the order in which to analyze several files that import each other.
+
+When pytype is given more than one src:out pair, files that import the outputs
+of other inputs need those outputs to exist (and to be up to date) before they
+can be analyzed. We build the import graph of the inputs up front and process
+them in topological order. Only strongly connected components, i.e. groups of
+files that (transitively) import each other, need to be analyzed more than once.
+"""
+
+import collections
+import logging
+import os
+
+
+from pytype import disk_cache
+from pytype import utils
+from pytype.pyc import opcodes
+from pytype.pyc import pyc
+
+log = logging.getLogger(__name__)
+
+
+# A group of inputs that has to be analyzed together.
+#   indices: The positions of the inputs in the original list of inputs.
+#   src_out: The (input, output) filename pairs of the inputs.
+#   cyclic: True if the inputs (transitively) import each other and hence need
+#     to be analyzed until their outputs stop changing.
+#   dependencies: The positions (in the list returned by analysis_order) of the
+#     components whose outputs this component imports.
+Component = collections.namedtuple(
+    "Component", ["indices", "src_out", "cyclic", "dependencies"])
+
+
+class _ImportCollector(object):
+  """Visitor for collecting the IMPORT_NAME instructions of a code object."""
+
+  def __init__(self):
+    self.imports = []
+
+  def visit_code(self, code):
+    """Record (name, level, fromlist) for every import in this code object."""
+    for op in opcodes.dis_code(code):
+      if not isinstance(op, opcodes.IMPORT_NAME):
+        continue
+      name = code.co_names[op.arg]
+      # The compiler emits "LOAD_CONST level; LOAD_CONST fromlist" right in
+      # front of IMPORT_NAME.
+      fromlist = ()
+      level = -1 if code.python_version[0] == 2 else 0
+      if isinstance(op.prev, opcodes.LOAD_CONST):
+        fromlist = code.co_consts[op.prev.arg] or ()
+        if isinstance(op.prev.prev, opcodes.LOAD_CONST):
+          level = code.co_consts[op.prev.prev.arg]
+      self.imports.append((name, level, tuple(fromlist)))
+    return code
+
+
+def get_imports(src, filename, python_version, python_exe, cache=None):
+  """Find the imports of a Python file.
+
+  Args:
+    src: Python source code.
+    filename: The filename the source is from. For error messages.
+    python_version: Python version, (major, minor).
+    python_exe: Path to a Python interpreter, or "HOST", or None.
+    cache: Optionally, a disk_cache.DiskCache for the compiled code.
+
+  Returns:
+    A list of (name, level, fromlist) tuples, one per import statement. If the
+    file doesn't compile, the list is empty.
+  """
+  try:
+    code = pyc.compile_src(src, python_version, python_exe, filename, cache)
+  except pyc.CompileError:
+    # We'll report this when analyzing the file.
+    return []
+  collector = _ImportCollector()
+  pyc.visit(code, collector)
+  return collector.imports
+
+
+def _candidate_modules(name, level, fromlist, base_module):
+  """List the modules an import statement might load.
+
+  This over-approximates: E.g. for "from a.b import c", "a.b.c" might be a
+  submodule or just a member of a.b. An extra dependency only costs us
+  ordering freedom, while a missing one would cost us correctness.
+
+  Args:
+    name: The name passed to IMPORT_NAME, e.g. "a.b".
+    level: -1 for Python 2 implicit relative imports, 0 for absolute imports,
+      or the number of leading dots for explicit relative imports.
+    fromlist: The names imported with "from ... import ...".
+    base_module: The name of the importing module, or None.
+
+  Returns:
+    A list of module names.
+  """
+  prefixes = []
+  if level <= 0:
+    prefixes.append("")
+    if level == -1 and base_module:
+      package = base_module.split(".")[:-1]
+      if package:
+        prefixes.append(".".join(package) + ".")
+  elif base_module:
+    components = base_module.split(".")
+    if level <= len(components) - 1:
+      package = ".".join(components[:-level])
+      prefixes.append(package + "." if package else "")
+  result = []
+  for prefix in prefixes:
+    if name:
+      parts = name.split(".")
+      for i in range(1, len(parts) + 1):
+        result.append(prefix + ".".join(parts[:i]))
+      full_name = prefix + name
+    else:
+      full_name = prefix.rstrip(".")
+      result.append(full_name)
+    for item in fromlist:
+      if item != "*":
+        result.append(full_name + "." + item if full_name else item)
+  return [r for r in result if r]
+
+
+class _ModuleResolver(object):
+  """Maps module names to inputs, the same way load_pytd.Loader finds pyi."""
+
+  def __init__(self, src_out, options):
+    self._options = options
+    self._output_to_index = {os.path.abspath(output): i
+                             for i, (_, output) in enumerate(src_out)}
+    if options.imports_map is not None:
+      self._reverse_imports_map = {
+          os.path.abspath(path): short_path
+          for short_path, path in sorted(options.imports_map.items())
+          if path != os.devnull}
+    else:
+      self._reverse_imports_map = None
+
+  def module_name(self, output):
+    """Return the name other inputs use to import the given output, or None."""
+    full_path = os.path.abspath(output)
+    if self._reverse_imports_map is not None:
+      short_path = self._reverse_imports_map.get(full_path)
+    else:
+      short_path = None
+      for searchdir in self._options.pythonpath:
+        searchdir = os.path.abspath(searchdir)
+        if full_path.startswith(searchdir.rstrip(os.sep) + os.sep):
+          short_path, _ = os.path.splitext(full_path[len(searchdir):])
+          short_path = short_path.lstrip(os.sep)
+          break
+    if not short_path:
+      return None
+    parts = short_path.split(os.sep)
+    if parts[-1] == "__init__":
+      parts.pop()
+    return ".".join(parts) or None
+
+  def _lookup(self, path):
+    """Map a path (without extension) to an input index, a file, or None."""
+    for candidate in (os.path.join(path, "__init__"), path):
+      if self._options.imports_map is not None:
+        full_path = self._options.imports_map.get(candidate)
+        if full_path is None:
+          continue
+      else:
+        full_path = candidate + ".pyi"
+      full_path = os.path.abspath(full_path)
+      if full_path in self._output_to_index:
+        return self._output_to_index[full_path]
+      elif os.path.exists(full_path) and not os.path.isdir(full_path):
+        return full_path
+    return None
+
+  def resolve(self, module_name):
+    """Return the index of the input providing this module, or None."""
+    module_name_split = module_name.split(".")
+    for prefix in self._options.import_drop_prefixes:
+      module_name_split = utils.list_strip_prefix(module_name_split,
+                                                  prefix.split("."))
+    if not module_name_split:
+      return None
+    if self._options.imports_map is not None:
+      searchdirs = [""]
+    else:
+      searchdirs = self._options.pythonpath
+    for searchdir in searchdirs:
+      found = self._lookup(os.path.join(searchdir, *module_name_split))
+      if found is not None:
+        # A pyi that isn't one of our outputs shadows later path entries.
+        return found if isinstance(found, int) else None
+    return None
+
+
+def build_graph(src_out, options):
+  """Build the import graph of a list of inputs.
+
+  Args:
+    src_out: A list of (input, output) filename pairs.
+    options: config.Options object.
+
+  Returns:
+    A list of sets. The i-th entry contains the indices of the inputs that the
+    i-th input imports.
+  """
+  resolver = _ModuleResolver(src_out, options)
+  # Shared with the VM, which compiles the same sources again.
+  pyc_cache = disk_cache.get_cache(options, "pyc")
+  graph = []
+  for input_filename, output_filename in src_out:
+    with open(input_filename, "rb") as fi:
+      src = fi.read()
+    base_module = resolver.module_name(output_filename)
+    deps = set()
+    for name, level, fromlist in get_imports(
+        src, input_filename, options.python_version, options.python_exe,
+        pyc_cache):
+      for module_name in _candidate_modules(name, level, fromlist,
+                                            base_module):
+        index = resolver.resolve(module_name)
+        if index is not None:
+          deps.add(index)
+    graph.append(deps)
+    log.info("Dependencies of %s: %r", input_filename,
+             sorted(src_out[i][0] for i in deps))
+  return graph
+
+
+def strongly_connected_components(graph):
+  """Compute the strongly connected components of a graph (Tarjan).
+
+  Args:
+    graph: A list of sets. graph[i] are the nodes that node i has edges to.
+
+  Returns:
+    A list of sorted lists of nodes. A component is listed after all the
+    components it has edges to. (I.e., dependencies come first.) Nodes are
+    visited in ascending order, so the result is deterministic.
+  """
+  index = {}
+  lowlink = {}
+  on_stack = set()
+  stack = []
+  components = []
+  for root in range(len(graph)):
+    if root in index:
+      continue
+    # Iterative version of Tarjan's algorithm, so that long import chains
+    # don't run into the recursion limit.
+    index[root] = lowlink[root] = len(index)
+    stack.append(root)
+    on_stack.add(root)
+    work = [(root, iter(sorted(graph[root])))]
+    while work:
+      node, children = work[-1]
+      for child in children:
+        if child not in index:
+          index[child] = lowlink[child] = len(index)
+          stack.append(child)
+          on_stack.add(child)
+          work.append((child, iter(sorted(graph[child]))))
+          break
+        elif child in on_stack:
+          lowlink[node] = min(lowlink[node], index[child])
+      else:
+        work.pop()
+        if work:
+          parent = work[-1][0]
+          lowlink[parent] = min(lowlink[parent], lowlink[node])
+        if lowlink[node] == index[node]:
+          component = []
+          while True:
+            member = stack.pop()
+            on_stack.remove(member)
+            component.append(member)
+            if member == node:
+              break
+          components.append(sorted(component))
+  return components
+
+
+def analysis_order(src_out, options):
+  """Compute the order in which to analyze a list of inputs.
+
+  Args:
+    src_out: A list of (input, output) filename pairs.
+    options: config.Options object.
+
+  Returns:
+    A list of Component instances, in the order they should be analyzed.
+  """
+  graph = build_graph(src_out, options)
+  components = strongly_connected_components(graph)
+  node_to_component = {node: i
+                       for i, component in enumerate(components)
+                       for node in component}
+  result = []
+  for i, component in enumerate(components):
+    cyclic = len(component) > 1 or component[0] in graph[component[0]]
+    dependencies = {node_to_component[dep]
+                    for node in component
+                    for dep in graph[node]} - {i}
+    result.append(Component(indices=component,
+                            src_out=[src_out[node] for node in component],
+                            cyclic=cyclic,
+                            dependencies=dependencies))
+  return result
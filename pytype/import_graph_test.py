@@ -0,0 +1,120 @@
+"""Tests for import_graph.py."""
+
+import os
+import textwrap
+
+from pytype import config
+from pytype import import_graph
+from pytype import utils
+
+import unittest
+
+
+class ImportGraphTest(unittest.TestCase):
+  """Tests for import_graph.py."""
+
+  PYTHON_VERSION = (2, 7)
+
+  def setUp(self):
+    self.options = config.Options.create(python_version=self.PYTHON_VERSION)
+
+  def testGetImports(self):
+    src = textwrap.dedent("""
+      import a.b
+      from c import d, e
+      def f():
+        from . import g
+    """)
+    imports = import_graph.get_imports(src, "foo.py", self.PYTHON_VERSION,
+                                       None)
+    self.assertItemsEqual([("a.b", -1, ()),
+                           ("c", -1, ("d", "e")),
+                           ("", 1, ("g",))], imports)
+
+  def testGetImportsCompileError(self):
+    self.assertEquals([], import_graph.get_imports(
+        "import ==== x", "foo.py", self.PYTHON_VERSION, None))
+
+  def testCandidateModules(self):
+    self.assertItemsEqual(
+        ["a", "a.b", "a.b.c"],
+        import_graph._candidate_modules("a.b", 0, ("c",), None))
+    self.assertItemsEqual(
+        ["x", "p.x"],
+        import_graph._candidate_modules("x", -1, (), "p.m"))
+    self.assertItemsEqual(
+        ["p", "p.x"],
+        import_graph._candidate_modules("", 1, ("x",), "p.m"))
+    self.assertItemsEqual(
+        ["p.q", "p.q.x"],
+        import_graph._candidate_modules("q", 1, ("x", "*"), "p.m"))
+
+  def testSCC(self):
+    graph = [{1}, {2}, {1}, {0, 3}, set()]
+    self.assertEquals([[1, 2], [0], [3], [4]],
+                      import_graph.strongly_connected_components(graph))
+
+  def testSCCLongChain(self):
+    n = 5000
+    graph = [{i + 1} for i in range(n - 1)] + [set()]
+    components = import_graph.strongly_connected_components(graph)
+    self.assertEquals([[i] for i in reversed(range(n))], components)
+
+  def _create_inputs(self, d, sources):
+    src_out = []
+    for name, src in sources:
+      src_out.append((d.create_file(name + ".py", src),
+                      os.path.join(d.path, "out", name + ".pyi")))
+    return src_out
+
+  def testAnalysisOrder(self):
+    with utils.Tempdir() as d:
+      src_out = self._create_inputs(d, [
+          ("a", "import b\nimport c"),
+          ("b", "from pkg import d"),
+          ("c", "import b\nimport a"),
+          ("pkg/d", "import os"),
+          ("e", "import e"),
+      ])
+      self.options.tweak(pythonpath=[os.path.join(d.path, "out")])
+      order = import_graph.analysis_order(src_out, self.options)
+      self.assertEquals([[3], [1], [0, 2], [4]],
+                        [c.indices for c in order])
+      a, b, c, d_, e = src_out
+      self.assertEquals([[d_], [b], [a, c], [e]],
+                        [c.src_out for c in order])
+      self.assertEquals([False, False, True, True],
+                        [c.cyclic for c in order])
+      self.assertEquals([set(), {0}, {1}, set()],
+                        [c.dependencies for c in order])
+
+  def testAnalysisOrderImportsMap(self):
+    with utils.Tempdir() as d:
+      src_out = self._create_inputs(d, [
+          ("a", "from . import b"),
+          ("b", "x = 3"),
+      ])
+      self.options.tweak(imports_map={
+          "foo/a": os.path.abspath(src_out[0][1]),
+          "foo/b": os.path.abspath(src_out[1][1]),
+          "foo/__init__": os.devnull})
+      order = import_graph.analysis_order(src_out, self.options)
+      self.assertEquals([[src_out[1]], [src_out[0]]],
+                        [c.src_out for c in order])
+      self.assertEquals([set(), {0}], [c.dependencies for c in order])
+
+  def testExistingPyiShadowsLaterPath(self):
+    with utils.Tempdir() as d:
+      src_out = self._create_inputs(d, [
+          ("a", "import b"),
+          ("b", "x = 3"),
+      ])
+      d.create_file("stubs/b.pyi", "x = ...  # type: int")
+      self.options.tweak(pythonpath=[os.path.join(d.path, "stubs"),
+                                     os.path.join(d.path, "out")])
+      graph = import_graph.build_graph(src_out, self.options)
+      self.assertEquals([set(), set()], graph)
+
+
+if __name__ == "__main__":
+  unittest.main()
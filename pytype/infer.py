@@ -13,6 +13,7 @@ from pytype import output
 from pytype import state as frame_state
 from pytype import utils
 from pytype import vm
+from pytype.pytd import cfg
 from pytype.pytd import optimize
 from pytype.pytd import pytd
 from pytype.pytd import utils as pytd_utils
@@ -26,6 +27,40 @@ CallRecord = collections.namedtuple("CallRecord",
                                      "keyword_arguments", "return_value"])
 
 
+# Objects that pruning looks into, in search of Variables and Bindings. Other
+# objects are either not part of the output (e.g. frames, and the stack
+# temporaries in their states) or don't reference the data flow graph at all
+# (e.g. pytd nodes).
+_PRUNE_SEARCHED_TYPES = (abstract.AtomicAbstractValue, abstract.PyTDSignature)
+
+
+def _get_data_variables_function():
+  """Return a function that finds the Variables and Bindings in binding data.
+
+  The returned function remembers the objects it has searched, so every object
+  that is shared between bindings is only searched once.
+  """
+  searched = set()
+  def get_data_variables(data):
+    found = []
+    stack = [data]
+    while stack:
+      obj = stack.pop()
+      if isinstance(obj, (cfg.Variable, cfg.Binding)):
+        found.append(obj)
+      elif id(obj) not in searched:
+        searched.add(id(obj))
+        if isinstance(obj, dict):
+          stack.extend(obj.values())
+        elif type(obj) in (list, tuple, set, frozenset):
+          # Exact types only, since pytd nodes are tuples.
+          stack.extend(obj)
+        elif isinstance(obj, _PRUNE_SEARCHED_TYPES):
+          stack.extend(vars(obj).values())
+    return found
+  return get_data_variables
+
+
 class AnalysisFrame(object):
   """Frame representing the "analysis function" that calls everything."""
 
@@ -193,6 +228,27 @@ class CallTracer(vm.VirtualMachine):
     elif isinstance(func.data, abstract.PyTDFunction):
       self._calls.add(CallRecord(func, args, kwargs, result))
 
+  def prune_typegraph(self, defs):
+    """Remove the variables that compute_types() won't look at from the program.
+
+    The output only depends on the definitions, the unknowns and the call
+    traces. Everything else the analysis left in the program (temporaries of
+    the data stack, condition variables, etc.) can be released before we
+    solve.
+
+    Args:
+      defs: The definitions, as returned by run_program.
+    """
+    roots = defs.values() + self._unknowns.values()
+    for record in self._calls | self._method_calls:
+      roots.append(record.function)
+      roots.extend(record.positional_arguments)
+      roots.extend(binding for _, binding in record.keyword_arguments)
+      roots.append(record.return_value)
+    bindings, variables = self.program.Prune(
+        roots, _get_data_variables_function())
+    log.info("Pruned %d bindings of %d variables", bindings, variables)
+
   def pytd_classes_for_unknowns(self):
     classes = []
     for name, var in self._unknowns.items():
@@ -427,6 +483,8 @@ def program_to_text(program):
     s.write("%s\n" % node.Label())
     s.write("  From: %s\n" % ", ".join(n.Label() for n in node.incoming))
     s.write("  To: %s\n" % ", ".join(n.Label() for n in node.outgoing))
+    if node.supernode_id is not None:
+      s.write("  Supernode: %d\n" % node.supernode_id)
     s.write("\n")
     variables = set(value.variable for value in node.bindings)
     for var in sorted(variables, key=lambda v: v.id):
@@ -601,6 +659,10 @@ def infer_types(src,
     tracer.exitpoint = tracer.analyze(loc, defs, builtin_names)
   else:
     tracer.exitpoint = loc
+  if not (options.output_cfg or options.output_typegraph or
+          options.output_debug):
+    # The debug output shows all of the program.
+    tracer.prune_typegraph(defs)
   ast = tracer.compute_types(defs, builtin_names)
   ast = tracer.loader.resolve_ast(ast)
   if solve_unknowns:
@@ -1,10 +1,16 @@
 """Load and link .pyi files."""
 
+import cPickle
+import hashlib
+import json
 import logging
 import os
 
 
+from pytype import disk_cache
+from pytype import metrics
 from pytype import utils
+from pytype.pytd import data_files
 from pytype.pytd import typeshed
 from pytype.pytd import utils as pytd_utils
 from pytype.pytd.parse import builtins
@@ -13,6 +19,116 @@ from pytype.pytd.parse import visitors
 log = logging.getLogger(__name__)
 
 
+# Parsed pyi files, shared by all the Loaders of a process. A process that
+# analyzes more than one file (e.g. the analysis server in server.py) would
+# otherwise parse the same stubs over and over. The parser doesn't create any
+# ClassType nodes, so filling in the "cls" pointers of the postprocessed ASTs
+# never modifies these.
+_parsed_files = {}  # filename -> ((md5 of source, module, version), ast)
+# (subdir, module, version, typeshed) -> (md5 of source, ast)
+_parsed_builtins = {}
+
+# The dictionary the Loaders record the files they look at in. See
+# record_dependencies.
+_dependencies = utils.DynamicVar()
+
+_parse_cache_metric = metrics.MapCounter("pyi_parse_cache")
+
+
+def file_state(path):
+  """Return a fingerprint of what's at path.
+
+  Args:
+    path: A filename.
+
+  Returns:
+    The hex md5 of the contents of the file, "<dir>" for a directory, or None
+    if there's nothing at path.
+  """
+  if os.path.isdir(path):
+    return "<dir>"
+  try:
+    with open(path, "rb") as fi:
+      return hashlib.md5(fi.read()).hexdigest()
+  except IOError:
+    return None
+
+
+def record_dependencies(dependencies):
+  """Record which files the Loaders look at.
+
+  This records every pyi a Loader parses, and every path it checks for a pyi
+  or a package directory, whether or not it exists. If none of these files
+  change, a Loader will resolve all imports the same way.
+
+  Args:
+    dependencies: A dictionary. Receives the absolute paths of the files as
+      keys and their file_state as values.
+
+  Returns:
+    A context manager. Loaders record the files they look at while it is active.
+  """
+  return _dependencies.bind(dependencies)
+
+
+def _record_dependency(path, state=None):
+  dependencies = _dependencies.get()
+  if dependencies is not None:
+    path = os.path.abspath(path)
+    if path not in dependencies:
+      dependencies[path] = file_state(path) if state is None else state
+
+
+def _parse(src, filename, module_name, options):
+  """Parse a pyi, or load it from the on-disk cache if options.cache_dir is set.
+
+  Args:
+    src: The contents of the pyi.
+    filename: The filename, for error messages.
+    module_name: The name of the module.
+    options: config.Options object.
+
+  Returns:
+    A pytd.TypeDeclUnit, as returned by pytd_utils.ParsePyTD.
+  """
+  cache = disk_cache.get_cache(options, "pyi")
+  if cache:
+    key = json.dumps([utils.pytype_fingerprint(), hashlib.md5(src).hexdigest(),
+                      module_name, options.python_version])
+    data = cache.get(key)
+    if data is not None:
+      try:
+        # Only we can write to the cache directory (see disk_cache.get_cache),
+        # so the pickle is one that we stored.
+        ast = cPickle.loads(data)
+      except Exception as e:  # pylint: disable=broad-except
+        log.warning("Ignoring broken cache entry for %s: %s", filename, e)
+      else:
+        _parse_cache_metric.inc("hit")
+        return ast
+    _parse_cache_metric.inc("miss")
+  ast = pytd_utils.ParsePyTD(src,
+                             filename=filename,
+                             module=module_name,
+                             python_version=options.python_version)
+  if cache:
+    cache.put(key, cPickle.dumps(ast, cPickle.HIGHEST_PROTOCOL))
+  return ast
+
+
+class _FillInClasses(visitors.FillInModuleClasses):
+  """Fill in ClassType pointers, and record the classes they point to."""
+
+  def __init__(self, lookup_map):
+    super(_FillInClasses, self).__init__(lookup_map)
+    self.classes = []
+
+  def EnterClassType(self, node):
+    super(_FillInClasses, self).EnterClassType(node)
+    if node.cls is not None:
+      self.classes.append(node.cls)
+
+
 class Module(object):
   """Represents a parsed module.
 
@@ -28,7 +144,6 @@ class Module(object):
     self.module_name = module_name
     self.filename = filename
     self.ast = ast
-    self.dirty = True
 
 
 class Loader(object):
@@ -40,18 +155,32 @@ class Loader(object):
     base_module: The full name of the module we're based in (i.e., the module
       that's importing other modules using this loader).
     options: config.Options object
+    lazy: If True, the ClassType pointers of an imported module aren't filled
+      in when it's imported, but one top-level definition at a time, when
+      finish_member is called for it. The ASTs returned by import_name and
+      friends are then only complete once finish_member was called for their
+      members.
     _modules: A map, filename to Module, for caching modules already loaded.
+    _module_map: A map, module name to AST, of all the modules in _modules.
+      Refreshed when necessary.
+    _unresolved: The Modules whose ClassType pointers we haven't filled in (or,
+      for a lazy Loader, scheduled to be filled in) yet.
     _concatenated: A concatenated pytd of all the modules. Refreshed when
                    necessary.
+    _unfinished: For lazy Loaders, a map from the id of a top-level definition
+      of an imported module to the Module and the definition, for all
+      definitions whose ClassType pointers we haven't filled in yet.
   """
 
   PREFIX = "pytd:"  # for pytd files that ship with pytype
 
   def __init__(self,
                base_module,
-               options):
+               options,
+               lazy=False):
     self.base_module = base_module
     self.options = options
+    self.lazy = lazy
     self.builtins, self.typing = builtins.GetBuiltinsAndTyping()
     self._modules = {
         "__builtin__":
@@ -59,7 +188,11 @@ class Loader(object):
         "typing":
         Module("typing", self.PREFIX + "typing", self.typing)
     }
+    self._module_map = None
+    # GetBuiltinsAndTyping already filled in all of the ClassType pointers.
+    self._unresolved = []
     self._concatenated = None
+    self._unfinished = {}
     # Paranoid verification that pytype.main properly checked the flags:
     if self.options.imports_map is not None:
       assert not self.options.import_drop_prefixes
@@ -81,6 +214,7 @@ class Loader(object):
   def _load_file(self, module_name, filename, ast=None):
     """Load (or retrieve from cache) a module and resolve its dependencies."""
     self._concatenated = None  # invalidate
+    self._module_map = None
     existing = self._modules.get(module_name)
     if existing:
       if existing.filename != filename:
@@ -88,9 +222,7 @@ class Loader(object):
                              (module_name, filename, existing.filename))
       return existing.ast
     if not ast:
-      ast = pytd_utils.ParsePyTD(filename=filename,
-                                 module=module_name,
-                                 python_version=self.options.python_version)
+      ast = self._parse_file(filename, module_name)
     ast = self._postprocess_pyi(ast)
     module = Module(module_name, filename, ast)
     self._modules[module_name] = module
@@ -99,8 +231,25 @@ class Loader(object):
     except:
       del self._modules[module_name]  # don't leave half-resolved modules around
       raise
+    finally:
+      self._module_map = None
+    self._unresolved.append(module)
     return module.ast
 
+  def _parse_file(self, filename, module_name):
+    """Parse a pyi file, or retrieve it from the cache if it didn't change."""
+    with open(filename, "rb") as fi:
+      src = fi.read()
+    digest = hashlib.md5(src)
+    _record_dependency(filename, digest.hexdigest())
+    key = (digest.digest(), module_name, self.options.python_version)
+    cached = _parsed_files.get(filename)
+    if cached and cached[0] == key:
+      return cached[1]
+    ast = _parse(src, filename, module_name, self.options)
+    _parsed_files[filename] = (key, ast)
+    return ast
+
   def _load_and_resolve_ast_dependencies(self, ast):
     """Fill in all ExternalType.cls pointers."""
     deps = visitors.CollectDependencies()
@@ -109,34 +258,84 @@ class Loader(object):
       for name in deps.modules:
         if name not in self._modules:
           self._import_name(name)
-      module_map = {name: module.ast
-                    for name, module in self._modules.items()}
-      ast = ast.Visit(
-          visitors.LookupExternalTypes(module_map, full_names=True))
-      ast = ast.Visit(visitors.VerifyNoExternalTypes())
+      ast = ast.Visit(visitors.LookupExternalTypes(self._get_module_map(),
+                                                   full_names=True))
+      if self.options.verify_pyi:
+        ast = ast.Visit(visitors.VerifyNoExternalTypes())
     return ast
 
-  def _finish_ast(self, ast):
-    module_map = {name: module.ast
-                  for name, module in self._modules.items()}
-    module_map[""] = ast  # The module itself (local lookup)
-    ast.Visit(visitors.FillInModuleClasses(module_map))
-    ast.Visit(visitors.VerifyLookup())
-    ast.Visit(visitors.VerifyNoExternalTypes())
+  def _get_module_map(self):
+    if self._module_map is None:
+      self._module_map = {name: module.ast
+                          for name, module in self._modules.items()}
+    return self._module_map
+
+  def _finish_ast(self, ast, module_ast=None):
+    """Fill in the ClassType pointers of ast.
+
+    Args:
+      ast: A pytd.TypeDeclUnit, or a top-level definition in one.
+      module_ast: The pytd.TypeDeclUnit that ast belongs to, for looking up
+        local names. Defaults to ast.
+
+    Returns:
+      The classes that ast now points to.
+    """
+    module_map = self._get_module_map()
+    # The module itself (local lookup)
+    module_map[""] = ast if module_ast is None else module_ast
+    try:
+      fill_in = _FillInClasses(module_map)
+      ast.Visit(fill_in)
+    finally:
+      del module_map[""]
+    # _load_and_resolve_ast_dependencies already made sure that there are no
+    # ExternalType nodes left.
+    if self.options.verify_pyi:
+      ast.Visit(visitors.VerifyLookup())
+    return fill_in.classes
+
+  def _finish_members(self, classes):
+    """Finish the given classes, and everything they point to, if necessary."""
+    while classes:
+      entry = self._unfinished.pop(id(classes.pop()), None)
+      if entry:
+        module, member = entry
+        classes.extend(self._finish_ast(member, module.ast))
+
+  def finish_member(self, member):
+    """Fill in the ClassType pointers of a top-level definition.
+
+    For a lazy Loader, this has to be called for the members of an imported
+    module before using them. Afterwards, all classes reachable from the member
+    are finished as well.
+
+    Args:
+      member: A top-level definition (pytd.Class, pytd.Function, pytd.Constant,
+        pytd.Alias) of a module returned by this Loader.
+    """
+    self._finish_members([member])
 
   def resolve_ast(self, ast):
     """Resolve the dependencies of an AST, without adding it to our modules."""
     ast = self._postprocess_pyi(ast)
     ast = self._load_and_resolve_ast_dependencies(ast)
     self._lookup_all_classes()
-    self._finish_ast(ast)
+    self._finish_members(self._finish_ast(ast))
     return ast
 
   def _lookup_all_classes(self):
-    for module in self._modules.values():
-      if module.dirty:
+    # A module only points to classes in modules loaded before it (or while it
+    # was loaded), so we never need to revisit modules we finished before.
+    while self._unresolved:
+      module = self._unresolved.pop(0)
+      if self.lazy:
+        ast = module.ast
+        for member in (ast.constants + ast.classes + ast.functions +
+                       ast.aliases):
+          self._unfinished[id(member)] = module, member
+      else:
         self._finish_ast(module.ast)
-        module.dirty = False
 
   def import_relative_name(self, name):
     """IMPORT_NAME with level=-1. A name relative to the current directory."""
@@ -183,17 +382,40 @@ class Loader(object):
   def _load_builtin(self, subdir, module_name):
     """Load a pytd/pyi that ships with pytype or typeshed."""
     version = self.options.python_version
+    filename = src = None
     # Try our own type definitions first.
-    mod = pytd_utils.ParsePredefinedPyTD(subdir, module_name, version)
-    if not mod and self.options.typeshed:
-      # Fall back to typeshed.
-      mod = typeshed.parse_type_definition(subdir, module_name, version)
-    if mod:
-      log.debug("Found %s entry for %r", subdir, module_name)
-      return self._load_file(filename=self.PREFIX + module_name,
-                             module_name=module_name,
-                             ast=mod)
-    return None
+    try:
+      src = data_files.GetPredefinedFile(subdir, module_name)
+      parse_filename = os.path.join(subdir, module_name + ".pytd")
+    except IOError:
+      if self.options.typeshed:
+        # Fall back to typeshed.
+        try:
+          filename, src = typeshed.get_typeshed_file(subdir, module_name,
+                                                     version)
+        except IOError:
+          pass
+        else:
+          parse_filename = filename
+    if src is None:
+      return None
+    digest = hashlib.md5(src)
+    if filename:
+      # Our own type definitions are part of pytype, but typeshed might be
+      # updated independently.
+      _record_dependency(filename, digest.hexdigest())
+    key = (subdir, module_name, version, self.options.typeshed)
+    cached = _parsed_builtins.get(key)
+    if cached and cached[0] == digest.digest():
+      mod = cached[1]
+    else:
+      mod = _parse(src, parse_filename, module_name, self.options)
+      mod = mod.Replace(name=module_name)
+      _parsed_builtins[key] = (digest.digest(), mod)
+    log.debug("Found %s entry for %r", subdir, module_name)
+    return self._load_file(filename=self.PREFIX + module_name,
+                           module_name=module_name,
+                           ast=mod)
 
   def _import_name(self, module_name):
     """Load a name like 'sys' or 'foo.bar.baz'.
@@ -262,7 +484,8 @@ class Loader(object):
       if init_ast is not None:
         log.debug("Found module %r with path %r", module_name, init_path)
         return init_ast
-      elif os.path.isdir(path):
+      _record_dependency(path)
+      if os.path.isdir(path):
         # We allow directories to not have an __init__ file.
         # The module's empty, but you can still load submodules.
         # TODO(pludemann): remove this? - it's not standard Python.
@@ -299,6 +522,7 @@ class Loader(object):
     if os.path.exists(full_path) and not os.path.isdir(full_path):
       return self._load_file(filename=full_path, module_name=module_name)
     else:
+      _record_dependency(full_path)
       return None
 
   def concat_all(self):
@@ -1,10 +1,14 @@
 """Tests for load_pytd.py."""
 
+import os
 import unittest
 
 from pytype import config
 from pytype import load_pytd
+from pytype import metrics
 from pytype import utils
+from pytype.pytd import pytd
+from pytype.pytd import utils as pytd_utils
 
 import unittest
 
@@ -52,6 +56,26 @@ class ImportPathsTest(unittest.TestCase):
         self.assertTrue(module1.Lookup("dir1.module1.foo1"))
         self.assertTrue(module2.Lookup("dir2.module2.foo2"))
 
+  def testRecordDependencies(self):
+    with utils.Tempdir() as d1:
+      with utils.Tempdir() as d2:
+        bar = d2.create_file("foo/bar.pyi", "x = ... # type: int")
+        self.options.tweak(pythonpath=[d1.path, d2.path])
+        loader = load_pytd.Loader("base", self.options)
+        dependencies = {}
+        with load_pytd.record_dependencies(dependencies):
+          loader.import_name("foo")
+          loader.import_name("foo.bar")
+        self.assertEquals(load_pytd.file_state(bar),
+                          dependencies[bar])
+        self.assertEquals("<dir>", dependencies[os.path.join(d2.path, "foo")])
+        self.assertIsNone(
+            dependencies[os.path.join(d1.path, "foo", "bar.pyi")])
+        # Outside of record_dependencies, nothing is recorded.
+        loader.import_name("foo.baz")
+        self.assertNotIn(os.path.join(d2.path, "foo", "baz.pyi"),
+                         dependencies)
+
   def testInit(self):
     with utils.Tempdir() as d1:
       d1.create_file("baz/__init__.pyi", "x = ... # type: int")
@@ -133,6 +157,188 @@ class ImportPathsTest(unittest.TestCase):
     loader = load_pytd.Loader("base", self.options)
     self.assertTrue(loader.import_name("UserDict"))
 
+  def testVerifyPyi(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", "def f() -> Missing")
+      self.options.tweak(pythonpath=[d.path])
+      loader = load_pytd.Loader("base", self.options)
+      self.assertRaises(ValueError, loader.import_name, "foo")
+
+  def testNoVerifyPyi(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", "def f() -> Missing")
+      self.options.tweak(pythonpath=[d.path], verify_pyi=False)
+      loader = load_pytd.Loader("base", self.options)
+      ast = loader.import_name("foo")
+      self.assertIsNone(ast.Lookup("foo.f").signatures[0].return_type.cls)
+
+
+class ParseCacheTest(unittest.TestCase):
+  """Tests for the on-disk cache of parsed pyi files."""
+
+  # pylint: disable=protected-access
+
+  def setUp(self):
+    self.options = config.Options.create(python_version=(2, 7))
+    metrics._prepare_for_test()
+    load_pytd._parse_cache_metric._reset()
+
+  def load(self, module_name):
+    # Forget the ASTs parsed by this process, like a new process would.
+    load_pytd._parsed_files.clear()
+    load_pytd._parsed_builtins.clear()
+    loader = load_pytd.Loader("base", self.options)
+    return loader.import_name(module_name)
+
+  def testPythonPath(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        import bar
+        class A(bar.B):
+          def f(self) -> int
+      """)
+      d.create_file("bar.pyi", "class B(object): pass")
+      self.options.tweak(pythonpath=[d.path],
+                         cache_dir=os.path.join(d.path, "cache"))
+      ast1 = self.load("foo")
+      self.assertEquals({"miss": 2}, load_pytd._parse_cache_metric._counts)
+      ast2 = self.load("foo")
+      self.assertEquals({"miss": 2, "hit": 2},
+                        load_pytd._parse_cache_metric._counts)
+      self.assertEquals(pytd.Print(ast1), pytd.Print(ast2))
+      cls = ast2.Lookup("foo.A")
+      self.assertEquals("bar.B", cls.parents[0].cls.name)
+
+  def testChangedFile(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", "x = ...  # type: int")
+      self.options.tweak(pythonpath=[d.path],
+                         cache_dir=os.path.join(d.path, "cache"))
+      self.load("foo")
+      d.create_file("foo.pyi", "x = ...  # type: str")
+      ast = self.load("foo")
+      self.assertEquals({"miss": 2}, load_pytd._parse_cache_metric._counts)
+      self.assertEquals("__builtin__.str", ast.Lookup("foo.x").type.cls.name)
+
+  def testStdlib(self):
+    with utils.Tempdir() as d:
+      self.options.tweak(cache_dir=d.path)
+      self.load("StringIO")
+      self.load("StringIO")
+      self.assertEquals(1, load_pytd._parse_cache_metric._counts["hit"])
+
+  def testNoCacheDir(self):
+    self.load("StringIO")
+    self.assertEquals({}, load_pytd._parse_cache_metric._counts)
+
+  def testInsecureCacheDir(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", "x = ...  # type: int")
+      cache_dir = os.path.join(d.path, "cache")
+      os.mkdir(cache_dir)
+      os.chmod(cache_dir, 0o777)
+      self.options.tweak(pythonpath=[d.path], cache_dir=cache_dir)
+      self.load("foo")
+      # Other users could have planted pickles in there, so we don't use it.
+      self.assertEquals({}, load_pytd._parse_cache_metric._counts)
+
+
+class LazyLoaderTest(unittest.TestCase):
+  """Tests for Loaders that finish modules one definition at a time."""
+
+  def setUp(self):
+    self.options = config.Options.create(python_version=(2, 7))
+
+  def return_class(self, cls, method_name):
+    return cls.Lookup(method_name).signatures[0].return_type.cls
+
+  def testFinishMember(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        import bar
+        class A(bar.B):
+          def f(self) -> C
+        class C(object):
+          pass
+        class D(object):
+          def g(self) -> D
+      """)
+      d.create_file("bar.pyi", """
+        class B(object):
+          def h(self) -> E
+        class E(object):
+          pass
+        class F(object):
+          def i(self) -> F
+      """)
+      self.options.tweak(pythonpath=[d.path])
+      loader = load_pytd.Loader("base", self.options, lazy=True)
+      ast = loader.import_name("foo")
+      a = ast.Lookup("foo.A")
+      self.assertIsNone(self.return_class(a, "f"))
+      loader.finish_member(a)
+      b = a.parents[0].cls
+      self.assertEquals("bar.B", b.name)
+      self.assertEquals("foo.C", self.return_class(a, "f").name)
+      # Classes reachable from A are finished, too.
+      self.assertEquals("bar.E", self.return_class(b, "h").name)
+      # But the rest of the modules isn't.
+      d_cls = ast.Lookup("foo.D")
+      self.assertIsNone(self.return_class(d_cls, "g"))
+      f_cls = loader.import_name("bar").Lookup("bar.F")
+      self.assertIsNone(self.return_class(f_cls, "i"))
+
+  def testFinishAfterImport(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        class A(object):
+          def f(self) -> A
+      """)
+      d.create_file("bar.pyi", """
+        import foo
+        class B(foo.A):
+          def g(self) -> B
+      """)
+      self.options.tweak(pythonpath=[d.path])
+      loader = load_pytd.Loader("base", self.options, lazy=True)
+      a = loader.import_name("foo").Lookup("foo.A")
+      loader.finish_member(a)
+      self.assertIs(a, self.return_class(a, "f"))
+      b = loader.import_name("bar").Lookup("bar.B")
+      loader.finish_member(b)
+      self.assertIs(b, self.return_class(b, "g"))
+      self.assertIs(a, b.parents[0].cls)
+
+  def testResolveAst(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        class A(object):
+          def f(self) -> B
+        class B(object):
+          pass
+      """)
+      self.options.tweak(pythonpath=[d.path])
+      loader = load_pytd.Loader("base", self.options, lazy=True)
+      src = "import foo\nx = ...  # type: foo.A"
+      ast = loader.resolve_ast(pytd_utils.ParsePyTD(
+          src, module="base", python_version=(2, 7)))
+      a = ast.Lookup("base.x").type.cls
+      self.assertEquals("foo.A", a.name)
+      self.assertEquals("foo.B", self.return_class(a, "f").name)
+
+  def testEager(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        class A(object):
+          def f(self) -> B
+        class B(object):
+          pass
+      """)
+      self.options.tweak(pythonpath=[d.path])
+      loader = load_pytd.Loader("base", self.options)
+      a = loader.import_name("foo").Lookup("foo.A")
+      self.assertEquals("foo.B", self.return_class(a, "f").name)
+
 
 if __name__ == "__main__":
   unittest.main()
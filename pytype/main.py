@@ -0,0 +1,525 @@
+"""Driver for running pytype on a list of files.
+
+This holds the code behind the command line tool, scripts/pytype. It lives in
+the library so that it can also be run inside the analysis server (server.py),
+which keeps builtins and parsed stubs in memory across invocations.
+"""
+
+import collections
+import cProfile
+import errno
+import logging
+import multiprocessing
+import os
+import StringIO
+import sys
+import traceback
+
+from pytype import config
+from pytype import directors
+from pytype import errors
+from pytype import import_graph
+from pytype import imports_map_loader
+from pytype import infer
+from pytype import load_pytd
+from pytype import metrics
+from pytype import result_cache
+from pytype import utils
+from pytype.pyc import pyc
+from pytype.pytd import optimize
+from pytype.pytd import pytd
+from pytype.pytd import utils as pytd_utils
+from pytype.pytd.parse import builtins
+from pytype.pytd.parse import parser
+from pytype.pytd.parse import visitors
+
+
+log = logging.getLogger(__name__)
+
+
+def check_pyi(input_filename, output_filename, errorlog, options):
+  if output_filename is None:
+    output_filename = utils.replace_extension(input_filename, ".pyi")
+  with open(input_filename, "r") as fi:
+    py_src = fi.read()
+  with open(output_filename, "r") as fi:
+    pyi_src = fi.read()
+  infer.check_types(
+      py_src,
+      pyi_src,
+      py_filename=input_filename,
+      pytd_filename=output_filename,
+      errorlog=errorlog,
+      options=options,
+      run_builtins=options.run_builtins,
+      reverse_operators=options.reverse_operators,
+      cache_unknowns=options.cache_unknowns,
+      maximum_depth=(1 if options.quick else None))
+
+
+def generate_pyi(input_filename, output_filename, errorlog, options):
+  """Run the inferencer on one file, producing output.
+
+  Args:
+    input_filename: name of the file to process
+    output_filename: name of the file for writing the output. If this is None,
+                     then the options are used to determine where to write the
+                     output.
+    errorlog: Where error messages go. Instance of errors.ErrorLog.
+    options: config.Options object.
+
+  Returns:
+    A tuple of the text of the pyi, and whether the analysis succeeded. (With
+    options.nofail, a crash produces a placeholder pyi instead.)
+
+  Raises:
+    SystemExit: If we couldn't parse a PYI file.
+  """
+  with open(input_filename, "r") as fi:
+    src = fi.read()
+
+  mod = None
+  try:
+    mod = infer.infer_types(
+        src,
+        errorlog=errorlog,
+        options=options,
+        filename=input_filename,
+        run_builtins=options.run_builtins,
+        deep=options.api or options.structural,
+        solve_unknowns=options.solve_unknowns or options.api,
+        reverse_operators=options.reverse_operators,
+        cache_unknowns=options.cache_unknowns,
+        maximum_depth=(1 if options.quick else None))
+    mod.Visit(visitors.VerifyVisitor())
+  except pyc.CompileError as e:
+    # Compiling a *.py failed. Tell the user what Python told us and exit.
+    sys.stderr.write(e.message + "\n")
+    sys.exit(1)
+  except parser.ParseError as e:
+    if options.nofail:
+      log.warn("Parser error: %s", str(e))
+      result = "def __getattr__(name) -> Any: ...\n"
+      result += "# Caught error in pyi file:\n# " + str(e).replace("\n", "\n# ")
+    else:
+      # TODO(kramm): We should store errors of this kind in the errorlog and
+      # continue processing.
+      sys.stderr.write(str(e))
+      sys.exit(1)
+  except Exception as e:  # pylint: disable=broad-except
+    if options.nofail:
+      log.warn("***Caught exception: %s", str(e), exc_info=True)
+      result = ("def __getattr__(name) -> Any: ...\n"
+                "# Caught error in pytype: " + str(e).replace("\n", "\n#")
+                + "\n# " + "\n# ".join(traceback.format_exc().splitlines()))
+      mod = None
+    else:
+      raise
+  else:
+    if options.optimize:
+      mod = optimize.Optimize(mod,
+                              # TODO(kramm): Add FLAGs for these
+                              lossy=False,
+                              use_abcs=False,
+                              max_union=7,
+                              remove_mutable=False)
+      log.info("=========== pyi optimized =============")
+    else:
+      log.info("=========== pyi =============")
+    mod = pytd_utils.CanonicalOrdering(mod, sort_signatures=True)
+    log.info("\n%s", pytd.Print(mod))
+    log.info("========================================")
+
+    result = pytd.Print(mod)
+    if not result.endswith("\n"):  # TODO(pludemann): fix this hack
+      result += "\n"
+
+    result_prefix = ""
+    if options.output_id:
+      result_prefix += "# %s src: %r\n" % (options.output_id, input_filename)
+    if options.quick:
+      result_prefix += "# (generated with --quick)\n"
+    if result_prefix:
+      result = result_prefix + "\n" + result
+
+  _write_pyi(input_filename, output_filename, result)
+  return result, mod is not None
+
+
+def _write_pyi(input_filename, output_filename, result):
+  if output_filename == "-" or not output_filename:
+    sys.stdout.write(result)
+  else:
+    log.info("write pyi %r => %r", input_filename, output_filename)
+    with open(output_filename, "w") as fi:
+      fi.write(result)
+
+
+def analyze_one_file(input_filename, output_filename, options):
+  """Check or generate a .pyi, according to options.
+
+  Args:
+    input_filename: name of the file to process
+    output_filename: name of the file for writing the output. If this is None,
+                     then the options are used to determine where to write the
+                     output.
+    options: config.Options object.
+
+  Returns:
+    The errors.ErrorLog of this file.
+  """
+  errorlog = errors.ErrorLog()
+  with open(input_filename, "rb") as fi:
+    director = directors.Director(fi.read(), errorlog, input_filename,
+                                  options.disable)
+  errorlog.set_error_filter(director.should_report_error)
+  if options.check and output_filename is None:
+    output_filename = utils.replace_extension(input_filename, ".pyi")
+  if result_cache.can_cache(options):
+    cache = result_cache.ResultCache(input_filename, output_filename, options)
+    result = cache.lookup()
+    if result is not None:
+      log.info("Using cached result for %s", input_filename)
+      if not options.check:
+        _write_pyi(input_filename, output_filename, result.pyi)
+      errorlog.load_errors(result.errors)
+      return errorlog
+  else:
+    cache = None
+  dependencies = {}
+  with load_pytd.record_dependencies(dependencies):
+    if options.check:
+      check_pyi(input_filename=input_filename,
+                output_filename=output_filename,
+                errorlog=errorlog,
+                options=options)
+      pyi, success = None, True
+    else:
+      pyi, success = generate_pyi(input_filename=input_filename,
+                                  output_filename=output_filename,
+                                  errorlog=errorlog,
+                                  options=options)
+  # Don't remember crashes: A later run, e.g. of a fixed pytype, should retry.
+  if cache is not None and success:
+    cache.store(dependencies,
+                result_cache.Result(pyi, errorlog.dump_errors()))
+  return errorlog
+
+
+def report_errors(errorlog, options):
+  """Print the errors of a file, if requested, and return an exit code."""
+  if options.report_errors:
+    errorlog.print_to_stderr()
+    return 1 if errorlog.has_error() else 0  # exit code
+  else:
+    return 0
+
+
+def process_one_file(input_filename, output_filename, options):
+  """Check or generate a .pyi, according to options.
+
+  Args:
+    input_filename: name of the file to process
+    output_filename: name of the file for writing the output. If this is None,
+                     then the options are used to determine where to write the
+                     output.
+    options: config.Options object.
+
+  Returns:
+    An error code (0 means no error).
+
+  """
+  errorlog = analyze_one_file(input_filename, output_filename, options)
+  return report_errors(errorlog, options)
+
+
+def _read_output(output_filename):
+  """Return the contents of a generated .pyi, or None if it doesn't exist."""
+  try:
+    with open(output_filename, "rb") as fi:
+      return fi.read()
+  except IOError:
+    return None
+
+
+def analyze_import_cycle(src_out, options):
+  """Analyze files that import each other until their outputs are stable.
+
+  Args:
+    src_out: A list of (input, output) pairs that (transitively) import each
+             other.
+    options: config.Options object.
+
+  Returns:
+    A list with the errors.ErrorLog of the last pass for every input.
+  """
+  outputs = [_read_output(output) for _, output in src_out]
+  # Every pass that changes an output can only be caused by a change of an
+  # output in the previous pass, so this will normally converge long before
+  # hitting the limit.
+  for iteration in range(len(src_out) + 1):
+    errorlogs = []
+    for input_filename, output_filename in src_out:
+      log.info("Process [cycle, pass %d] %s => %s",
+               iteration + 1, input_filename, output_filename)
+      errorlogs.append(
+          analyze_one_file(input_filename, output_filename, options))
+    new_outputs = [_read_output(output) for _, output in src_out]
+    if new_outputs == outputs:
+      break
+    outputs = new_outputs
+  else:
+    log.warning("Outputs of import cycle %r didn't stabilize",
+                [input_filename for input_filename, _ in src_out])
+  return errorlogs
+
+
+def process_import_cycle(src_out, options):
+  """Like analyze_import_cycle, but report the errors and return an exit code."""
+  ret = 0
+  for errorlog in analyze_import_cycle(src_out, options):
+    ret = ret or report_errors(errorlog, options)
+  return ret
+
+
+# State of a worker process in a parallel run. Set by _init_worker.
+_worker_options = None
+_worker_components = None
+_worker_pids = None
+
+# How long process_in_parallel waits for a result before it checks whether the
+# workers are still alive.
+_POLL_INTERVAL = 0.1
+
+
+def _init_worker(options, components, pids):
+  """Initialize a worker process for process_in_parallel."""
+  global _worker_options, _worker_components, _worker_pids
+  _worker_options = options
+  _worker_components = components
+  _worker_pids = pids
+  # Parse the builtins once per worker, instead of once per analyzed file.
+  builtins.GetBuiltinsAndTyping()
+
+
+def _analyze_component_in_worker(component_index):
+  """Analyze an import_graph.Component in a worker process.
+
+  Args:
+    component_index: The position of the component in _worker_components.
+
+  Returns:
+    A tuple (component_index, stderr_text, exit_code, exited). "stderr_text" is
+    what a sequential run would have printed for this component, and
+    "exit_code" the code it would have returned. "exited" is True if the
+    analysis called sys.exit, in which case a sequential run would have exited
+    with "exit_code".
+
+  Raises:
+    RuntimeError: If the analysis crashed.
+  """
+  _worker_pids[component_index] = os.getpid()
+  options = _worker_options
+  component = _worker_components[component_index]
+  # Workers run concurrently, so capture what they'd print to stderr (syntax
+  # errors, error logs) and let the main process print it in order.
+  stderr = StringIO.StringIO()
+  old_stderr, sys.stderr = sys.stderr, stderr
+  try:
+    if component.cyclic:
+      ret = process_import_cycle(component.src_out, options)
+    else:
+      (input_filename, output_filename), = component.src_out
+      log.info("Process %s => %s", input_filename, output_filename)
+      ret = process_one_file(input_filename, output_filename, options)
+    return component_index, stderr.getvalue(), ret, False
+  except SystemExit as e:
+    return component_index, stderr.getvalue(), e.code, True
+  except Exception:  # pylint: disable=broad-except
+    # The pool passes the exception on to the main process, but not the
+    # traceback.
+    raise RuntimeError("Analysis of %r failed:\n%s" % (
+        [f for f, _ in component.src_out], traceback.format_exc()))
+  finally:
+    sys.stderr = old_stderr
+
+
+def _is_alive(pid):
+  try:
+    os.kill(pid, 0)
+  except OSError as e:
+    return e.errno != errno.ESRCH
+  return True
+
+
+def process_in_parallel(components, options):
+  """Analyze a list of import_graph.Components in a pool of processes.
+
+  A component is scheduled as soon as all the components it imports are done.
+  Import cycles are analyzed by a single worker, so the generated outputs are
+  the same as in a sequential run. Once all the files have been analyzed, the
+  errors are printed, and the exit code is determined, in the same order as in
+  a sequential run, which stops at the first component that fails.
+
+  Unlike a sequential run, components after a failing one might already be
+  running when the failure is noticed. Those are finished, so their outputs
+  might be written. Components that haven't been started by then aren't
+  analyzed.
+
+  Args:
+    components: A list of import_graph.Component, in topological order.
+    options: config.Options object.
+
+  Returns:
+    An error code (0 means no error).
+
+  Raises:
+    RuntimeError: If the analysis of a component crashed, or a worker died.
+  """
+  waiting_for = {i: set(component.dependencies)
+                 for i, component in enumerate(components)}
+  dependents = collections.defaultdict(set)
+  for i, component in enumerate(components):
+    for dependency in component.dependencies:
+      dependents[dependency].add(i)
+  # Workers record the pid of the process analyzing a component, so that we
+  # notice when one dies (e.g. killed because it ran out of memory) and its
+  # result would never arrive. 0 means that the component wasn't started yet.
+  pids = multiprocessing.Array("l", len(components), lock=False)
+  pending = {}  # component index -> AsyncResult
+  results = {}  # component index -> (stderr_text, exit_code, exited)
+  first_failure = len(components)
+  pool = multiprocessing.Pool(options.jobs, initializer=_init_worker,
+                              initargs=(options, components, pids))
+  try:
+    while True:
+      # A sequential run doesn't get past the first failing component.
+      for i in sorted(i for i, deps in waiting_for.items()
+                      if not deps and i < first_failure):
+        del waiting_for[i]
+        pending[i] = pool.apply_async(_analyze_component_in_worker, (i,))
+      if not pending:
+        break
+      ready = sorted(i for i, result in pending.items() if result.ready())
+      if not ready:
+        try:
+          # Waiting with a timeout also keeps us responsive to Ctrl-C.
+          pending[min(pending)].get(_POLL_INTERVAL)
+        except multiprocessing.TimeoutError:
+          _check_workers(pending, pids, components)
+        continue
+      for i in ready:
+        _, text, exit_code, exited = pending.pop(i).get()
+        results[i] = text, exit_code, exited
+        if exit_code or exited:
+          first_failure = min(first_failure, i)
+        for dependent in dependents[i]:
+          waiting_for[dependent].discard(i)
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
+  for i in sorted(results):
+    if i > first_failure:
+      break
+    text, exit_code, exited = results[i]
+    sys.stderr.write(text)
+    if exited:
+      sys.exit(exit_code)
+    if exit_code:
+      return exit_code
+  return 0
+
+
+def _check_workers(pending, pids, components):
+  """Raise an error if a worker died while analyzing a pending component."""
+  for i, result in sorted(pending.items()):
+    if pids[i] and not _is_alive(pids[i]):
+      # Give the pool a chance to deliver a result that was sent just before
+      # the worker exited.
+      result.wait(_POLL_INTERVAL)
+      if not result.ready():
+        raise RuntimeError("Worker analyzing %r died" % (
+            [f for f, _ in components[i].src_out]))
+
+
+class _ProfileContext(object):
+  """A context manager for optionally profiling code."""
+
+  def __init__(self, output_path):
+    """Initialize.
+
+    Args:
+      output_path: A pathname for the profiler output.  An empty string
+          indicates that no profiling should be done.
+    """
+    self._output_path = output_path
+    self._profile = cProfile.Profile() if self._output_path else None
+
+  def __enter__(self):
+    if self._profile:
+      self._profile.enable()
+
+  def __exit__(self, exc_type, exc_value, traceback):  # pylint: disable=redefined-outer-name
+    if self._profile:
+      self._profile.disable()
+      self._profile.dump_stats(self._output_path)
+
+
+def main(argv):
+  try:
+    options = config.Options(argv)
+  except config.OptParseError as e:
+    print >>sys.stderr, e.msg
+    sys.exit(1)
+
+  with _ProfileContext(options.profile):
+    with metrics.MetricsContext(options.metrics):
+      return _run_pytype(options)
+
+
+def _run_pytype(options):
+  """Run pytype with the given configuration options."""
+  if not options.src_out:
+    print >>sys.stderr, "Need at least one filename."
+    sys.exit(1)
+
+  logging.basicConfig(level=options.basic_logging_level)
+  # basicConfig does nothing if logging was configured before, e.g. in the
+  # analysis server (server.py), which runs pytype more than once.
+  logging.getLogger().setLevel(options.basic_logging_level)
+
+  # Do *not* apply os.path.abspath here because we could be in a symlink tree
+  # and bad things happen if you go to relative directories.
+# MOE:begin_strip
+  # Note that you should not do os.path.abspath(f) below; it will probably fail
+  # on Forge because of the symlink tree pointing into the cache:
+# MOE:end_strip
+
+  # Process the imports_info file if present.
+  if options.imports_info:
+    options.imports_map = imports_map_loader.build_imports_map(
+        options.imports_info, options.src_out)
+
+  if len(options.src_out) == 1:
+    (input_filename, output_filename), = options.src_out
+    log.info("Process %s => %s", input_filename, output_filename)
+    return process_one_file(input_filename, output_filename, options)
+
+  # If we're processing more than one file, some of them might import the
+  # outputs of others. Analyze them in dependency order, so that every output
+  # is generated before it's used. Only files that import each other have to
+  # be processed more than once.
+  components = import_graph.analysis_order(options.src_out, options)
+  if options.jobs > 1:
+    return process_in_parallel(components, options)
+  for component in components:
+    if component.cyclic:
+      ret = process_import_cycle(component.src_out, options)
+    else:
+      (input_filename, output_filename), = component.src_out
+      log.info("Process %s => %s", input_filename, output_filename)
+      ret = process_one_file(input_filename, output_filename, options)
+    if ret:
+      return ret
+
@@ -0,0 +1,88 @@
+"""Tests for main.py."""
+
+import os
+
+from pytype import config
+from pytype import import_graph
+from pytype import main
+from pytype import utils
+
+import unittest
+
+
+class ProcessInParallelTest(unittest.TestCase):
+  """Tests for main.process_in_parallel."""
+
+  PYTHON_VERSION = (2, 7)
+
+  def setUp(self):
+    self.options = config.Options.create(python_version=self.PYTHON_VERSION)
+    self.options.tweak(jobs=2)
+    self.process_one_file = main.process_one_file
+
+  def tearDown(self):
+    main.process_one_file = self.process_one_file
+
+  def _process(self, d, sources):
+    src_out = []
+    for name, src in sources:
+      src_out.append((d.create_file(name + ".py", src),
+                      d.create_file(os.path.join("out", name + ".pyi"), "")))
+    self.options.tweak(pythonpath=[os.path.join(d.path, "out")])
+    components = import_graph.analysis_order(src_out, self.options)
+    return main.process_in_parallel(components, self.options)
+
+  def _read_output(self, d, name):
+    with open(os.path.join(d.path, "out", name + ".pyi")) as fi:
+      return fi.read()
+
+  def testDependencies(self):
+    with utils.Tempdir() as d:
+      self.assertEquals(0, self._process(d, [
+          ("a", "import b\ny = b.x"),
+          ("b", "x = 3"),
+          ("c", "z = 3.0"),
+      ]))
+      self.assertIn("y = ...  # type: int", self._read_output(d, "a"))
+      self.assertIn("x = ...  # type: int", self._read_output(d, "b"))
+      self.assertIn("z = ...  # type: float", self._read_output(d, "c"))
+
+  def testStopAtError(self):
+    with utils.Tempdir() as d:
+      self.assertEquals(1, self._process(d, [
+          ("a", "import b\ny = b.x"),
+          ("b", "x = 3\nx.foo"),
+      ]))
+      self.assertIn("x = ...  # type: int", self._read_output(d, "b"))
+      # Like a sequential run, we never get to a.py.
+      self.assertEquals("", self._read_output(d, "a"))
+
+  def testExit(self):
+    with utils.Tempdir() as d:
+      with self.assertRaises(SystemExit) as e:
+        self._process(d, [
+            ("a", "import b\ny = b.x"),
+            ("b", "x = = 3"),
+        ])
+      self.assertEquals(1, e.exception.code)
+      self.assertEquals("", self._read_output(d, "a"))
+
+  def testCrash(self):
+    def process_one_file(*unused_args, **unused_kwargs):
+      raise ValueError("crash")
+    main.process_one_file = process_one_file
+    with utils.Tempdir() as d:
+      self.assertRaisesRegexp(RuntimeError, "ValueError: crash", self._process,
+                              d, [("a", "x = 3"), ("b", "y = 3")])
+
+  def testWorkerDied(self):
+    def process_one_file(*unused_args, **unused_kwargs):
+      os._exit(1)  # pylint: disable=protected-access
+    main.process_one_file = process_one_file
+    with utils.Tempdir() as d:
+      self.assertRaisesRegexp(RuntimeError, "died", self._process,
+                              d, [("a", "x = 3"), ("b", "y = 3")])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -47,6 +47,12 @@ def get_report():
   return "".join(lines)
 
 
+def reset():
+  """Discard the data of all metrics, e.g. before collecting a new report."""
+  for metric in _registered_metrics.values():
+    metric._reset()  # pylint: disable=protected-access
+
+
 def merge_from_file(metrics_file):
   """Merge metrics recorded in another file into the current metrics."""
   for metric in yaml.load(metrics_file):
@@ -79,6 +85,10 @@ class Metric(object):
     """Return a string sumamrizing the value of the metric."""
     raise NotImplementedError
 
+  def _reset(self):
+    """Discard all the data recorded so far."""
+    raise NotImplementedError
+
   def _merge(self, other):
     """Merge data from another metric of the same type."""
     raise NotImplementedError
@@ -92,6 +102,9 @@ class Counter(Metric):
 
   def __init__(self, name):
     super(Counter, self).__init__(name)
+    self._reset()
+
+  def _reset(self):
     self._total = 0
 
   def inc(self, count=1):
@@ -115,6 +128,9 @@ class MapCounter(Metric):
 
   def __init__(self, name):
     super(MapCounter, self).__init__(name)
+    self._reset()
+
+  def _reset(self):
     self._counts = {}
     self._total = 0
 
@@ -152,6 +168,9 @@ class Distribution(Metric):
 
   def __init__(self, name):
     super(Distribution, self).__init__(name)
+    self._reset()
+
+  def _reset(self):
     self._count = 0  # Number of values.
     self._total = 0.0  # Sum of the values.
     self._squared = 0.0  # Sum of the squares of the values.
@@ -224,6 +243,10 @@ class MetricsContext(object):
     global _enabled
     self._old_enabled = _enabled
     _enabled = bool(self._output_path)
+    if _enabled:
+      # In a long-running process (see server.py), report only the data
+      # collected inside this context.
+      reset()
 
   def __exit__(self, exc_type, exc_value, traceback):
     global _enabled
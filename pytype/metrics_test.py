@@ -38,6 +38,16 @@ class MetricsTest(unittest.TestCase):
     metrics.Counter("bar").inc(123)
     self.assertEquals("bar: 123\nfoo: 2\n", metrics.get_report())
 
+  def test_reset(self):
+    metrics.Counter("foo").inc(2)
+    metrics.MapCounter("bar").inc("x", 3)
+    metrics.Distribution("baz").add(4)
+    metrics.reset()
+    self.assertEquals(
+        "bar: 0 {}\n"
+        "baz: total=0.0, count=0, min=None, max=None, mean=None, stdev=None\n"
+        "foo: 0\n", metrics.get_report())
+
   def test_counter(self):
     c = metrics.Counter("foo")
     self.assertEquals(0, c._total)
@@ -238,6 +248,15 @@ class MetricsContextTest(unittest.TestCase):
       self._counter.inc()
     self.assertEquals(0, self._counter._total)
 
+  def test_resets_on_enter(self):
+    with tempfile.NamedTemporaryFile() as out:
+      out.close()
+      with metrics.MetricsContext(out.name):
+        self._counter.inc()
+      with metrics.MetricsContext(out.name):
+        self._counter.inc()
+      self.assertEquals(1, self._counter._total)
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -1,4 +1,7 @@
-"""Compiles a single .py to a .pyc and writes it to stdout."""
+"""Compiles a single .py to a .pyc and writes it to stdout.
+
+With --serve, compiles source code sent over stdin until stdin is closed.
+"""
 
 # These are C modules built into Python. Don't add any modules that are
 # implemented in a .py:
@@ -26,20 +29,93 @@ def write_pyc(f, codeobject, source_size=0, timestamp=0):
   f.write(marshal.dumps(codeobject))
 
 
-def compile_to_pyc(data_file, filename, output):
-  with open(data_file, "r") as fi:
-    src = fi.read()
+def _to_bytes(s):
+  return s if isinstance(s, bytes) else s.encode("utf-8")
+
+
+def compile_src_to_pyc(src, filename, output):
+  """Compile source code and write the result to output.
+
+  Args:
+    src: Python source code.
+    filename: The filename to use in error messages and the code object.
+    output: A binary file-like object. Receives b"\0" followed by the pyc,
+      or b"\1" followed by the error message.
+  """
   try:
     codeobject = compile(src, filename, "exec")
   except Exception as err:  # pylint: disable=broad-except
     output.write(b"\1")
-    output.write(str(err))
+    output.write(_to_bytes(str(err)))
   else:
     output.write(b"\0")
     write_pyc(output, codeobject)
 
 
+def compile_to_pyc(data_file, filename, output):
+  with open(data_file, "r") as fi:
+    src = fi.read()
+  compile_src_to_pyc(src, filename, output)
+
+
+def _read32(f):
+  data = bytearray(f.read(4))
+  if len(data) != 4:
+    return None
+  return data[0] | (data[1] << 8) | (data[2] << 16) | (data[3] << 24)
+
+
+def _read_string(f):
+  size = _read32(f)
+  if size is None:
+    return None
+  data = f.read(size)
+  if len(data) != size:
+    return None
+  return data
+
+
+class _Buffer(object):
+  """Minimal stand-in for io.BytesIO, which is implemented in a .py."""
+
+  def __init__(self):
+    self.chunks = []
+
+  def write(self, data):
+    self.chunks.append(bytes(data))
+
+
+def serve(input_stream, output):
+  """Compile requests from input_stream until it is closed.
+
+  A request is the filename and then the source code, each preceded by its
+  length as a 32 bit little-endian integer. The response is the output of
+  compile_src_to_pyc, also preceded by its length.
+
+  Args:
+    input_stream: A binary file-like object to read requests from.
+    output: A binary file-like object to write responses to.
+  """
+  while True:
+    filename = _read_string(input_stream)
+    src = _read_string(input_stream)
+    if filename is None or src is None:
+      return
+    if not isinstance(filename, str):
+      filename = filename.decode("utf-8")
+    result = _Buffer()
+    compile_src_to_pyc(src, filename, result)
+    data = b"".join(result.chunks)
+    _write32(output, len(data))
+    output.write(data)
+    output.flush()
+
+
 def main():
+  if len(sys.argv) == 2 and sys.argv[1] == "--serve":
+    serve(getattr(sys.stdin, "buffer", sys.stdin),
+          getattr(sys.stdout, "buffer", sys.stdout))
+    return
   if len(sys.argv) != 3:
     sys.exit(1)
   output = sys.stdout.buffer if hasattr(sys.stdout, "buffer") else sys.stdout
@@ -97,25 +97,61 @@ class CodeType(object):
     self.python_version = python_version  # This field is not in types.CodeType.
 
 
+_INT16 = struct.Struct('<h')
+_INT32 = struct.Struct('<i')
+_INT64 = struct.Struct('<q')
+_DOUBLE = struct.Struct('<d')
+_COMPLEX = struct.Struct('<dd')
+# argcount, [kwonlyargcount,] nlocals, stacksize, flags
+_CODE_HEADER2 = struct.Struct('<4i')
+_CODE_HEADER3 = struct.Struct('<5i')
+
+# Type codes as they appear in the data, for the fast paths in _load_items.
+_INT_CODES = (chr(TYPE_INT), chr(TYPE_INT | REF))
+_SHORT_ASCII_CODES = frozenset(chr(c) for c in (
+    TYPE_SHORT_ASCII, TYPE_SHORT_ASCII | REF,
+    TYPE_SHORT_ASCII_INTERNED, TYPE_SHORT_ASCII_INTERNED | REF))
+_CHR_INTERNED = chr(TYPE_INTERNED)
+_STRING_CODES = frozenset([chr(TYPE_STRING), _CHR_INTERNED])
+_CHR_STRINGREF = chr(TYPE_STRINGREF)
+_CHR_NONE = chr(TYPE_NONE)
+
+
+def _int_run_struct(n):
+  """A struct for n consecutive marshalled ints (type code + 32 bit value)."""
+  # struct caches compiled formats, so we don't need to.
+  return struct.Struct('<' + 'xi' * n)
+
+
 class _LoadMarshal(object):
-  """Stateful loader for marshalled files."""
+  """Stateful loader for marshalled files.
+
+  This is performance critical for large modules (e.g. generated code with huge
+  constant tables), so numbers are decoded with struct.unpack_from() directly
+  from the input string, and sequences are decoded by _load_items, which
+  handles the most common element types inline.
+  """
 
   def __init__(self, data, python_version):
-    self.bufstr = data
-    self.bufpos = 0
+    self._data = data
+    self._pos = 0
+    self._size = len(data)
     self.python_version = python_version
     self.refs = []
     self._stringtable = []
 
   def eof(self):
     """Return True if we reached the end of the stream."""
-    return self.bufpos == len(self.bufstr)
+    return self._pos == self._size
 
   def load(self):
     """Load an encoded Python data structure."""
-    c = '?'  # make pylint happy
     try:
-      c = self._read_byte()
+      c = ord(self._data[self._pos])
+    except IndexError:
+      raise EOFError
+    self._pos += 1
+    try:
       if c & REF:
         # This element might recursively contain other elements, which
         # themselves store things in the refs table. So we need to determine the
@@ -128,53 +164,43 @@ class _LoadMarshal(object):
       return result
     except KeyError:
       raise ValueError('bad marshal code: %r (%02x)' % (chr(c), c))
-    except IndexError:
+    except (IndexError, struct.error):
       raise EOFError
 
   def _read(self, n):
     """Read n bytes as a string."""
-    pos = self.bufpos
-    self.bufpos += n
-    if self.bufpos > len(self.bufstr):
+    pos = self._pos
+    end = pos + n
+    if end > self._size:
       raise EOFError()
-    return self.bufstr[pos : self.bufpos]
+    self._pos = end
+    return self._data[pos:end]
 
   def _read_byte(self):
     """Read an unsigned byte."""
-    pos = self.bufpos
-    self.bufpos += 1
-    return ord(self.bufstr[pos])
+    pos = self._pos
+    self._pos = pos + 1
+    return ord(self._data[pos])
+
+  def _unpack(self, st):
+    """Read a value using a struct.Struct, and advance past it."""
+    pos = self._pos
+    self._pos = pos + st.size
+    return st.unpack_from(self._data, pos)
 
   def _read_short(self):
     """Read a signed 16 bit word."""
-    lo = self._read_byte()
-    hi = self._read_byte()
-    x = lo | (hi<<8)
-    if x & 0x8000:
-      # sign extension
-      x -= 0x10000
-    return x
+    return self._unpack(_INT16)[0]
 
   def _read_long(self):
     """Read a signed 32 bit word."""
-    s = self._read(4)
-    x = ord(s[0]) | ord(s[1])<<8 | ord(s[2])<<16 | ord(s[3])<<24
-    if ord(s[3]) & 0x80 and x > 0:
-      # sign extension
-      x = -((1<<32) - x)
-      return int(x)
-    else:
-      return x
+    pos = self._pos
+    self._pos = pos + 4
+    return _INT32.unpack_from(self._data, pos)[0]
 
   def _read_long64(self):
     """Read a signed 64 bit integer."""
-    s = self._read(8)
-    x = (ord(s[0]) | ord(s[1])<<8 | ord(s[2])<<16 | ord(s[3])<<24 |
-         ord(s[4])<<32 | ord(s[5])<<40 | ord(s[6])<<48 | ord(s[7])<<56)
-    if ord(s[7]) & 0x80 and x > 0:
-      # sign extension
-      x = -((1<<64) - x)
-    return x
+    return self._unpack(_INT64)[0]
 
   def _reserve_ref(self):
     """Reserve one entry in the reference table.
@@ -190,6 +216,70 @@ class _LoadMarshal(object):
     self.refs.append(None)
     return idx
 
+  def _load_items(self, n):
+    """Load n consecutive values, e.g. the elements of a tuple.
+
+    Args:
+      n: The number of values.
+
+    Returns:
+      A list.
+    """
+    data = self._data
+    pos = self._pos
+    if n > 1 and data[pos:pos + 1] in _INT_CODES:
+      # Constant tables are often just ints. Decode those with a single unpack.
+      code = data[pos]
+      end = pos + 5 * n
+      if end <= self._size and data[pos:end:5] == code * n:
+        items = list(_int_run_struct(n).unpack_from(data, pos))
+        if code != _INT_CODES[0]:
+          self.refs.extend(items)
+        self._pos = end
+        return items
+    items = []
+    append = items.append
+    load = self.load
+    size = self._size
+    unpack_int32 = _INT32.unpack_from
+    for _ in xrange(n):
+      # Inline the element types that are common in names and constants, to
+      # save the dispatch overhead. Everything else goes through load().
+      pos = self._pos
+      code = data[pos:pos + 1]
+      if code in _SHORT_ASCII_CODES:
+        end = pos + 2 + ord(data[pos + 1])
+        if end > size:
+          raise EOFError()
+        s = data[pos + 2:end]
+        c = ord(code)
+        if c & ~REF == TYPE_SHORT_ASCII_INTERNED:
+          s = intern(s)
+        if c & REF:
+          self.refs.append(s)
+        self._pos = end
+        append(s)
+      elif code in _STRING_CODES:
+        start = pos + 5
+        end = start + unpack_int32(data, pos + 1)[0]
+        if end > size:
+          raise EOFError()
+        s = data[start:end]
+        if code == _CHR_INTERNED:
+          s = intern(s)
+          self._stringtable.append(s)
+        self._pos = end
+        append(s)
+      elif code == _CHR_STRINGREF:
+        self._pos = pos + 5
+        append(self._stringtable[unpack_int32(data, pos + 1)[0]])
+      elif code == _CHR_NONE:
+        self._pos = pos + 1
+        append(None)
+      else:
+        append(load())
+    return items
+
   def load_null(self):
     return _NULL
 
@@ -217,9 +307,10 @@ class _LoadMarshal(object):
   def load_long(self):
     """Load a variable length integer."""
     size = self._read_long()
+    digits = struct.unpack_from('<%dh' % abs(size), self._data, self._pos)
+    self._pos += 2 * len(digits)
     x = 0
-    for i in xrange(abs(size)):
-      d = self._read_short()
+    for i, d in enumerate(digits):
       x |= d<<(i*15)
     return x if size >= 0 else -x
 
@@ -229,8 +320,7 @@ class _LoadMarshal(object):
     return float(s)
 
   def load_binary_float(self):
-    binary = self._read(8)
-    return struct.unpack('<d', binary)[0]
+    return self._unpack(_DOUBLE)[0]
 
   def load_complex(self):
     n = self._read_byte()
@@ -242,8 +332,7 @@ class _LoadMarshal(object):
     return complex(real, imag)
 
   def load_binary_complex(self):
-    binary = self._read(16)
-    return complex(*struct.unpack('dd', binary))
+    return complex(*self._unpack(_COMPLEX))
 
   def load_string(self):
     n = self._read_long()
@@ -269,26 +358,27 @@ class _LoadMarshal(object):
     n = self._read_long()
     return self._read(n)
 
+  def load_ascii_interned(self):
+    return intern(self.load_ascii())
+
   def load_short_ascii(self):
     n = self._read_byte()
     return self._read(n)
 
+  def load_short_ascii_interned(self):
+    return intern(self.load_short_ascii())
+
   def load_tuple(self):
-    return tuple(self.load_list())
+    n = self._read_long()
+    return tuple(self._load_items(n))
 
   def load_small_tuple(self):
     n = self._read_byte()
-    l = []
-    for _ in xrange(n):
-      l.append(self.load())
-    return tuple(l)
+    return tuple(self._load_items(n))
 
   def load_list(self):
     n = self._read_long()
-    l = []
-    for _ in xrange(n):
-      l.append(self.load())
-    return l
+    return self._load_items(n)
 
   def load_dict(self):
     d = {}
@@ -302,22 +392,14 @@ class _LoadMarshal(object):
 
   def load_code(self):
     """Load a Python code object."""
-    argcount = self._read_long()
     if self.python_version[0] >= 3:
-      kwonlyargcount = self._read_long()
+      argcount, kwonlyargcount, nlocals, stacksize, flags = self._unpack(
+          _CODE_HEADER3)
     else:
+      argcount, nlocals, stacksize, flags = self._unpack(_CODE_HEADER2)
       kwonlyargcount = -1
-    nlocals = self._read_long()
-    stacksize = self._read_long()
-    flags = self._read_long()
-    code = self.load()
-    consts = self.load()
-    names = self.load()
-    varnames = self.load()
-    freevars = self.load()
-    cellvars = self.load()
-    filename = self.load()
-    name = self.load()
+    (code, consts, names, varnames, freevars, cellvars, filename,
+     name) = self._load_items(8)
     firstlineno = self._read_long()
     lnotab = self.load()
     return CodeType(argcount, kwonlyargcount, nlocals, stacksize, flags,
@@ -326,13 +408,11 @@ class _LoadMarshal(object):
 
   def load_set(self):
     n = self._read_long()
-    args = [self.load() for _ in xrange(n)]
-    return set(args)
+    return set(self._load_items(n))
 
   def load_frozenset(self):
     n = self._read_long()
-    args = [self.load() for _ in xrange(n)]
-    return frozenset(args)
+    return frozenset(self._load_items(n))
 
   def load_ref(self):
     n = self._read_long()
@@ -340,7 +420,7 @@ class _LoadMarshal(object):
 
   dispatch = {
       TYPE_ASCII: load_ascii,
-      TYPE_ASCII_INTERNED: load_ascii,
+      TYPE_ASCII_INTERNED: load_ascii_interned,
       TYPE_BINARY_COMPLEX: load_binary_complex,
       TYPE_BINARY_FLOAT: load_binary_float,
       TYPE_CODE: load_code,
@@ -360,7 +440,7 @@ class _LoadMarshal(object):
       TYPE_REF: load_ref,
       TYPE_SET: load_set,
       TYPE_SHORT_ASCII: load_short_ascii,
-      TYPE_SHORT_ASCII_INTERNED: load_short_ascii,
+      TYPE_SHORT_ASCII_INTERNED: load_short_ascii_interned,
       TYPE_SMALL_TUPLE: load_small_tuple,
       TYPE_STOPITER: load_stopiter,
       TYPE_STRING: load_string,
@@ -1,5 +1,6 @@
 """Tests for loadmarshal.py."""
 
+import marshal
 
 from pytype.pyc import loadmarshal
 import unittest
@@ -163,5 +164,63 @@ class TestLoadMarshal(unittest.TestCase):
   def test_truncated_byte(self):
     self.assertRaises(EOFError, lambda: self.load('f'))
 
+  def test_load_int_tuple(self):
+    self.assertEquals(self.load('(\3\0\0\0i\1\0\0\0i\2\0\0\0i\xff\xff\xff\xff'),
+                      (1, 2, -1))
+
+  def test_load_mixed_tuple(self):
+    self.assertEquals(self.load('(\3\0\0\0i\1\0\0\0i\2\0\0\0z\3iii'),
+                      (1, 2, 'iii'))
+
+  def test_load_int_tuple_refs(self):
+    data = ('(\3\0\0\0'  # tuple of 3
+            '[\2\0\0\0'  # list of 2
+            '\xe9\1\0\0\0'  # store 1 at 0
+            '\xe9\2\0\0\0'  # store 2 at 1
+            'r\1\0\0\0'  # retrieve 1
+            'r\0\0\0\0')  # retrieve 0
+    self.assertEquals(self.load(data), ([1, 2], 2, 1))
+
+  def test_load_short_ascii_tuple_refs(self):
+    data = ('\xa9\3'  # small tuple of 3, stored at 0
+            '\xda\3abc'  # store "abc" at 1
+            'z\3def'  # "def", not stored
+            'r\1\0\0\0')  # retrieve 1
+    self.assertEquals(self.load(data, python_version=(3, 4)),
+                      ('abc', 'def', 'abc'))
+
+  def test_truncated_tuple(self):
+    self.assertRaises(EOFError, lambda: self.load('(\2\0\0\0i\1\0\0\0i\2'))
+    self.assertRaises(EOFError, lambda: self.load('(\2\0\0\0z\3ab'))
+    self.assertRaises(EOFError, lambda: self.load('(\2\0\0\0t\3\0\0\0ab'))
+
+  def test_intern(self):
+    name = ''.join(['na', 'me'])
+    for data in ('Z\4name', 'A\4\0\0\0name', '(\1\0\0\0Z\4name'):
+      value = self.load(data, python_version=(3, 4))
+      if isinstance(value, tuple):
+        value, = value
+      self.assertIs(intern(name), value)
+
+  def test_load_compiled(self):
+    src = ('x = (%s)\n'
+           'y = [%s]\n'
+           'def f(a, b=3, *args, **kwargs):\n'
+           '  return a + b + 1.5 + 2j + 10**20 + len(args)\n' % (
+               ', '.join(str(i) for i in range(1000)),
+               ', '.join(repr('s%d' % i) for i in range(100))))
+    expected = compile(src, 'foo.py', 'exec')
+    code = self.load(marshal.dumps(expected))
+    f_expected, = [c for c in expected.co_consts if hasattr(c, 'co_code')]
+    f_code, = [c for c in code.co_consts
+               if isinstance(c, loadmarshal.CodeType)]
+    self.assertEquals([c for c in expected.co_consts if c is not f_expected],
+                      [c for c in code.co_consts if c is not f_code])
+    self.assertEquals(expected.co_names, code.co_names)
+    for attr in ('co_argcount', 'co_nlocals', 'co_stacksize', 'co_flags',
+                 'co_code', 'co_consts', 'co_names', 'co_varnames',
+                 'co_filename', 'co_name', 'co_firstlineno', 'co_lnotab'):
+      self.assertEquals(getattr(f_expected, attr), getattr(f_code, attr))
+
 if __name__ == '__main__':
   unittest.main()
@@ -1,29 +1,198 @@
 """Functions for generating, reading and parsing pyc."""
 
+import atexit
 import copy
+import hashlib
+import json
+import logging
 import os
 import StringIO
+import struct
 import subprocess
-import tempfile
+import sys
 
+from pytype import metrics
 from pytype.pyc import compile_bytecode
 from pytype.pyc import loadmarshal
 from pytype.pyc import magic
 
 
-COMPILE_SCRIPT = os.path.join(os.path.dirname(__file__), "compile_bytecode.py")
+log = logging.getLogger(__name__)
+
+_cache_metric = metrics.MapCounter("pyc_cache")
+
+COMPILE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "compile_bytecode.py")
 
 
 class CompileError(Exception):
   pass
 
 
-def compile_src_string_to_pyc_string(src, filename, python_version, python_exe):
+# Length prefix of the messages to and from compile workers. Little-endian, like
+# compile_bytecode._write32.
+_LENGTH = struct.Struct("<I")
+
+
+class _CompileWorker(object):
+  """A compile_bytecode.py process that compiles source code sent to it.
+
+  Starting an interpreter for every compilation takes longer than the
+  compilation itself, so we keep one process per interpreter around and talk
+  to it over a pipe. See compile_bytecode.serve for the protocol.
+  """
+
+  def __init__(self, exe):
+    self._exe = exe
+    self._process = None
+
+  def _start(self):
+    self._process = subprocess.Popen(
+        self._exe + [COMPILE_SCRIPT, "--serve"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+  def stop(self):
+    if self._process:
+      try:
+        self._process.stdin.close()
+        self._process.wait()
+      except (IOError, OSError):
+        pass
+      self._process = None
+
+  def _kill(self):
+    try:
+      self._process.kill()
+      self._process.wait()
+    except OSError:
+      pass
+    self._process = None
+
+  def _request(self, src, filename):
+    stdin, stdout = self._process.stdin, self._process.stdout
+    stdin.write(_LENGTH.pack(len(filename)) + filename +
+                _LENGTH.pack(len(src)) + src)
+    stdin.flush()
+    header = stdout.read(_LENGTH.size)
+    if len(header) != _LENGTH.size:
+      raise IOError("Compile worker %r exited" % self._exe)
+    size, = _LENGTH.unpack(header)
+    data = stdout.read(size)
+    if len(data) != size:
+      raise IOError("Compile worker %r exited" % self._exe)
+    return data
+
+  def compile(self, src, filename):
+    """Compile source code. Returns the output of compile_src_to_pyc."""
+    if self._process and self._process.poll() is not None:
+      log.warning("Compile worker %r died. Restarting it.", self._exe)
+      self._process = None
+    if self._process is None:
+      self._start()
+    try:
+      return self._request(src, filename)
+    except (IOError, OSError):
+      # The worker crashed while processing this request, or just before it.
+      # Try once more with a fresh one, in case the crash wasn't our fault.
+      self._kill()
+      log.warning("Compile worker %r crashed. Retrying.", self._exe)
+      self._start()
+      try:
+        return self._request(src, filename)
+      except (IOError, OSError):
+        self._kill()
+        raise
+
+
+# Map from the command line of a Python interpreter to its _CompileWorker.
+_workers = {}
+# The process that started the workers in _workers. Processes forked off from
+# us (e.g. by --jobs) can't share our workers, since their requests and
+# responses would get mixed up.
+_workers_pid = None
+
+
+def _get_worker(exe):
+  global _workers_pid
+  if _workers_pid != os.getpid():
+    # Leave the parent's workers alone.
+    _workers.clear()
+    _workers_pid = os.getpid()
+  key = tuple(exe)
+  if key not in _workers:
+    _workers[key] = _CompileWorker(exe)
+  return _workers[key]
+
+
+@atexit.register
+def stop_workers():
+  """Stop all compile workers. They're restarted when needed."""
+  if _workers_pid == os.getpid():
+    for worker in _workers.values():
+      worker.stop()
+  _workers.clear()
+
+
+def _get_exe(python_version, python_exe):
+  """The command line of the interpreter to compile with."""
+  if python_exe:
+    # Allow python_exe to contain parameters (E.g. "-T")
+    return python_exe.split() + ["-S"]
+  else:
+    return ["python" + ".".join(map(str, python_version))]
+
+
+# Map from (python_version, python_exe) to the output of _exe_identity.
+_exe_identities = {}
+
+
+def _exe_identity(python_version, python_exe):
+  """Identify the interpreter that compiles for us.
+
+  The name of the interpreter isn't enough: "python2.7" depends on $PATH, and
+  might be a wrapper script (e.g. of pyenv) that picks an interpreter based on
+  the environment. So we ask the interpreter itself, once per process.
+
+  Args:
+    python_version: Python version, (major, minor).
+    python_exe: Path to a Python interpreter, or "HOST", or None.
+
+  Returns:
+    A string.
+  """
+  key = (python_version, python_exe)
+  if key not in _exe_identities:
+    if python_exe == "HOST":
+      identity = "%s\n%s\n" % (sys.executable, sys.version)
+    else:
+      identity = subprocess.check_output(
+          _get_exe(python_version, python_exe) +
+          ["-c", "import sys; print(sys.executable); print(sys.version)"])
+    _exe_identities[key] = identity
+  return _exe_identities[key]
+
+
+def _compile(src, filename, python_version, python_exe):
+  """Compile, returning the output of compile_bytecode.compile_src_to_pyc."""
+  if python_exe == "HOST":
+    # We were asked to use the version of Python we're running to compile.
+    output = StringIO.StringIO()
+    compile_bytecode.compile_src_to_pyc(src, filename, output)
+    return output.getvalue()
+  else:
+    # In order to be able to compile pyc files for both Python 2 and Python 3,
+    # we use an external process.
+    exe = _get_exe(python_version, python_exe)
+    return _get_worker(exe).compile(src, filename)
+
+
+def compile_src_string_to_pyc_string(src, filename, python_version, python_exe,
+                                     cache=None):
   """Compile Python source code to pyc data.
 
-  This may use py_compile if the src is for the same version as we're running,
-  or else it spawns an external process to produce a .pyc file. The generated
-  bytecode (.pyc file) is read and both it and any temporary files are deleted.
+  This may compile in-process if the src is for the same version as we're
+  running, or else it sends the source code to a compile_bytecode.py process
+  running the target version.
 
   Args:
     src: Python sourcecode
@@ -32,6 +201,8 @@ def compile_src_string_to_pyc_string(src, filename, python_version, python_exe):
       to determine the Python executable to call.
     python_exe: Path to a Python interpreter, or "HOST", or None. If this is
       None, the system "pythonX.X" interpreter will be used.
+    cache: Optionally, a disk_cache.DiskCache for storing the results
+      (including compile errors) across runs.
 
   Returns:
     The compiled pyc file as a binary string.
@@ -39,28 +210,19 @@ def compile_src_string_to_pyc_string(src, filename, python_version, python_exe):
     CompileError: If we find a syntax error in the file.
     IOError: If our compile script failed.
   """
-  fi = tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False)
-
-  try:
-    fi.write(src)
-    fi.close()
-    if python_exe == "HOST":
-      # We were asked to use the version of Python we're running to compile.
-      output = StringIO.StringIO()
-      compile_bytecode.compile_to_pyc(fi.name, filename or fi.name, output)
-      bytecode = output.getvalue()
-    else:
-      # In order to be able to compile pyc files for both Python 2 and Python 3,
-      # we spawn an external process.
-      if python_exe:
-        # Allow python_exe to contain parameters (E.g. "-T")
-        exe = python_exe.split() + ["-S"]
-      else:
-        exe = ["python" + ".".join(map(str, python_version))]
-      bytecode = subprocess.check_output(exe + [
-          COMPILE_SCRIPT, fi.name, filename or fi.name])
-  finally:
-    os.unlink(fi.name)
+  filename = filename or "<string>"
+  if cache:
+    # The filename is part of the key since it appears in error messages.
+    key = json.dumps([hashlib.sha1(src).hexdigest(), filename,
+                      python_version, _exe_identity(python_version, python_exe)])
+    bytecode = cache.get(key)
+    _cache_metric.inc("miss" if bytecode is None else "hit")
+  else:
+    bytecode = None
+  if bytecode is None:
+    bytecode = _compile(src, filename, python_version, python_exe)
+    if cache:
+      cache.put(key, bytecode)
   if bytecode[0] == chr(0):  # compile OK
     return bytecode[1:]
   elif bytecode[0] == chr(1):  # compile error
@@ -116,7 +278,7 @@ class AdjustFilename(object):
     return code
 
 
-def compile_src(src, python_version, python_exe, filename=None):
+def compile_src(src, python_version, python_exe, filename=None, cache=None):
   """Compile a string to pyc, and then load and parse the pyc.
 
   Args:
@@ -124,12 +286,13 @@ def compile_src(src, python_version, python_exe, filename=None):
     python_version: Python version, (major, minor).
     python_exe: Path to Python interpreter, or None.
     filename: The filename the sourcecode is from.
+    cache: Optionally, a disk_cache.DiskCache for the pyc data.
 
   Returns:
     An instance of loadmarshal.CodeType.
   """
   pyc_data = compile_src_string_to_pyc_string(
-      src, filename, python_version, python_exe)
+      src, filename, python_version, python_exe, cache)
   code = parse_pyc_string(pyc_data)
   assert code.python_version == python_version
   visit(code, AdjustFilename(filename))
@@ -1,6 +1,8 @@
 """Tests for pyc.py."""
 
 
+from pytype import disk_cache
+from pytype import utils
 from pytype.pyc import opcodes
 from pytype.pyc import pyc
 import unittest
@@ -62,6 +64,50 @@ class TestPyc(unittest.TestCase):
                        ("LOAD_CONST", 3),
                        ("RETURN_VALUE", 3)], op_and_line)
 
+  def test_worker_restart(self):
+    self._compile("a = 1")
+    worker = pyc._get_worker(["python%d.%d" % self.python_version])
+    worker._process.kill()
+    worker._process.wait()
+    code = self._compile("b = 1")
+    self.assertIn("b", code.co_names)
+    pyc.stop_workers()
+    code = self._compile("c = 1")
+    self.assertIn("c", code.co_names)
+
+  def test_host(self):
+    pyc_data = pyc.compile_src_string_to_pyc_string(
+        "foobar = 3", filename="", python_version=(2, 7), python_exe="HOST")
+    self.assertIn("foobar", pyc.parse_pyc_string(pyc_data).co_names)
+
+  def test_cache(self):
+    with utils.Tempdir() as d:
+      cache = disk_cache.DiskCache(d.path, 1 << 20)
+      pyc_data = pyc.compile_src_string_to_pyc_string(
+          "x = 1", "foo.py", self.python_version, None, cache)
+      compile_, pyc._compile = pyc._compile, None
+      try:
+        self.assertEquals(pyc_data, pyc.compile_src_string_to_pyc_string(
+            "x = 1", "foo.py", self.python_version, None, cache))
+        self.assertRaises(TypeError, pyc.compile_src_string_to_pyc_string,
+                          "x = 2", "foo.py", self.python_version, None, cache)
+      finally:
+        pyc._compile = compile_
+
+  def test_cache_compile_error(self):
+    with utils.Tempdir() as d:
+      cache = disk_cache.DiskCache(d.path, 1 << 20)
+      self.assertRaises(pyc.CompileError,
+                        pyc.compile_src_string_to_pyc_string,
+                        "x = ", "foo.py", self.python_version, None, cache)
+      compile_, pyc._compile = pyc._compile, None
+      try:
+        self.assertRaises(pyc.CompileError,
+                          pyc.compile_src_string_to_pyc_string,
+                          "x = ", "foo.py", self.python_version, None, cache)
+      finally:
+        pyc._compile = compile_
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -12,8 +12,16 @@ from pytype import metrics
 from pytype.pytd import utils
 
 
-_solved_find_queries = {}
-_supernode_reachable = {}
+# Default size limits of the reachability caches in Solver.
+MAX_FIND_QUERIES = 100000
+MAX_SUPERNODE_QUERIES = 10000
+
+# Variables and Bindings keep their bindings and origins in lists, which they
+# search linearly, and only add a dict for lookups once a list grows beyond
+# this size. Large modules have hundreds of thousands of these objects, most of
+# them with a single binding or origin, and an empty dict alone takes up 280
+# bytes.
+_MAX_UNINDEXED = 8
 
 
 class Program(object):
@@ -27,14 +35,21 @@ class Program(object):
     entrypoint: Entrypoint of the program, if it has one. (None otherwise)
     cfg_nodes: CFG nodes in use. Will be used for assigning node IDs.
     variables: Variables in use. Will be used for assigning variable IDs.
+    reachability: A ReachabilityIndex over the supernodes. Set by Freeze().
   """
 
+  _prune_metric = metrics.MapCounter("cfg_pruned")
+
   def __init__(self):
     """Initialize a new (initially empty) program."""
     self.entrypoint = None
+    self.reachability = None
     self.cfg_nodes = []
     self.next_variable_id = 0
+    self.next_binding_id = 0
     self.solver = None
+    # Map from a SourceSet to its interned instance. See InternSourceSet.
+    self._source_sets = {}
 
   def NewCFGNode(self, name=None):
     """Start a new CFG node."""
@@ -75,6 +90,20 @@ class Program(object):
         binding.AddOrigin(where, source_set)
     return variable
 
+  def InternSourceSet(self, bindings):
+    """Return the SourceSet of the given bindings.
+
+    Many bindings are created from the same sources (e.g. from nothing, or from
+    the same function binding), so equal SourceSets are shared.
+
+    Arguments:
+      bindings: An iterable of Bindings.
+    Returns:
+      A SourceSet.
+    """
+    source_set = SourceSet(bindings)
+    return self._source_sets.setdefault(source_set, source_set)
+
   def Freeze(self):
     """'Freeze' the program in preparation for solving.
 
@@ -84,10 +113,59 @@ class Program(object):
     nodes also should not be changed.
     """
     assert self.entrypoint
-    self._CompressGraph()
+    if self.reachability is None:
+      self.reachability = ReachabilityIndex(self._CompressGraph())
+      # The index answers the questions reachable_subset was for, and the
+      # subsets grow quadratically with the length of the CFG.
+      for node in self.cfg_nodes:
+        node.reachable_subset = None
     self.solver = Solver(self)
     self.NewCFGNode = utils.disabled_function  # pylint: disable=invalid-name
 
+  def Prune(self, roots, get_data_variables):
+    """Forget the variables that can't be reached from the given roots.
+
+    CFG nodes record every binding assigned at them, so without pruning, the
+    program keeps all temporary variables alive. This walks the data flow
+    graph from the roots, following the data of bindings and the sources of
+    their origins, and removes the bindings of all other variables from the
+    CFG nodes. Must be called before Freeze().
+
+    Arguments:
+      roots: An iterable of Variables and Bindings.
+      get_data_variables: A function that maps the data of a binding to an
+        iterable of the Variables and Bindings it references.
+
+    Returns:
+      A tuple (number of removed bindings, number of removed variables).
+    """
+    assert self.solver is None, "Can't prune a frozen program."
+    reachable = set()
+    stack = list(roots)
+    while stack:
+      item = stack.pop()
+      variable = item.variable if isinstance(item, Binding) else item
+      if variable in reachable:
+        continue
+      reachable.add(variable)
+      for binding in variable.bindings:
+        stack.extend(get_data_variables(binding.data))
+        for origin in binding.origins:
+          for source_set in origin.source_sets:
+            stack.extend(source_set)
+    removed_bindings = set()
+    for node in self.cfg_nodes:
+      removed = {b for b in node.bindings if b.variable not in reachable}
+      if removed:
+        node.bindings -= removed
+        removed_bindings |= removed
+    # The table of interned source sets would keep the removed bindings alive.
+    self._source_sets = {}
+    removed_variables = len({b.variable for b in removed_bindings})
+    Program._prune_metric.inc("bindings", len(removed_bindings))
+    Program._prune_metric.inc("variables", removed_variables)
+    return len(removed_bindings), removed_variables
+
   def MergeVariables(self, node, name, variables):
     """Create a combined Variable for a list of variables.
 
@@ -128,8 +206,13 @@ class Program(object):
                |                  |
                -> [n5, n6, n7] <---
     (It is also possible for n7 to be in the [n2, n3, n4] supernode.)  Every
-    node stores a pointer to and its position in its supernode.
+    node stores a pointer to and its position in its supernode, as well as the
+    index of the supernode.
+
+    Returns:
+      The list of supernodes. The first one contains the entrypoint.
     """
+    supernodes = []
     seen = set()
     stack = [self.entrypoint]
     while stack:
@@ -143,11 +226,15 @@ class Program(object):
           node.supernode = node_in.supernode
           node.supernode.append(node)
           node.position = node_in.position + 1
+          node.supernode_id = node_in.supernode_id
       if not node.supernode:
         node.supernode = [node]
         node.position = 0
+        node.supernode_id = len(supernodes)
+        supernodes.append(node.supernode)
       stack.extend(node.outgoing)
     assert len(seen) == len(self.cfg_nodes)
+    return supernodes
 
 
 class CFGNode(object):
@@ -165,13 +252,15 @@ class CFGNode(object):
     outgoing: CFGNodes we connect to.
     bindings: Bindings that are being assigned to Variables at this CFGNode.
     reachable_subset: A subset of the nodes reachable (going backwards) from
-      this one.
+      this one. None after Program.Freeze(), which computes the full
+      reachability information (see IsReachableFrom).
     supernode: A list of nodes comprising a "supernode" to which this one
       belongs. See Program._CompressGraph.
     position: This node's position in the supernode.
+    supernode_id: The index of the supernode. See ReachabilityIndex.
   """
   __slots__ = ("program", "id", "name", "incoming", "outgoing", "bindings",
-               "reachable_subset", "supernode", "position")
+               "reachable_subset", "supernode", "position", "supernode_id")
 
   def __init__(self, program, name, cfgnode_id):
     """Initialize a new CFG node. Called from Program.NewCFGNode."""
@@ -184,6 +273,7 @@ class CFGNode(object):
     self.reachable_subset = {self}
     self.supernode = None
     self.position = None
+    self.supernode_id = None
 
   def ConnectNew(self, name=None):
     """Add a new node connected to this node."""
@@ -197,6 +287,27 @@ class CFGNode(object):
     cfg_node.incoming.add(self)
     cfg_node.reachable_subset |= self.reachable_subset
 
+  def IsReachableFrom(self, cfg_node):
+    """Whether there is a path from the given node to this one.
+
+    Before the program is frozen, this only knows about the paths that were
+    complete when the nodes were connected, so it might return False for
+    reachable nodes.
+
+    Arguments:
+      cfg_node: A CFGNode.
+    Returns:
+      True if we know of a path from cfg_node to this node. Every node can be
+      reached from itself.
+    """
+    if self.reachable_subset is not None:
+      return cfg_node in self.reachable_subset
+    if (cfg_node.supernode is self.supernode and
+        cfg_node.position <= self.position):
+      return True
+    ancestors = self.program.reachability.ancestors[self.supernode_id]
+    return bool(ancestors & 1 << cfg_node.supernode_id)
+
   def HasCombination(self, bindings):
     """Query whether a combination is possible.
 
@@ -215,6 +326,42 @@ class CFGNode(object):
     return (all(self.program.solver.Solve({b}, self) for b in bindings)
             and self.program.solver.Solve(bindings, self))
 
+  def FilterCombinations(self, combinations):
+    """Find the combinations that are possible at this CFG node.
+
+    This is a batched version of HasCombination(). The combinations are
+    solved incrementally, along the trie of their prefixes: If a prefix of a
+    combination is impossible, so is every combination that extends it, and
+    the solver never sees them. Combinations that share a prefix (as the
+    elements of a Cartesian product do) only solve that prefix once. To share
+    as much as possible, callers should put the bindings of every combination
+    in the same order.
+
+    The input is consumed lazily, so it may depend on what was yielded so far.
+
+    Arguments:
+      combinations: An iterable of sequences of Bindings.
+    Yields:
+      The combinations that are possible, in their original order.
+    """
+    solver = self.program.solver
+    # Map from a tuple of bindings to whether it's possible at this node.
+    prefixes = {(): True}
+    for combination in combinations:
+      bindings = tuple(combination)
+      # As in HasCombination, first check the bindings separately.
+      if not all(solver.Solve({b}, self) for b in bindings):
+        continue
+      for i in range(2, len(bindings) + 1):
+        prefix = bindings[:i]
+        possible = prefixes.get(prefix)
+        if possible is None:
+          possible = prefixes[prefix] = solver.Solve(prefix, self)
+        if not possible:
+          break
+      else:
+        yield combination
+
   def RegisterBinding(self, binding):
     self.bindings.add(binding)
 
@@ -244,17 +391,23 @@ class Origin(collections.namedtuple("_", "where, source_sets")):
   Attributes:
     where: The CFG node where this assignment happened.
     source_sets: Possible SourceSets used to construct the binding we belong to.
-      A set of SourceSet instances.
+      A list of distinct, interned SourceSet instances. (Most origins have a
+      single source set, and a list of one takes a third of the memory of a
+      set.)
   """
   __slots__ = ()
 
   def __new__(cls, where, source_sets=None):
     return super(Origin, cls).__new__(
-        cls, where, source_sets or set())
+        cls, where, source_sets or [])
 
   def AddSourceSet(self, source_set):
     """Add a new possible source set."""
-    self.source_sets.add(SourceSet(source_set))
+    source_set = self.where.program.InternSourceSet(source_set)
+    # Interned SourceSets are compared by identity first, and by their cached
+    # hash next, so this is cheap.
+    if source_set not in self.source_sets:
+      self.source_sets.append(source_set)
 
 
 class Binding(object):
@@ -270,15 +423,21 @@ class Binding(object):
   originally retrieved from, before being assigned to something else here.
   Origins contain, through source_sets, "sources", which are other bindings.
   """
-  __slots__ = ("program", "variable", "origins", "data", "_cfgnode_to_origin")
+  __slots__ = ("program", "id", "variable", "origins", "data",
+               "_cfgnode_to_origin")
 
   def __init__(self, program, variable, data):
     """Initialize a new Binding. Usually called through Variable.AddBinding."""
     self.program = program
+    # Bindings are numbered densely, so the solver can identify sets of them
+    # by their ids.
+    self.id = program.next_binding_id
+    program.next_binding_id += 1
     self.variable = variable
     self.origins = []
     self.data = data
-    self._cfgnode_to_origin = {}
+    # Map from CFG node to origin. Only used if there are many origins.
+    self._cfgnode_to_origin = None
 
   def IsVisible(self, viewpoint):
     """Can we "see" this binding from the current cfg node?
@@ -298,19 +457,26 @@ class Binding(object):
     return self.program.solver.Solve({self}, viewpoint)
 
   def _FindOrAddOrigin(self, cfg_node):
-    try:
-      origin = self._cfgnode_to_origin[cfg_node]
-    except KeyError:
+    origin = self.FindOrigin(cfg_node)
+    if origin is None:
       origin = Origin(cfg_node)
       self.origins.append(origin)
-      self._cfgnode_to_origin[cfg_node] = origin
+      if self._cfgnode_to_origin is not None:
+        self._cfgnode_to_origin[cfg_node] = origin
+      elif len(self.origins) > _MAX_UNINDEXED:
+        self._cfgnode_to_origin = {o.where: o for o in self.origins}
       self.variable.RegisterBindingAtNode(self, cfg_node)
       cfg_node.RegisterBinding(self)
     return origin
 
   def FindOrigin(self, cfg_node):
     """Return an Origin instance for a CFGNode, or None."""
-    return self._cfgnode_to_origin.get(cfg_node)
+    if self._cfgnode_to_origin is not None:
+      return self._cfgnode_to_origin.get(cfg_node)
+    for origin in self.origins:
+      if origin.where is cfg_node:
+        return origin
+    return None
 
   def AddOrigin(self, where, source_set):
     """Add another possible origin to this binding."""
@@ -357,6 +523,11 @@ class Variable(object):
   create an OrderedDict instance as to create a list and a dict, while adding a
   binding to the OrderedDict takes 2-3x as long as adding it to both the list
   and the dict.
+
+  Most variables have a single binding, assigned at a single CFG node, so the
+  bookkeeping is kept small for those: _data_id_to_binding is only created once
+  there are more than _MAX_UNINDEXED bindings, and _cfgnode_to_bindings is a
+  tuple (node, binding, ...) until the variable is assigned at a second node.
   """
   __slots__ = ("program", "name", "id", "bindings", "_data_id_to_binding",
                "_cfgnode_to_bindings", "_callbacks")
@@ -367,9 +538,11 @@ class Variable(object):
     self.name = name
     self.id = variable_id
     self.bindings = []
-    self._data_id_to_binding = {}
-    self._cfgnode_to_bindings = collections.defaultdict(set)
-    self._callbacks = []
+    self._data_id_to_binding = None
+    # Either a tuple (node, binding1, binding2, ...), empty if there are no
+    # assignments, or a dict mapping nodes to sets of bindings.
+    self._cfgnode_to_bindings = ()
+    self._callbacks = ()
 
   def __repr__(self):
     return "<Variable %d \"%s\": %d choices>" % (
@@ -392,8 +565,9 @@ class Variable(object):
       A filtered list of bindings for this variable.
     """
     num_bindings = len(self.bindings)
-    if (len(self._cfgnode_to_bindings) == 1 or num_bindings == 1) and any(
-        n in viewpoint.reachable_subset for n in self._cfgnode_to_bindings):
+    sites = self._Sites()
+    if (len(sites) == 1 or num_bindings == 1) and any(
+        viewpoint.IsReachableFrom(n) for n in sites):
       return self.bindings
     result = set()
     seen = set()
@@ -403,10 +577,8 @@ class Variable(object):
         break
       node = stack.pop()
       seen.add(node)
-      # _cfgnode_to_bindings is a defaultdict, so don't use "get"
-      if node in self._cfgnode_to_bindings:
-        bindings = self._cfgnode_to_bindings[node]
-        assert bindings, "empty binding list"
+      bindings = self._BindingsAt(node)
+      if bindings:
         result.update(bindings)
         # Don't expand this node - previous assignments to this variable will
         # be invisible, since they're overwritten here.
@@ -438,14 +610,22 @@ class Variable(object):
     return [b.data for b in self.bindings if b.IsVisible(viewpoint)]
 
   def _FindOrAddBinding(self, data):
-    try:
-      binding = self._data_id_to_binding[id(data)]
-    except KeyError:
-      binding = Binding(self.program, self, data)
-      self.bindings.append(binding)
+    if self._data_id_to_binding is not None:
+      binding = self._data_id_to_binding.get(id(data))
+      if binding:
+        return binding
+    else:
+      for binding in self.bindings:
+        if binding.data is data:
+          return binding
+    binding = Binding(self.program, self, data)
+    self.bindings.append(binding)
+    if self._data_id_to_binding is not None:
       self._data_id_to_binding[id(data)] = binding
-      for callback in self._callbacks:
-        callback()
+    elif len(self.bindings) > _MAX_UNINDEXED:
+      self._data_id_to_binding = {id(b.data): b for b in self.bindings}
+    for callback in self._callbacks:
+      callback()
     return binding
 
   def AddBinding(self, data, source_set=None, where=None):
@@ -515,38 +695,67 @@ class Variable(object):
       new_binding.AddOrigin(where, {binding})
     return new_variable
 
+  def _BindingsAt(self, node):
+    """The bindings assigned at the given CFG node, as a sequence or set."""
+    sites = self._cfgnode_to_bindings
+    if type(sites) is tuple:
+      return sites[1:] if sites and sites[0] is node else ()
+    return sites.get(node, ())
+
   def RegisterBindingAtNode(self, binding, node):
-    self._cfgnode_to_bindings[node].add(binding)
+    sites = self._cfgnode_to_bindings
+    if type(sites) is tuple:
+      if not sites:
+        self._cfgnode_to_bindings = (node, binding)
+        return
+      elif sites[0] is node:
+        if binding not in sites[1:]:
+          self._cfgnode_to_bindings += (binding,)
+        return
+      sites = self._cfgnode_to_bindings = {sites[0]: set(sites[1:])}
+    sites.setdefault(node, set()).add(binding)
 
   def RegisterChangeListener(self, callback):
-    self._callbacks.append(callback)
+    self._callbacks += (callback,)
 
   def UnregisterChangeListener(self, callback):
-    self._callbacks.remove(callback)
+    callbacks = list(self._callbacks)
+    callbacks.remove(callback)
+    self._callbacks = tuple(callbacks)
 
   @property
   def data(self):
     return [binding.data for binding in self.bindings]
 
+  def _Sites(self):
+    """The CFG nodes at which this variable is assigned, as a sequence."""
+    sites = self._cfgnode_to_bindings
+    return sites[:1] if type(sites) is tuple else sites.keys()
+
   @property
   def nodes(self):
-    return set(self._cfgnode_to_bindings)
+    return set(self._Sites())
 
 
 class State(object):
   """A state needs to "solve" a list of goals to succeed.
 
+  States are immutable, and are identified by their key. Since the Solver
+  memoizes states by key, the memo table holds tuples of ints, rather than
+  CFG nodes and sets of bindings.
+
   Attributes:
     pos: Our current position in the CFG.
-    goals: A list of bindings we'd like to be valid at this position.
+    goals: A frozenset of bindings we'd like to be valid at this position.
+    key: The id of pos, and the sorted ids of the goals.
   """
-  __slots__ = ("pos", "goals")
+  __slots__ = ("pos", "goals", "key")
 
   def __init__(self, pos, goals):
     """Initialize a state that starts at the given cfg node."""
-    assert all(isinstance(goal, Binding) for goal in goals)
     self.pos = pos
-    self.goals = set(goals)  # Make a copy. We modify these.
+    self.goals = frozenset(goals)
+    self.key = (pos.id, tuple(sorted([goal.id for goal in self.goals])))
 
   def Done(self):
     """Is this State solved? This checks whether the list of goals is empty."""
@@ -559,21 +768,10 @@ class State(object):
       True if we would need a variable to be assigned to two distinct
       bindings at the same time in order to solve this state. False if there are
       no conflicting goals.
-
-    Raises:
-      AssertionError: For internal errors.
     """
-    variables = {}
-    for goal in self.goals:
-      existing = variables.get(goal.variable)
-      if existing:
-        if existing is goal:
-          raise AssertionError("Internal error. Duplicate goal.")
-        if existing.data is goal.data:
-          raise AssertionError("Internal error. Duplicate data across bindings")
-        return True
-      variables[goal.variable] = goal
-    return False
+    # The goals are distinct bindings, so they conflict iff two of them belong
+    # to the same variable.
+    return len({goal.variable.id for goal in self.goals}) < len(self.goals)
 
   def NodesWithAssignments(self):
     """Find all CFG nodes corresponding to goal variable assignments.
@@ -586,137 +784,238 @@ class State(object):
       A set of instances of CFGNode. At every CFGNode in this set, at least
       one variable in the list of goals is assigned to something.
     """
-    return set.union(*(goal.variable.nodes for goal in self.goals))
-
-  def Replace(self, goal, replace_with):
-    """Replace a goal with new goals (the origins of the expanded goal)."""
-    assert goal in self.goals, "goal to expand not in state"
-    self.goals.remove(goal)
-    self.goals.update(replace_with)
+    nodes = set()
+    for goal in self.goals:
+      nodes.update(goal.variable._Sites())  # pylint: disable=protected-access
+    return nodes
 
-  def _AddSources(self, goal, seen_goals, new_goals):
-    """If the goal is trivially fulfilled, add its sources as new goals.
+  def Replace(self, goal, replace_with, pos):
+    """Replace a goal with new goals (the origins of the expanded goal).
 
-    Args:
-      goal: The goal.
-      seen_goals: The set of previously seen goals, which will be augmented
-        with goal. The caller is responsible for checking whether goal is
-        already present.
-      new_goals: The set of new goals, to which goal's sources are added iff
-        this method returns True.
+    Arguments:
+      goal: The goal to replace.
+      replace_with: The bindings to replace it with.
+      pos: The position of the new state.
 
     Returns:
-      True if the goal is trivially fulfilled and False otherwise.
+      A new State, at pos. Goals that are trivially fulfilled at pos are
+      removed.
     """
-    seen_goals.add(goal)
-    origin = goal.FindOrigin(self.pos)
-    # For source sets > 2, we don't know which sources to use, so we have
-    # to let the solver iterate over them later.
-    if origin and len(origin.source_sets) <= 1:
-      source_set, = origin.source_sets  # we always have at least one.
-      new_goals.update(source_set)
-      return True
-    return False
-
-  def RemoveFinishedGoals(self):
-    """Remove all goals that are trivially fulfilled at the current CFG node."""
-    seen_goals = set()
-    new_goals = set()
-    for goal in self.goals.copy():
-      if self._AddSources(goal, seen_goals, new_goals):
-        self.goals.remove(goal)
-    # We might remove multiple layers of nested goals, so loop until we don't
-    # find anything to replace anymore. Storing new goals in a separate set is
-    # faster than adding and removing them from self.goals.
-    while new_goals:
-      goal = new_goals.pop()
-      if goal in seen_goals:
-        # Only process a given goal once, to prevent infinite loops for cyclic
-        # data structures.
-        continue
-      if not self._AddSources(goal, seen_goals, new_goals):
-        self.goals.add(goal)
+    assert goal in self.goals, "goal to expand not in state"
+    goals = set(self.goals)
+    goals.remove(goal)
+    goals.update(replace_with)
+    return State(pos, _RemoveFinishedGoals(pos, goals))
 
   def __hash__(self):
-    """Compute hash for this State. We use States as keys when memoizing."""
-    return hash(self.pos) + hash(frozenset(self.goals))
+    return hash(self.key)
 
   def __eq__(self, other):
-    return self.pos == other.pos and self.goals == other.goals
+    return self.key == other.key
 
   def __ne__(self, other):
     return not self == other
 
 
-def _FindNodeBackwards(start, finish, blocked):
-  """Determine whether we can reach a CFG node, going backwards.
-
-  Traverse the CFG from a starting point to find a given node, but avoid any
-  nodes marked as "blocked".
+def _AddSources(pos, goal, seen_goals, new_goals):
+  """If the goal is trivially fulfilled, add its sources as new goals.
 
-  Arguments:
-    start: Start node.
-    finish: Node we're looking for.
-    blocked: A set of blocked nodes. We do not consider start or finish to be
-      blocked even if they apppear in this set.
+  Args:
+    pos: The CFG node we're at.
+    goal: The goal.
+    seen_goals: The set of previously seen goals, which will be augmented
+      with goal. The caller is responsible for checking whether goal is
+      already present.
+    new_goals: The set of new goals, to which goal's sources are added iff
+      this method returns True.
 
   Returns:
-    True if we can find this node, False otherwise.
+    True if the goal is trivially fulfilled and False otherwise.
   """
-  query = (start, finish, blocked)
-  if query in _solved_find_queries:
-    return _solved_find_queries[query]
-  if start.supernode is finish.supernode and start.position >= finish.position:
-    # There is exactly one path from start to finish. Check whether any node in
-    # it is blocked.
-    if blocked.intersection(start.supernode[finish.position+1:start.position]):
-      found = False
-    else:
-      found = True
-  elif blocked.intersection(
-      start.supernode[:start.position] + finish.supernode[finish.position+1:]):
-    # A node that must be passed through to get from start to finish is blocked.
-    found = False
-  else:
-    found = _FindSupernodeBackwards(start.supernode[0], finish.supernode[0],
-                                    frozenset(node.supernode[0]
-                                              for node in blocked))
-  _solved_find_queries[query] = found
-  return found
+  seen_goals.add(goal)
+  origin = goal.FindOrigin(pos)
+  # For source sets > 2, we don't know which sources to use, so we have
+  # to let the solver iterate over them later.
+  if origin and len(origin.source_sets) <= 1:
+    source_set, = origin.source_sets  # we always have at least one.
+    new_goals.update(source_set)
+    return True
+  return False
 
 
-def _FindSupernodeBackwards(start, finish, blocked_supernodes):
-  """Determine whether we can reach a supernode, going backwards.
+def _RemoveFinishedGoals(pos, goals):
+  """Remove all goals that are trivially fulfilled at a CFG node.
 
-  Arguments:
-    start: The first node in the supernode we're starting from.
-    finish: The first node in the supernode we're looking for.
-    blocked_supernodes: A set of the first node in every blocked supernode.
+  Args:
+    pos: The CFG node.
+    goals: A set of bindings. Modified in place.
 
   Returns:
-    True if we can find finish from any of start's *incoming nodes*, False
-    otherwise. This means that if start and finish are in the same supernode,
-    we must find a path from the supernode back to itself.
+    The goals set.
   """
-  query = (start, blocked_supernodes)
-  if query in _supernode_reachable:
-    return finish in _supernode_reachable[query]
-  stack = list(start.incoming)
-  seen = set()
-  while stack:
-    node = stack.pop().supernode[0]
-    if node is finish:
-      return True
-    if node in seen:
-      continue
-    seen.add(node)
-    if node in blocked_supernodes:
+  seen_goals = set()
+  new_goals = set()
+  for goal in goals.copy():
+    if _AddSources(pos, goal, seen_goals, new_goals):
+      goals.remove(goal)
+  # We might remove multiple layers of nested goals, so loop until we don't
+  # find anything to replace anymore. Storing new goals in a separate set is
+  # faster than adding and removing them from goals.
+  while new_goals:
+    goal = new_goals.pop()
+    if goal in seen_goals:
+      # Only process a given goal once, to prevent infinite loops for cyclic
+      # data structures.
       continue
-    stack.extend(node.incoming)
-  # If we haven't found finish, then the seen set contains all of the nodes
-  # reachable from start.
-  _supernode_reachable[query] = seen
-  return False
+    if not _AddSources(pos, goal, seen_goals, new_goals):
+      goals.add(goal)
+  return goals
+
+
+def _Bits(bitset):
+  """Iterate over the indices of the bits set in an int."""
+  while bitset:
+    lowest = bitset & -bitset
+    yield lowest.bit_length() - 1
+    bitset ^= lowest
+
+
+class ReachabilityIndex(object):
+  """Reachability and dominator information about the supernodes of a CFG.
+
+  Supernode i (see Program._CompressGraph) is represented as the bit 1 << i,
+  and sets of supernodes as ints, so that questions about paths between
+  supernodes can be answered with a few bitwise operations.
+
+  Attributes:
+    predecessors: predecessors[i] is the set of supernodes with an edge to i.
+    ancestors: ancestors[i] is the set of supernodes from which i can be
+      reached in one or more steps.
+    descendants: descendants[i] is the set of supernodes that can be reached
+      from i in one or more steps.
+    dominators: dominators[i] is the set of supernodes that are on every path
+      from the entrypoint to i, including i itself.
+  """
+
+  def __init__(self, supernodes):
+    """Compute the index.
+
+    Arguments:
+      supernodes: A list of supernodes, each a list of CFGNodes with their
+        supernode_id set. The first supernode contains the entrypoint.
+    """
+    size = len(supernodes)
+    preds = [{n.supernode_id for n in supernode[0].incoming}
+             for supernode in supernodes]
+    succs = [{n.supernode_id for n in supernode[-1].outgoing}
+             for supernode in supernodes]
+    self.predecessors = [sum(1 << p for p in ps) for ps in preds]
+    order = self._ReversePostorder(succs)
+    self.ancestors = self._Closure(preds, order)
+    self.descendants = self._Closure(succs, order[::-1])
+    everything = (1 << size) - 1
+    dominators = [everything] * size
+    dominators[0] = 1
+    changed = True
+    while changed:
+      changed = False
+      for i in order[1:]:
+        dom = everything
+        for p in preds[i]:
+          dom &= dominators[p]
+        dom |= 1 << i
+        if dom != dominators[i]:
+          dominators[i] = dom
+          changed = True
+    self.dominators = dominators
+
+  def _ReversePostorder(self, succs):
+    """Order the supernodes so that most edges go forward."""
+    postorder = []
+    seen = {0}
+    stack = [(0, iter(succs[0]))]
+    while stack:
+      i, children = stack[-1]
+      for child in children:
+        if child not in seen:
+          seen.add(child)
+          stack.append((child, iter(succs[child])))
+          break
+      else:
+        stack.pop()
+        postorder.append(i)
+    return postorder[::-1]
+
+  def _Closure(self, edges, order):
+    """Compute the nodes reachable in one or more steps along the edges.
+
+    Arguments:
+      edges: edges[i] is the set of neighbors of supernode i.
+      order: The order in which to update the nodes. The computation converges
+        faster if neighbors are mostly updated first.
+
+    Returns:
+      A list of bitsets.
+    """
+    closure = [0] * len(edges)
+    changed = True
+    while changed:
+      changed = False
+      for i in order:
+        reachable = closure[i]
+        for j in edges[i]:
+          reachable |= closure[j] | 1 << j
+        if reachable != closure[i]:
+          closure[i] = reachable
+          changed = True
+    return closure
+
+
+class _BoundedCache(object):
+  """A cache with a size limit that keeps recently used entries.
+
+  This approximates LRU eviction with two generations of plain dicts: New
+  entries, and entries that are hit in the old generation, go into the young
+  generation. Once that is full, it becomes the old generation, and the
+  previous old generation is dropped. This keeps lookups as cheap as a dict
+  lookup, which matters for the solver's inner loop.
+  """
+
+  def __init__(self, max_size, metric):
+    """Initialize an empty cache.
+
+    Arguments:
+      max_size: The maximum number of entries. At least two.
+      metric: A metrics.MapCounter. We count "hit", "miss" and "evict" in it.
+    """
+    self._young_size = max(max_size // 2, 1)
+    self._young = {}
+    self._old = {}
+    self._metric = metric
+
+  def __len__(self):
+    return len(self._young) + len(self._old)
+
+  def get(self, key, default=None):
+    if key in self._young:
+      self._metric.inc("hit")
+      return self._young[key]
+    elif key in self._old:
+      self._metric.inc("hit")
+      value = self._old.pop(key)
+      self[key] = value
+      return value
+    else:
+      self._metric.inc("miss")
+      return default
+
+  def __setitem__(self, key, value):
+    if len(self._young) >= self._young_size:
+      if self._old:
+        self._metric.inc("evict", len(self._old))
+      self._old = self._young
+      self._young = {}
+    self._young[key] = value
 
 
 class Solver(object):
@@ -728,15 +1027,28 @@ class Solver(object):
 
   _cache_metric = metrics.MapCounter("cfg_solver_cache")
   _goals_per_find_metric = metrics.Distribution("cfg_solver_goals_per_find")
+  _find_query_metric = metrics.MapCounter("cfg_find_query_cache")
+  _supernode_query_metric = metrics.MapCounter("cfg_supernode_query_cache")
 
-  def __init__(self, program):
+  def __init__(self, program, max_find_queries=MAX_FIND_QUERIES,
+               max_supernode_queries=MAX_SUPERNODE_QUERIES):
     """Initialize a solver instance. Every instance has their own cache.
 
     Arguments:
       program: The program we're in.
+      max_find_queries: How many results of _FindNodeBackwards to remember.
+      max_supernode_queries: How many results of _FindSupernodeBackwards to
+        remember.
     """
     self.program = program
     self._solved_states = {}
+    # Map from (start, finish, blocked) to whether finish is reachable.
+    self._solved_find_queries = _BoundedCache(
+        max_find_queries, Solver._find_query_metric)
+    # Map from (start, finish, blocked_supernodes) to whether finish is
+    # reachable from start.
+    self._supernode_reachable = _BoundedCache(
+        max_supernode_queries, Solver._supernode_query_metric)
 
   def Solve(self, start_attrs, start_node):
     """Try to solve the given problem.
@@ -759,18 +1071,19 @@ class Solver(object):
 
   def _RecallOrFindSolution(self, state):
     """Memoized version of FindSolution()."""
-    if state in self._solved_states:
+    key = state.key
+    if key in self._solved_states:
       Solver._cache_metric.inc("hit")
-      return self._solved_states[state]
+      return self._solved_states[key]
 
     # To prevent infinite loops, we insert this state into the hashmap as a
     # solvable state, even though we have not solved it yet. The reasoning is
     # that if it's possible to solve this state at this level of the tree, it
     # can also be solved in any of the children.
-    self._solved_states[state] = True
+    self._solved_states[key] = True
 
     Solver._cache_metric.inc("miss")
-    result = self._solved_states[state] = self._FindSolution(state)
+    result = self._solved_states[key] = self._FindSolution(state)
     return result
 
   def _FindSolution(self, state):
@@ -792,15 +1105,110 @@ class Solver(object):
     for goal in state.goals:
       # "goal" is the assignment we're trying to find.
       for origin in goal.origins:
-        if _FindNodeBackwards(state.pos, origin.where, blocked):
+        if self._FindNodeBackwards(state.pos, origin.where, blocked):
           # This loop over multiple different combinations of origins is why
           # we need memoization of states.
           for source_set in origin.source_sets:
-            new_state = State(origin.where, state.goals)
-            new_state.Replace(goal, source_set)
-            # Also remove all goals that are trivially fulfilled at the
+            # This also removes all goals that are trivially fulfilled at the
             # new CFG node.
-            new_state.RemoveFinishedGoals()
+            new_state = state.Replace(goal, source_set, origin.where)
             if self._RecallOrFindSolution(new_state):
               return True
     return False
+
+  def _FindNodeBackwards(self, start, finish, blocked):
+    """Determine whether we can reach a CFG node, going backwards.
+
+    Traverse the CFG from a starting point to find a given node, but avoid any
+    nodes marked as "blocked".
+
+    Arguments:
+      start: Start node.
+      finish: Node we're looking for.
+      blocked: A set of blocked nodes. We do not consider start or finish to be
+        blocked even if they apppear in this set.
+
+    Returns:
+      True if we can find this node, False otherwise.
+    """
+    query = (start, finish, blocked)
+    found = self._solved_find_queries.get(query)
+    if found is not None:
+      return found
+    if (start.supernode is finish.supernode and
+        start.position >= finish.position):
+      # There is exactly one path from start to finish. Check whether any node
+      # in it is blocked.
+      if blocked.intersection(start.supernode[finish.position+1:
+                                              start.position]):
+        found = False
+      else:
+        found = True
+    elif blocked.intersection(
+        start.supernode[:start.position] +
+        finish.supernode[finish.position+1:]):
+      # A node that must be passed through to get from start to finish is
+      # blocked.
+      found = False
+    else:
+      blocked_supernodes = 0
+      for node in blocked:
+        blocked_supernodes |= 1 << node.supernode_id
+      found = self._FindSupernodeBackwards(
+          start.supernode_id, finish.supernode_id, blocked_supernodes)
+    self._solved_find_queries[query] = found
+    return found
+
+  def _FindSupernodeBackwards(self, start, finish, blocked_supernodes):
+    """Determine whether we can reach a supernode, going backwards.
+
+    Arguments:
+      start: The index of the supernode we're starting from.
+      finish: The index of the supernode we're looking for.
+      blocked_supernodes: The blocked supernodes, as a bitset.
+
+    Returns:
+      True if we can find finish from any of start's *incoming nodes*, False
+      otherwise. This means that if start and finish are in the same supernode,
+      we must find a path from the supernode back to itself.
+    """
+    index = self.program.reachability
+    finish_bit = 1 << finish
+    if not index.ancestors[start] & finish_bit:
+      return False
+    # The supernodes that can be passed through on the way from start to
+    # finish. Start and finish themselves can't block the path.
+    between = (index.ancestors[start] & index.descendants[finish] &
+               ~(finish_bit | 1 << start))
+    if not blocked_supernodes & between:
+      return True
+    # A node that dominates start, but not finish, is on every path from
+    # finish to start.
+    if (blocked_supernodes & index.dominators[start] &
+        ~(index.dominators[finish] | 1 << start)):
+      return False
+    # Only the blocked nodes between start and finish matter, so leave out the
+    # others from the query. That makes cache hits more likely.
+    blocked_supernodes &= between
+    query = (start, finish, blocked_supernodes)
+    found = self._supernode_reachable.get(query)
+    if found is not None:
+      return found
+    # Search backwards from start, but only through supernodes from which
+    # finish can be reached.
+    predecessors = index.predecessors
+    passable = between & ~blocked_supernodes
+    reachable = 0
+    frontier = predecessors[start]
+    found = False
+    while frontier:
+      if frontier & finish_bit:
+        found = True
+        break
+      frontier &= passable & ~reachable
+      reachable |= frontier
+      expand, frontier = frontier, 0
+      for i in _Bits(expand):
+        frontier |= predecessors[i]
+    self._supernode_reachable[query] = found
+    return found
@@ -1,5 +1,9 @@
 """Test for the cfg Python extension module."""
 
+import itertools
+import random
+
+from pytype import metrics
 from pytype.pytd import cfg
 import unittest
 
@@ -196,6 +200,54 @@ class CFGTest(unittest.TestCase):
     self.assertFalse(n4.HasCombination([xa, yb]))
     self.assertFalse(n4.HasCombination([xb, ya]))
 
+  def testFilterCombinations(self):
+    # n1------->n2
+    #  |        |
+    #  v        v
+    # n3------->n4
+    # [n2] x = a; y = a
+    # [n3] x = b; y = b
+    # [n4] z = c or d
+    p = cfg.Program()
+    n1 = p.NewCFGNode("n1")
+    n2 = n1.ConnectNew("n2")
+    n3 = n1.ConnectNew("n3")
+    n4 = n2.ConnectNew("n4")
+    n3.ConnectTo(n4)
+    x = p.NewVariable("x")
+    y = p.NewVariable("y")
+    z = p.NewVariable("z")
+    x.AddBinding("a", source_set=[], where=n2)
+    y.AddBinding("a", source_set=[], where=n2)
+    x.AddBinding("b", source_set=[], where=n3)
+    y.AddBinding("b", source_set=[], where=n3)
+    z.AddBinding("c", source_set=[], where=n4)
+    z.AddBinding("d", source_set=[], where=n4)
+    self._Freeze(p, entrypoint=n1)
+    combinations = list(itertools.product(x.bindings, y.bindings, z.bindings))
+    expected = [c for c in combinations if n4.HasCombination(c)]
+    self.assertEquals(4, len(expected))
+    self.assertEquals(expected, list(n4.FilterCombinations(combinations)))
+    # None of the bindings exist yet at n1.
+    self.assertEquals([], list(n1.FilterCombinations(combinations)))
+
+  def testFilterCombinationsLazily(self):
+    p = cfg.Program()
+    n1 = p.NewCFGNode("n1")
+    x = p.NewVariable("x")
+    a = x.AddBinding("a", source_set=[], where=n1)
+    b = x.AddBinding("b", source_set=[], where=n1)
+    self._Freeze(p, entrypoint=n1)
+    seen = []
+    def combinations():
+      for c in [[a], [a, b], [b]]:
+        seen.append(c)
+        yield c
+    possible = n1.FilterCombinations(combinations())
+    self.assertEquals([a], next(possible))
+    self.assertEquals([[a]], seen)
+    self.assertEquals([[b]], list(possible))
+
   def testConflicting(self):
     p = cfg.Program()
     n1 = p.NewCFGNode("n1")
@@ -439,6 +491,30 @@ class CFGTest(unittest.TestCase):
     self.assertRaises(AssertionError, p.NewCFGNode, "named")
     self.assertRaises(AssertionError, p.NewCFGNode, name="named")
 
+  def testProgramPrune(self):
+    p = cfg.Program()
+    n1 = p.NewCFGNode("n1")
+    n2 = n1.ConnectNew("n2")
+    source = p.NewVariable("source", [1], [], n1)
+    member = p.NewVariable("member", [2], [], n1)
+    temporary = p.NewVariable("temporary", [3, 4], [], n1)
+    x = p.NewVariable("x")
+    x.AddBinding({"member": member}, source_set=source.bindings, where=n2)
+    y = p.NewVariable("y")
+    y.AddBinding(5, source_set=[], where=n2)
+    def get_data_variables(data):
+      return data.values() if isinstance(data, dict) else []
+    metrics._prepare_for_test()
+    metric = cfg.Program._prune_metric
+    metric._reset()
+    self.assertEquals((2, 1), p.Prune([x, y.bindings[0]], get_data_variables))
+    self.assertEquals({source, member}, {b.variable for b in n1.bindings})
+    self.assertEquals({x, y}, {b.variable for b in n2.bindings})
+    self.assertEquals({"bindings": 2, "variables": 1}, metric._counts)
+    self.assertEquals(2, len(temporary.bindings))  # The variable itself stays.
+    self._Freeze(p, entrypoint=n1)
+    self.assertRaises(AssertionError, p.Prune, [x], get_data_variables)
+
   def testVariableCallback(self):
     counters = [0, 0]
     def callback1():
@@ -459,5 +535,182 @@ class CFGTest(unittest.TestCase):
     x.AddBinding("c")
     self.assertListEqual(counters, [2, 2])
 
+  def testInternSourceSets(self):
+    p = cfg.Program()
+    n1 = p.NewCFGNode("n1")
+    x = p.NewVariable("x")
+    a = x.AddBinding("a", source_set=[], where=n1)
+    b = x.AddBinding("b", source_set=[], where=n1)
+    y = p.NewVariable("y")
+    c = y.AddBinding("c", source_set=[a, b], where=n1)
+    c.AddOrigin(n1, {b, a})
+    d = y.AddBinding("d", source_set=[b, a], where=n1)
+    (source_set_c,), = [o.source_sets for o in c.origins]
+    (source_set_d,), = [o.source_sets for o in d.origins]
+    self.assertEquals(cfg.SourceSet([a, b]), source_set_c)
+    self.assertIs(source_set_c, source_set_d)
+    self.assertIs(a.origins[0].source_sets[0], b.origins[0].source_sets[0])
+
+  def testManyBindingsAndOrigins(self):
+    # Variables and bindings switch to dicts beyond _MAX_UNINDEXED entries.
+    p = cfg.Program()
+    nodes = [p.NewCFGNode("n%d" % i) for i in range(3 * cfg._MAX_UNINDEXED)]
+    x = p.NewVariable("x")
+    data = [object() for _ in nodes]
+    for i, node in enumerate(nodes):
+      self.assertIs(x.AddBinding(data[i], [], node), x.AddBinding(data[i]))
+      # Every binding of x so far also gets assigned at node.
+      for d in data[:i]:
+        x.AddBinding(d, [], node)
+    self.assertEquals(data, x.data)
+    self.assertEquals(set(nodes), x.nodes)
+    for i, binding in enumerate(x.bindings):
+      self.assertEquals(nodes[i:], [o.where for o in binding.origins])
+      for node in nodes:
+        origin = binding.FindOrigin(node)
+        self.assertEquals(node in nodes[i:], origin is not None)
+        if origin:
+          self.assertIs(node, origin.where)
+    self.assertItemsEqual(x.bindings, x.Bindings(nodes[-1]))
+
+  def testBoundedCache(self):
+    metrics._prepare_for_test()
+    metric = metrics.MapCounter("bounded_cache")
+    cache = cfg._BoundedCache(4, metric)
+    cache[1] = "a"
+    cache[2] = "b"
+    self.assertEquals("a", cache.get(1))
+    cache[3] = "c"
+    cache[4] = "d"
+    # Using 1 again makes it survive the eviction of 2.
+    self.assertEquals("a", cache.get(1))
+    cache[5] = "e"
+    self.assertEquals(4, len(cache))
+    self.assertIsNone(cache.get(2))
+    self.assertEquals("a", cache.get(1))
+    self.assertEquals({"hit": 3, "miss": 1, "evict": 1}, metric._counts)
+
+  def testSolverCachesPerProgram(self):
+    for _ in range(2):
+      p = cfg.Program()
+      n1 = p.NewCFGNode("n1")
+      n2 = n1.ConnectNew("n2")
+      n3 = n1.ConnectNew("n3")
+      n4 = n2.ConnectNew("n4")
+      n3.ConnectTo(n4)
+      x = p.NewVariable("x")
+      x1 = x.AddBinding("x1", source_set=[], where=n2)
+      x2 = x.AddBinding("x2", source_set=[], where=n3)
+      self._Freeze(p, entrypoint=n1)
+      p.solver = cfg.Solver(p, max_find_queries=2, max_supernode_queries=2)
+      self.assertTrue(n4.HasCombination([x1]))
+      self.assertTrue(n4.HasCombination([x2]))
+      self.assertFalse(n2.HasCombination([x2]))
+      self.assertLessEqual(len(p.solver._solved_find_queries), 2)
+  def testState(self):
+    p = cfg.Program()
+    n1 = p.NewCFGNode("n1")
+    n2 = n1.ConnectNew("n2")
+    x = p.NewVariable("x")
+    y = p.NewVariable("y")
+    x1 = x.AddBinding("1", source_set=[], where=n1)
+    x2 = x.AddBinding("2", source_set=[], where=n2)
+    y1 = y.AddBinding("1", source_set=[x1], where=n2)
+    state = cfg.State(n2, [y1, x2])
+    self.assertEquals(cfg.State(n2, {x2, y1}), state)
+    self.assertEquals(hash(cfg.State(n2, {x2, y1})), hash(state))
+    self.assertNotEquals(cfg.State(n1, [y1, x2]), state)
+    self.assertEquals((n2.id, tuple(sorted([x2.id, y1.id]))), state.key)
+    self.assertFalse(state.HasConflictingGoals())
+    self.assertTrue(cfg.State(n2, [x1, x2, y1]).HasConflictingGoals())
+    self.assertEquals({n1, n2}, state.NodesWithAssignments())
+    # x2 is assigned at n2, without sources, so it's removed right away.
+    new_state = state.Replace(y1, [x1], n2)
+    self.assertEquals(cfg.State(n2, [x1]), new_state)
+
+  def _FindNodeBackwardsSlow(self, start, finish, blocked):
+    """Reference implementation of Solver._FindNodeBackwards."""
+    stack = list(start.incoming)
+    seen = set()
+    while stack:
+      node = stack.pop()
+      if node is finish:
+        return True
+      if node in seen or node in blocked:
+        continue
+      seen.add(node)
+      stack.extend(node.incoming)
+    return start is finish
+
+  def testReachabilityIndex(self):
+    rand = random.Random(42)
+    for _ in range(20):
+      p = cfg.Program()
+      nodes = [p.NewCFGNode("n0")]
+      for i in range(1, 30):
+        # Mostly chains, with some diamonds and loops.
+        node = p.NewCFGNode("n%d" % i)
+        rand.choice(nodes[-3:]).ConnectTo(node)
+        if rand.random() < 0.2:
+          rand.choice(nodes).ConnectTo(node)
+        if rand.random() < 0.1:
+          node.ConnectTo(rand.choice(nodes))
+        nodes.append(node)
+      self._Freeze(p, entrypoint=nodes[0])
+      for _ in range(100):
+        start = rand.choice(nodes)
+        finish = rand.choice(nodes)
+        blocked = frozenset(rand.sample(nodes, rand.randint(0, 5)))
+        self.assertEquals(
+            self._FindNodeBackwardsSlow(start, finish, blocked - {start}),
+            p.solver._FindNodeBackwards(start, finish, blocked),
+            (start, finish, blocked))
+
+  def testIsReachableFrom(self):
+    # n1 -> n2 -> n3 <-> n4
+    #        |
+    #         -> n5
+    p = cfg.Program()
+    n1 = p.NewCFGNode("n1")
+    n2 = n1.ConnectNew("n2")
+    n3 = p.NewCFGNode("n3")
+    n4 = n3.ConnectNew("n4")
+    n4.ConnectTo(n3)
+    n2.ConnectTo(n3)
+    n5 = n2.ConnectNew("n5")
+    # n3 was connected to n4 before it had incoming edges.
+    self.assertFalse(n4.IsReachableFrom(n1))
+    self._Freeze(p, entrypoint=n1)
+    self.assertTrue(all(n.reachable_subset is None for n in p.cfg_nodes))
+    reachable = {(n1, n1), (n2, n2), (n5, n5), (n1, n2), (n1, n5), (n2, n5)}
+    for start in (n1, n2):
+      for loop in (n3, n4):
+        reachable.add((start, loop))
+    for start in (n3, n4):
+      for loop in (n3, n4):
+        reachable.add((start, loop))
+    for start in p.cfg_nodes:
+      for finish in p.cfg_nodes:
+        self.assertEquals((start, finish) in reachable,
+                          finish.IsReachableFrom(start), (start, finish))
+
+  def testDominators(self):
+    p = cfg.Program()
+    n1 = p.NewCFGNode("n1")
+    n2 = n1.ConnectNew("n2")
+    n3 = n1.ConnectNew("n3")
+    n4 = n2.ConnectNew("n4")
+    n3.ConnectTo(n4)
+    n5 = n4.ConnectNew("n5")
+    n6 = n4.ConnectNew("n6")
+    self._Freeze(p, entrypoint=n1)
+    index = p.reachability
+    def Nodes(bitset):
+      return {n for n in p.cfg_nodes if bitset & 1 << n.supernode_id}
+    self.assertEquals({n1, n4}, Nodes(index.dominators[n4.supernode_id]))
+    self.assertEquals({n1, n2, n3}, Nodes(index.ancestors[n4.supernode_id]))
+    self.assertEquals({n5, n6}, Nodes(index.descendants[n4.supernode_id]))
+
+
 if __name__ == "__main__":
   unittest.main()
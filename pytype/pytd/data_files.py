@@ -19,6 +19,10 @@
 import os
 
 
+# Absolute, since the analysis server (server.py) changes directories.
+_DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
 def GetPredefinedFile(pytd_subdir, module, extension=".pytd"):
   """Get the contents of a predefined PyTD, typically with a file name *.pytd.
 
@@ -31,7 +35,7 @@ def GetPredefinedFile(pytd_subdir, module, extension=".pytd"):
   Raises:
     IOError: if file not found
   """
-  path = os.path.join(os.path.dirname(__file__),
-                      pytd_subdir, os.path.join(*module.split(".")) + extension)
+  path = os.path.join(_DATA_DIR, pytd_subdir,
+                      os.path.join(*module.split(".")) + extension)
   with open(path, "rb") as fi:
     return fi.read()
@@ -13,7 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import imp
+import os
+import sys
 import textwrap
+from pytype import utils
 from pytype.pytd import pytd
 from pytype.pytd.parse import decorate
 from pytype.pytd.parse import parser
@@ -1338,5 +1342,49 @@ class TestDecorate(unittest.TestCase):
     tree.value.Test()
 
 
+
+class TestParser(unittest.TestCase):
+
+  def testLineNumbersOfConsecutiveParses(self):
+    for _ in range(2):
+      with self.assertRaises(parser.ParseError) as ctx:
+        parser.parse_string("x = ...  # type: int\ndef f(x:) -> int\n")
+      self.assertEquals(2, ctx.exception.lineno)
+
+  def testSeparateParsers(self):
+    p1 = parser.TypeDeclParser()
+    p2 = parser.TypeDeclParser()
+    self.assertEquals("x = ...  # type: int",
+                      pytd.Print(p1.Parse("x = ...  # type: int")))
+    self.assertEquals("y = ...  # type: str",
+                      pytd.Print(p2.Parse("y = ...  # type: str")))
+
+  def testGenerateTables(self):
+    with utils.Tempdir() as d:
+      parser.generate_tables(d.path)
+      self.assertItemsEqual(["pyi_lextab.py", "pyi_parsetab.py"],
+                            os.listdir(d.path))
+      parsetab = imp.load_source("parsetab", d["pyi_parsetab.py"])
+      self.assertTrue(parsetab._lr_action)  # pylint: disable=protected-access
+
+  def testOutdatedLexerTables(self):
+    # pylint: disable=protected-access
+    with utils.Tempdir() as d:
+      parser.generate_tables(d.path)
+      lextab = imp.load_source("pyi_lextab", d["pyi_lextab.py"])
+      self.assertEquals(parser._lexer_signature(), lextab._signature)
+      # Pretend that the tables are from a version of pytype without tokens.
+      lextab._signature = "outdated"
+      lextab._lexstatere = {"INITIAL": []}
+      pyi_lextab, parser.pyi_lextab = parser.pyi_lextab, lextab
+      try:
+        p = parser.TypeDeclParser()
+      finally:
+        parser.pyi_lextab = pyi_lextab
+        del sys.modules["pyi_lextab"]
+      self.assertEquals("x = ...  # type: int",
+                        pytd.Print(p.Parse("x = ...  # type: int")))
+
+
 if __name__ == "__main__":
   unittest.main()
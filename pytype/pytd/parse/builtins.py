@@ -17,11 +17,23 @@
 
 """Utilities for parsing pytd files for builtins."""
 
+import cPickle
+import cStringIO
+import logging
 
+from pytype import utils as pytype_utils
 from pytype.pytd import data_files
+from pytype.pytd import pytd
 from pytype.pytd.parse import parser
 from pytype.pytd.parse import visitors
 
+log = logging.getLogger(__name__)
+
+# The name of the file, next to __builtin__.pytd, that stores the resolved
+# builtins and typing, as written by Precompile.
+_PRECOMPILED = "precompiled"
+_PRECOMPILED_EXTENSION = ".pickle"
+
 
 def _FindBuiltinFile(name, extension=".pytd"):
   return data_files.GetPredefinedFile("builtins", name, extension)
@@ -35,28 +47,109 @@ def _FindStdlibFile(name, extension=".pytd"):
 _cached_builtins_pytd = None  # ... => pytype.pytd.pytd.TypeDeclUnit
 
 
+def _ParseBuiltinsAndTyping():
+  """Parse __builtin__.pytd and typing.pytd, and resolve all types in them."""
+  t = parser.parse_string(_FindStdlibFile("typing"), name="typing")
+  t = t.Visit(visitors.AddNamePrefix("typing."))
+  b = parser.parse_string(_FindBuiltinFile("__builtin__"), name="__builtin__")
+  b = b.Visit(visitors.AddNamePrefix("__builtin__."))
+  b = b.Visit(visitors.NamedTypeToClassType())
+  b = b.Visit(visitors.LookupExternalTypes({"typing": t}, full_names=True))
+  t = t.Visit(visitors.LookupBuiltins(b))
+  t = t.Visit(visitors.NamedTypeToClassType())
+  b.Visit(visitors.FillInModuleClasses({"": b, "typing": t,
+                                        "__builtin__": b}))
+  t.Visit(visitors.FillInModuleClasses({"": t, "typing": t,
+                                        "__builtin__": b}))
+  b.Visit(visitors.VerifyNoExternalTypes())
+  t.Visit(visitors.VerifyNoExternalTypes())
+  b.Visit(visitors.VerifyLookup())
+  t.Visit(visitors.VerifyLookup())
+  return b, t
+
+
+def _PrecompiledVersion():
+  """The version of the precompiled file that this pytype can use."""
+  # The fingerprint covers __builtin__.pytd and typing.pytd, as well as the
+  # code that parses them and the node classes that get pickled.
+  return pytype_utils.pytype_fingerprint()
+
+
+def Precompile(filename):
+  """Write the resolved __builtin__.pytd and typing.pytd to a file.
+
+  Loading this file is much faster than parsing and resolving the two pytd
+  files, which GetBuiltinsAndTyping would otherwise do in every process. This
+  is called by setup.py when building pytype, with the builtins directory in
+  the build tree.
+
+  Args:
+    filename: The file to write to.
+  """
+  b, t = _ParseBuiltinsAndTyping()
+  asts = (b, t)
+  # Pickling ClassType.cls would recurse into classes that contain the very
+  # ClassType being pickled, so we store where in b and t the class is instead.
+  positions = {id(cls): (i, j)
+               for i, ast in enumerate(asts)
+               for j, cls in enumerate(ast.classes)}
+  def PersistentId(obj):
+    if isinstance(obj, pytd.ClassType):
+      return obj.name, positions[id(obj.cls)]
+    return None
+  with open(filename, "wb") as fi:
+    pickler = cPickle.Pickler(fi, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = PersistentId
+    pickler.dump(_PrecompiledVersion())
+    pickler.dump(asts)
+
+
+def _LoadPrecompiled(data):
+  """Load __builtin__.pytd and typing.pytd, as written by Precompile.
+
+  Args:
+    data: The contents of the file written by Precompile.
+
+  Returns:
+    A tuple of builtins and typing, or None if the data is from a different
+    version of pytype, or broken.
+  """
+  class_types = []
+  def PersistentLoad(pid):
+    name, position = pid
+    class_type = pytd.ClassType(name)
+    class_types.append((class_type, position))
+    return class_type
+  unpickler = cPickle.Unpickler(cStringIO.StringIO(data))
+  unpickler.persistent_load = PersistentLoad
+  try:
+    if unpickler.load() != _PrecompiledVersion():
+      log.info("Ignoring %s%s from a different version of pytype",
+               _PRECOMPILED, _PRECOMPILED_EXTENSION)
+      return None
+    asts = unpickler.load()
+    for class_type, (i, j) in class_types:
+      class_type.cls = asts[i].classes[j]
+  except Exception as e:  # pylint: disable=broad-except
+    log.warning("Ignoring broken %s%s: %s", _PRECOMPILED,
+                _PRECOMPILED_EXTENSION, e)
+    return None
+  return asts
+
+
 def GetBuiltinsAndTyping():
   """Get __builtin__.pytd and typing.pytd."""
   global _cached_builtins_pytd
   if not _cached_builtins_pytd:
-    t = parser.TypeDeclParser().Parse(_FindStdlibFile("typing"), name="typing")
-    t = t.Visit(visitors.AddNamePrefix("typing."))
-    b = parser.TypeDeclParser().Parse(_FindBuiltinFile("__builtin__"),
-                                      name="__builtin__")
-    b = b.Visit(visitors.AddNamePrefix("__builtin__."))
-    b = b.Visit(visitors.NamedTypeToClassType())
-    b = b.Visit(visitors.LookupExternalTypes({"typing": t}, full_names=True))
-    t = t.Visit(visitors.LookupBuiltins(b))
-    t = t.Visit(visitors.NamedTypeToClassType())
-    b.Visit(visitors.FillInModuleClasses({"": b, "typing": t,
-                                          "__builtin__": b}))
-    t.Visit(visitors.FillInModuleClasses({"": t, "typing": t,
-                                          "__builtin__": b}))
-    b.Visit(visitors.VerifyNoExternalTypes())
-    t.Visit(visitors.VerifyNoExternalTypes())
-    b.Visit(visitors.VerifyLookup())
-    t.Visit(visitors.VerifyLookup())
-    _cached_builtins_pytd = b, t
+    try:
+      data = data_files.GetPredefinedFile("builtins", _PRECOMPILED,
+                                          _PRECOMPILED_EXTENSION)
+    except IOError:
+      data = None
+    asts = data and _LoadPrecompiled(data)
+    if asts is None:
+      asts = _ParseBuiltinsAndTyping()
+    _cached_builtins_pytd = asts
   return _cached_builtins_pytd
 
 
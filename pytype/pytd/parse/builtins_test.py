@@ -1,5 +1,8 @@
 """Tests for pytype.pytd.parse.builtins."""
 
+import os
+
+from pytype import utils
 from pytype.pytd import pytd
 from pytype.pytd.parse import builtins
 from pytype.pytd.parse import visitors
@@ -34,5 +37,48 @@ class UtilsTest(unittest.TestCase):
     self.assertEquals(cls.parents, ())
 
 
+class PrecompiledTest(unittest.TestCase):
+  """Tests for the precompiled builtins."""
+
+  # pylint: disable=protected-access
+
+  def precompile(self):
+    with utils.Tempdir() as d:
+      filename = os.path.join(d.path, "precompiled.pickle")
+      builtins.Precompile(filename)
+      with open(filename, "rb") as fi:
+        return fi.read()
+
+  def testLoad(self):
+    b, t = builtins._LoadPrecompiled(self.precompile())
+    expected_b, expected_t = builtins._ParseBuiltinsAndTyping()
+    self.assertMultiLineEqual(pytd.Print(expected_b), pytd.Print(b))
+    self.assertMultiLineEqual(pytd.Print(expected_t), pytd.Print(t))
+    # Will throw an error for unresolved class types:
+    b.Visit(visitors.VerifyLookup())
+    t.Visit(visitors.VerifyLookup())
+
+  def testClassPointers(self):
+    b, t = builtins._LoadPrecompiled(self.precompile())
+    int_cls = b.Lookup("__builtin__.int")
+    self.assertIs(int_cls, int_cls.Lookup("__abs__").signatures[0]
+                  .return_type.cls)
+    self.assertIs(b.Lookup("__builtin__.object"), int_cls.parents[0].cls)
+    parent, = t.Lookup("typing.List").parents
+    self.assertIs(t.Lookup("typing.MutableSequence"), parent.cls)
+
+  def testDifferentVersion(self):
+    data = self.precompile()
+    fingerprint = utils.pytype_fingerprint()
+    self.assertIn(fingerprint, data)
+    data = data.replace(fingerprint, "0" * len(fingerprint))
+    self.assertIsNone(builtins._LoadPrecompiled(data))
+
+  def testBrokenData(self):
+    self.assertIsNone(builtins._LoadPrecompiled("garbage"))
+    data = self.precompile()
+    self.assertIsNone(builtins._LoadPrecompiled(data[:len(data) // 2]))
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -27,6 +27,8 @@
 
 import collections
 import hashlib
+import os
+import threading
 import traceback
 from ply import lex
 from ply import yacc
@@ -38,6 +40,19 @@ from pytype.pytd.parse import visitors
 
 DEFAULT_VERSION = (2, 7, 6)
 
+# The modules with the lexer and parser tables. setup.py generates them when
+# building pytype, see generate_tables(). If they don't exist, e.g. when running
+# from a source checkout, the tables are computed when creating a parser.
+_LEXTAB = "pyi_lextab"
+_PARSETAB = "pyi_parsetab"
+
+try:
+  # pylint: disable=g-import-not-at-top
+  from pytype.pytd.parse import pyi_lextab
+  # pylint: enable=g-import-not-at-top
+except ImportError:
+  pyi_lextab = None
+
 
 class ParseError(Exception):
   """Exception for representing parse errors."""
@@ -64,10 +79,15 @@ class PyLexer(object):
   """Lexer for type declaration language."""
 
   def __init__(self):
-    # TODO(pludemann): See comments with TypeDeclParser about generating the
-    #                  $GENFILESDIR/pytypedecl_lexer.py and using it by
-    #                  calling lex.lex(lextab=pytypedecl_lexer)
-    self.lexer = lex.lex(module=self, debug=False)
+    # With optimize=True, ply loads the lexer tables from _LEXTAB without
+    # checking them against our token definitions, so we only do that if
+    # generate_tables() recorded the same definitions as we have now.
+    if (pyi_lextab and
+        getattr(pyi_lextab, "_signature", None) == _lexer_signature()):
+      self.lexer = lex.lex(module=self, debug=False, optimize=True,
+                           lextab=pyi_lextab.__name__)
+    else:
+      self.lexer = lex.lex(module=self, debug=False)
     self.default_get_token = self.lexer.token
     # TODO(kramm): Is there a better way to use a custom lexer.token() function?
     self.lexer.token = self.get_token
@@ -76,6 +96,7 @@ class PyLexer(object):
   def set_parse_info(self, src, filename):
     self.src = src
     self.filename = filename
+    self.lexer.lineno = 1
     self.indent_stack = [0]
     self.open_brackets = 0
     self.queued_dedents = 0
@@ -281,6 +302,19 @@ class PyLexer(object):
     make_syntax_error(self, "Illegal character '%s'" % t.value[0], t)
 
 
+def _lexer_signature():
+  """Compute a hash of everything in PyLexer that goes into the lexer tables."""
+  rules = []
+  for name, value in sorted(vars(PyLexer).items()):
+    if name.startswith("t_"):
+      if callable(value):
+        # ply orders the function rules by their line number.
+        rules.append((name, value.__doc__, value.func_code.co_firstlineno))
+      else:
+        rules.append((name, value))
+  return hashlib.md5(repr((PyLexer.tokens, rules))).hexdigest()
+
+
 Params = collections.namedtuple("_", ["required", "has_optional"])
 NameAndSig = collections.namedtuple("_", ["name", "signature",
                                           "decorators", "external_code"])
@@ -403,23 +437,20 @@ class TypeDeclParser(object):
                E.g. (3,4,0).
       kwargs: Additional parameters to pass to yacc.yacc().
     """
-    # TODO(pludemann): Don't generate the lex/yacc tables each time. This should
-    #                  be done by a separate program that imports this module
-    #                  and calls yacc.yacc(write_tables=True,
-    #                  outputdir=$GENFILESDIR, tabmodule='pytypedecl_parser')
-    #                  and similar params for lex.lex(...).  Then:
-    #                    import pytypdecl_parser
-    #                    self.parser = yacc.yacc(tabmodule=pytypedecl_parser)
-    #                  [might also need optimize=True]
     self.lexer = PyLexer()
     self.tokens = self.lexer.tokens
     self.python_version = version or DEFAULT_VERSION
 
+    # If the tables in _PARSETAB exist and match the grammar, ply loads them
+    # instead of computing them. ply checks whether they match even with
+    # optimize=True, so that doesn't save any time, but it would make us use
+    # outdated tables.
     self.parser = yacc.yacc(
         start="start",  # warning: ply ignores this
         module=self,
         debug=False,
         write_tables=False,
+        tabmodule="pytype.pytd.parse." + _PARSETAB,
         # debuglog=yacc.PlyLogger(sys.stderr),
         # errorlog=yacc.NullLogger(),  # If you really want to suppress messages
         **kwargs)
@@ -435,7 +466,8 @@ class TypeDeclParser(object):
     self.aliases.update({name: pytd.ExternalType(name, "typing")
                          for name in pep484.PEP484_NAMES})
     self.lexer.set_parse_info(self.src, self.filename)
-    ast = self.parser.parse(src, **kwargs)
+    # Without an explicit lexer, ply uses the lexer created last.
+    ast = self.parser.parse(src, lexer=self.lexer.lexer, **kwargs)
     # If there's no unique name, hash the sourcecode.
     name = name or hashlib.md5(src).hexdigest()
     ast = ast.Visit(InsertTypeParameters())
@@ -1391,11 +1423,40 @@ def make_syntax_error(parser_or_tokenizer, msg, p):
   raise ParseError(msg, parser_or_tokenizer.filename, lineno, column, line)
 
 
+# The parser used by parse_string. Creating a parser is expensive, so all
+# parsing in a process shares this one. A parser can't be used by two threads
+# at the same time, hence the lock.
+_parser = None
+_parser_lock = threading.Lock()
+
+
 def parse_string(string, name=None, filename=None,
                  python_version=DEFAULT_VERSION):
-  return TypeDeclParser(python_version).Parse(string, name, filename)
+  global _parser
+  with _parser_lock:
+    if _parser is None:
+      _parser = TypeDeclParser()
+    _parser.python_version = python_version
+    return _parser.Parse(string, name, filename)
 
 
 def parse_file(filename, name=None, python_version=DEFAULT_VERSION):
   with open(filename) as f:
     return parse_string(f.read(), name, filename, python_version)
+
+
+def generate_tables(outputdir):
+  """Write the lexer and parser tables, as Python modules, to outputdir.
+
+  This is called by setup.py when building pytype, with the directory of this
+  package in the build tree as outputdir.
+
+  Args:
+    outputdir: The directory to write the modules to.
+  """
+  lexer = lex.lex(module=PyLexer(), debug=False)
+  lexer.writetab(_LEXTAB, outputdir)
+  with open(os.path.join(outputdir, _LEXTAB + ".py"), "a") as f:
+    f.write("_signature = %r\n" % _lexer_signature())
+  yacc.yacc(start="start", module=TypeDeclParser(), debug=False,
+            write_tables=True, tabmodule=_PARSETAB, outputdir=outputdir)
@@ -31,8 +31,8 @@ class ParserTest(unittest.TestCase):
     self.parser = parser.TypeDeclParser()
 
   def Parse(self, src, version=None):
-    # TODO(kramm): Using self.parser here breaks tests. Why?
-    tree = parser.TypeDeclParser(version=version).Parse(textwrap.dedent(src))
+    tree = parser.parse_string(textwrap.dedent(src),
+                               python_version=version or parser.DEFAULT_VERSION)
     tree.Visit(visitors.VerifyVisitor())
     return tree
 
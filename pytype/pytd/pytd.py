@@ -329,6 +329,10 @@ class ExternalType(node.Node('name')):
     self.module = module
     return self
 
+  def __getnewargs__(self):
+    # Needed to pickle (and unpickle) this node with protocol 2.
+    return self.name, self.module
+
   def __str__(self):
     return self.module + '.' + self.name
 
@@ -6,11 +6,14 @@ import os
 from pytype.pytd import utils
 
 
+_PYTD_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
 def get_typeshed_dir():
   """Get the default typeshed location."""
   ret = os.getenv("TYPESHED_HOME")
   if ret is None:
-    ret = os.path.join(os.path.dirname(__file__), "..", "typeshed")
+    ret = os.path.join(_PYTD_DIR, "..", "typeshed")
 
   if not os.path.isdir(ret):
     raise IOError("No typeshed directory %s" % ret)
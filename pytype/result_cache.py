@@ -0,0 +1,169 @@
+"""Cache for the results of analyzing a file.
+
+A result (the generated pyi, and the errors) is a function of the source file,
+the options, pytype itself, and the pyi files that were imported during the
+analysis. The latter are only known after the analysis, so we store results in
+two steps, the same way ccache's "direct mode" does:
+
+  1. Under a key computed from everything we know upfront (source, options,
+     pytype version, ...), we store a "manifest": a list of the dependencies
+     (see load_pytd.record_dependencies) that earlier analyses had.
+  2. Under the key from step 1, extended with the dependencies, we store the
+     result itself.
+
+On lookup, a manifest entry whose files are all still in the recorded state
+leads us to the result.
+"""
+
+import json
+import logging
+import os
+
+from pytype import disk_cache
+from pytype import load_pytd
+from pytype import metrics
+from pytype import utils
+from pytype.pytd import typeshed
+
+
+log = logging.getLogger(__name__)
+
+
+# Options that don't influence the result of analyzing a single file.
+_IGNORED_OPTIONS = frozenset([
+    "basic_logging_level", "cache_dir", "cache_max_size", "input_filenames",
+    "jobs", "metrics", "output", "profile", "src_out", "verbosity",
+])
+
+# How many different sets of dependencies to remember for one source file.
+MAX_MANIFEST_ENTRIES = 8
+
+_cache_metric = metrics.MapCounter("result_cache")
+
+
+def _canonical(value):
+  """Turn dicts and sets into sorted lists, for use in a JSON key."""
+  if isinstance(value, dict):
+    return sorted((k, _canonical(v)) for k, v in value.items())
+  elif isinstance(value, (set, frozenset)):
+    return sorted(_canonical(v) for v in value)
+  elif isinstance(value, (list, tuple)):
+    return [_canonical(v) for v in value]
+  else:
+    return value
+
+
+def _file_hash(filename):
+  if not filename:
+    return None
+  return load_pytd.file_state(filename)
+
+
+def _typeshed_dir(options):
+  if not options.typeshed:
+    return None
+  try:
+    return os.path.abspath(typeshed.get_typeshed_dir())
+  except IOError:
+    return None
+
+
+def can_cache(options):
+  """Whether the results of a run with these options can be cached."""
+  # Debug output is written as a side effect of the analysis.
+  return bool(options.cache_dir and not options.output_cfg and
+              not options.output_typegraph and not options.output_debug)
+
+
+class Result(object):
+  """The result of analyzing a file.
+
+  Attributes:
+    pyi: The generated pyi, as a str. None when checking.
+    errors: The errors, as returned by errors.ErrorLog.dump_errors().
+  """
+
+  def __init__(self, pyi, errors):
+    self.pyi = pyi
+    self.errors = errors
+
+
+class ResultCache(object):
+  """Lookup and storage of analysis results of a single file.
+
+  Attributes:
+    key: The part of the cache key that doesn't depend on the imported files.
+  """
+
+  def __init__(self, input_filename, output_filename, options):
+    self._cache = disk_cache.get_cache(options, "results")
+    option_values = sorted(
+        (name, _canonical(value)) for name, value in vars(options).items()
+        if not name.startswith("_") and name not in _IGNORED_OPTIONS)
+    self.key = json.dumps([
+        utils.pytype_fingerprint(),
+        os.getcwd(),
+        input_filename,
+        output_filename,
+        _file_hash(input_filename),
+        # When checking, the output is an input.
+        _file_hash(output_filename) if options.check else None,
+        _file_hash(options.pybuiltins_filename),
+        _typeshed_dir(options),
+        option_values,
+    ])
+
+  def _get_json(self, key):
+    data = self._cache.get(key)
+    if data is None:
+      return None
+    try:
+      return json.loads(data)
+    except ValueError:
+      log.warning("Ignoring corrupted cache entry for %r", key)
+      return None
+
+  def _result_key(self, dependencies):
+    return json.dumps(["result", self.key, _canonical(dependencies)])
+
+  def lookup(self):
+    """Return the cached Result, or None if there isn't one."""
+    manifest = self._get_json(json.dumps(["manifest", self.key])) or []
+    states = {}
+    for dependencies in manifest:
+      for path, state in dependencies.items():
+        if path not in states:
+          states[path] = load_pytd.file_state(path)
+        if states[path] != state:
+          break
+      else:
+        result = self._get_json(self._result_key(dependencies))
+        if result is not None:
+          _cache_metric.inc("hit")
+          pyi = result["pyi"]
+          return Result(pyi.encode("utf-8") if pyi is not None else None,
+                        result["errors"])
+    _cache_metric.inc("miss")
+    return None
+
+  def store(self, dependencies, result):
+    """Store a Result.
+
+    Args:
+      dependencies: The files the analysis looked at, as recorded by
+        load_pytd.record_dependencies.
+      result: A Result.
+    """
+    try:
+      data = json.dumps({"pyi": result.pyi, "errors": result.errors})
+    except UnicodeDecodeError:
+      log.warning("Not caching result with non-UTF-8 output")
+      return
+    self._cache.put(self._result_key(dependencies), data)
+    manifest_key = json.dumps(["manifest", self.key])
+    manifest = self._get_json(manifest_key) or []
+    # The strings in the loaded manifest are unicode, but compare equal to
+    # their str counterparts, so this removes duplicates.
+    manifest = [dependencies] + [d for d in manifest if d != dependencies]
+    self._cache.put(manifest_key,
+                    json.dumps(manifest[:MAX_MANIFEST_ENTRIES]))
@@ -0,0 +1,132 @@
+"""Tests for result_cache.py."""
+
+import os
+
+from pytype import config
+from pytype import errors
+from pytype import load_pytd
+from pytype import main
+from pytype import result_cache
+from pytype import utils
+
+import unittest
+
+
+class ResultCacheTest(unittest.TestCase):
+  """Tests for result_cache.ResultCache."""
+
+  def setUp(self):
+    self.options = config.Options.create()
+
+  def _cache(self, d, input_filename):
+    self.options.tweak(cache_dir=os.path.join(d.path, "cache"))
+    return result_cache.ResultCache(input_filename, "-", self.options)
+
+  def testLookupStore(self):
+    with utils.Tempdir() as d:
+      src = d.create_file("foo.py", "import bar")
+      dep = d.create_file("bar.pyi", "x = ...  # type: int")
+      cache = self._cache(d, src)
+      self.assertIsNone(cache.lookup())
+      dependencies = {dep: load_pytd.file_state(dep),
+                      os.path.join(d.path, "baz.pyi"): None}
+      cache.store(dependencies, result_cache.Result("x = ...  # type: int\n",
+                                                    []))
+      result = self._cache(d, src).lookup()
+      self.assertEquals("x = ...  # type: int\n", result.pyi)
+      self.assertIsInstance(result.pyi, str)
+      self.assertEquals([], result.errors)
+
+  def testDependencyChanged(self):
+    with utils.Tempdir() as d:
+      src = d.create_file("foo.py", "import bar")
+      dep = d.create_file("bar.pyi", "x = ...  # type: int")
+      missing = os.path.join(d.path, "baz.pyi")
+      cache = self._cache(d, src)
+      cache.store({dep: load_pytd.file_state(dep), missing: None},
+                  result_cache.Result("", []))
+      d.create_file("baz.pyi")
+      self.assertIsNone(self._cache(d, src).lookup())
+      os.unlink(missing)
+      self.assertIsNotNone(self._cache(d, src).lookup())
+      d.create_file("bar.pyi", "x = ...  # type: str")
+      self.assertIsNone(self._cache(d, src).lookup())
+
+  def testSeveralManifestEntries(self):
+    with utils.Tempdir() as d:
+      src = d.create_file("foo.py", "import bar")
+      dep = d.create_file("bar.pyi", "x = ...  # type: int")
+      cache = self._cache(d, src)
+      cache.store({dep: load_pytd.file_state(dep)},
+                  result_cache.Result("int", []))
+      d.create_file("bar.pyi", "x = ...  # type: str")
+      cache.store({dep: load_pytd.file_state(dep)},
+                  result_cache.Result("str", []))
+      self.assertEquals("str", self._cache(d, src).lookup().pyi)
+      d.create_file("bar.pyi", "x = ...  # type: int")
+      self.assertEquals("int", self._cache(d, src).lookup().pyi)
+
+  def testKey(self):
+    with utils.Tempdir() as d:
+      src = d.create_file("foo.py", "x = 3")
+      self._cache(d, src).store({}, result_cache.Result("", []))
+      self.assertIsNotNone(self._cache(d, src).lookup())
+      self.options.tweak(jobs=2, verbosity=3)
+      self.assertIsNotNone(self._cache(d, src).lookup())
+      self.options.tweak(quick=True)
+      self.assertIsNone(self._cache(d, src).lookup())
+      self.options.tweak(quick=False)
+      d.create_file("foo.py", "x = 4")
+      self.assertIsNone(self._cache(d, src).lookup())
+
+  def testCanCache(self):
+    self.assertFalse(result_cache.can_cache(self.options))
+    self.options.tweak(cache_dir="cache")
+    self.assertTrue(result_cache.can_cache(self.options))
+    self.options.tweak(output_debug="-")
+    self.assertFalse(result_cache.can_cache(self.options))
+
+  def testAnalyzeOneFile(self):
+    with utils.Tempdir() as d:
+      src = d.create_file("foo.py", "import bar\ny = bar.x\nz = undefined\n")
+      d.create_file("bar.pyi", "x = ...  # type: int")
+      out = os.path.join(d.path, "foo.pyi")
+      self.options.tweak(cache_dir=os.path.join(d.path, "cache"),
+                         pythonpath=[d.path])
+      errorlog = main.analyze_one_file(src, out, self.options)
+      with open(out) as fi:
+        pyi = fi.read()
+      os.unlink(out)
+      # Make sure that the second run doesn't analyze anything.
+      generate_pyi, main.generate_pyi = main.generate_pyi, None
+      try:
+        cached_errorlog = main.analyze_one_file(src, out, self.options)
+      finally:
+        main.generate_pyi = generate_pyi
+      with open(out) as fi:
+        self.assertEquals(pyi, fi.read())
+      self.assertIn("y = ...  # type: int", pyi)
+      self.assertTrue(errorlog.has_error())
+      self.assertEquals(str(errorlog), str(cached_errorlog))
+      self.assertIsInstance(cached_errorlog, errors.ErrorLog)
+
+  def testNofailCrash(self):
+    with utils.Tempdir() as d:
+      src = d.create_file("foo.py", "x = 3")
+      out = os.path.join(d.path, "foo.pyi")
+      self.options.tweak(cache_dir=os.path.join(d.path, "cache"), nofail=True)
+      def infer_types(*unused_args, **unused_kwargs):
+        raise ValueError("crash")
+      infer_types, main.infer.infer_types = main.infer.infer_types, infer_types
+      try:
+        main.analyze_one_file(src, out, self.options)
+      finally:
+        main.infer.infer_types = infer_types
+      with open(out) as fi:
+        self.assertIn("Caught error", fi.read())
+      self.assertIsNone(
+          result_cache.ResultCache(src, out, self.options).lookup())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,210 @@
+"""A long-running process that runs pytype on request.
+
+Analyzing a small file is dominated by work that is the same every time:
+parsing the builtins and the stubs of the standard library, and compiling
+__builtin__.py. This server runs pytype inside one process, so that all this
+is kept in memory across invocations. (See the module-level caches in
+builtins.py, load_pytd.py and vm.py.)
+
+The server listens on a Unix socket (see client.py for the protocol), in a
+directory that only the user who started it can access. scripts/pytype sends
+its command line to the server if one is running, and runs pytype in-process
+otherwise. It also does the latter if the server was started with a different
+environment (e.g. $TYPESHED_HOME), since the server can't change that for a
+single request.
+
+Requests are processed one at a time, since pytype changes process-wide state
+(the working directory, sys.stdout, sys.stderr and logging). The log messages
+of a request go to the client's stderr, using the client's verbosity. The
+server's own messages go to the server's stderr.
+"""
+
+import logging
+import optparse
+import os
+import socket
+import SocketServer
+import StringIO
+import sys
+import traceback
+
+from pytype import client
+from pytype import config
+from pytype import main as pytype_main
+from pytype import utils
+from pytype.pytd.parse import builtins
+
+log = logging.getLogger(__name__)
+
+
+class ServerAlreadyRunningError(Exception):
+  """Raised if another server is listening on our socket."""
+
+
+class InsecureSocketDirectoryError(Exception):
+  """Raised if other users could access the directory of our socket."""
+
+
+def run_request(argv, cwd):
+  """Run pytype with the given command line.
+
+  Args:
+    argv: The command line, including the program name.
+    cwd: The directory to run pytype in.
+
+  Returns:
+    A dictionary with the fields "exit_code", "stdout" and "stderr".
+  """
+  stdout = StringIO.StringIO()
+  stderr = StringIO.StringIO()
+  old_cwd = os.getcwd()
+  old_stdout, old_stderr = sys.stdout, sys.stderr
+  # pytype sets the level of the root logger according to its verbosity.
+  root = logging.getLogger()
+  old_handlers, old_level = root.handlers, root.level
+  handler = logging.StreamHandler(stderr)
+  handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+  try:
+    os.chdir(cwd)
+    sys.stdout, sys.stderr = stdout, stderr
+    root.handlers = [handler]
+    try:
+      exit_code = pytype_main.main(argv) or 0
+    except SystemExit as e:
+      if e.code is None or isinstance(e.code, int):
+        exit_code = e.code or 0
+      else:
+        # Same as the interpreter does for sys.exit("message").
+        stderr.write("%s\n" % e.code)
+        exit_code = 1
+    except Exception:  # pylint: disable=broad-except
+      stderr.write(traceback.format_exc())
+      exit_code = 1
+  finally:
+    root.handlers = old_handlers
+    root.setLevel(old_level)
+    sys.stdout, sys.stderr = old_stdout, old_stderr
+    os.chdir(old_cwd)
+  return {"exit_code": exit_code,
+          "stdout": stdout.getvalue().decode("utf-8", "replace"),
+          "stderr": stderr.getvalue().decode("utf-8", "replace")}
+
+
+class _RequestHandler(SocketServer.BaseRequestHandler):
+  """Handles a single connection, which carries a single request."""
+
+  def handle(self):
+    try:
+      request = client.recv_message(self.request)
+      argv = [arg.encode("utf-8") for arg in request["argv"]]
+      cwd = request["cwd"].encode("utf-8")
+      env = {name: value if value is None else value.encode("utf-8")
+             for name, value in request["env"].items()}
+    except (EOFError, ValueError, KeyError, TypeError, AttributeError) as e:
+      log.error("Ignoring malformed request: %s", e)
+      return
+    if env != self.server.environment:
+      log.info("Not running %r: started with a different environment", argv)
+      response = {"fallback": "The server has a different environment."}
+    else:
+      log.info("Running %r in %s", argv, cwd)
+      response = run_request(argv, cwd)
+    try:
+      client.send_message(self.request, response)
+    except socket.error as e:
+      log.error("Couldn't send response: %s", e)
+
+
+class Server(SocketServer.UnixStreamServer):
+  """Serves pytype requests on a Unix socket."""
+
+  def __init__(self, socket_path):
+    _prepare_socket_directory(socket_path)
+    _remove_stale_socket(socket_path)
+    # Requests are run in this environment, so we only accept requests from
+    # clients with the same one.
+    self.environment = client.environment()
+    SocketServer.UnixStreamServer.__init__(self, socket_path, _RequestHandler)
+
+  def server_bind(self):
+    # Other users must not be able to run code (e.g. a custom --python_exe)
+    # as us.
+    old_umask = os.umask(0o177)
+    try:
+      SocketServer.UnixStreamServer.server_bind(self)
+    finally:
+      os.umask(old_umask)
+
+  def server_close(self):
+    SocketServer.UnixStreamServer.server_close(self)
+    if os.path.exists(self.server_address):
+      os.unlink(self.server_address)
+
+
+def _prepare_socket_directory(socket_path):
+  """Create the directory of the socket, and check that it's private."""
+  directory = os.path.dirname(os.path.abspath(socket_path))
+  if not os.path.exists(directory):
+    os.mkdir(directory, 0o700)
+  error = utils.private_directory_error(directory)
+  if error:
+    raise InsecureSocketDirectoryError(
+        "Not listening on %s: %s" % (socket_path, error))
+
+
+def _remove_stale_socket(socket_path):
+  """Remove the socket file a crashed server left behind."""
+  if not os.path.exists(socket_path):
+    return
+  sock = client.connect(socket_path)
+  if sock is not None:
+    sock.close()
+    raise ServerAlreadyRunningError(
+        "A server is already listening on %s" % socket_path)
+  os.unlink(socket_path)
+
+
+def parse_options(argv):
+  """Parse the command line of the server."""
+  o = optparse.OptionParser("Usage: %prog [options]")
+  o.add_option(
+      "--socket", type="string", action="store",
+      dest="socket", default=client.default_socket_path(),
+      help=("Unix socket to listen on. Its directory must be accessible only "
+            "by the current user. Defaults to the value of $%s, or a file in "
+            "a per-user directory in $XDG_RUNTIME_DIR or the temp directory." %
+            client.SOCKET_ENV_VAR))
+  o.add_option(
+      "-v", "--verbosity", type="int", action="store",
+      dest="verbosity", default=1,
+      help="Set logging verbosity: 0=fatal, 1=error (default), 2=warn, "
+           "3=info, 4=debug")
+  options, args = o.parse_args(argv[1:])
+  if args:
+    o.error("Unexpected arguments: %s" % " ".join(args))
+  if not options.socket:
+    o.error("Need a socket path.")
+  if not 0 <= options.verbosity < len(config.LOG_LEVELS):
+    o.error("Invalid verbosity: %d" % options.verbosity)
+  return options
+
+
+def main(argv):
+  options = parse_options(argv)
+  # Configure logging before the first request does, so that log messages
+  # don't end up in the captured output of a request.
+  logging.basicConfig(level=config.LOG_LEVELS[options.verbosity])
+  builtins.GetBuiltinsAndTyping()
+  try:
+    server = Server(options.socket)
+  except (ServerAlreadyRunningError, InsecureSocketDirectoryError) as e:
+    print >>sys.stderr, e
+    return 1
+  print >>sys.stderr, "Listening on %s" % options.socket
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+  return 0
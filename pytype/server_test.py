@@ -0,0 +1,147 @@
+"""Tests for server.py and client.py."""
+
+import os
+import StringIO
+import sys
+import threading
+
+from pytype import client
+from pytype import server
+from pytype import utils
+
+import unittest
+
+
+class ServerTest(unittest.TestCase):
+  """Tests for server.py and client.py."""
+
+  def testRunRequest(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.py", "x = 3\n")
+      response = server.run_request(
+          ["pytype", "-o", "foo.pyi", "foo.py"], d.path)
+      self.assertEquals(0, response["exit_code"])
+      with open(os.path.join(d.path, "foo.pyi")) as fi:
+        self.assertIn("x = ...  # type: int", fi.read())
+
+  def testRunRequestOutput(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.py", "x = 3\n")
+      d.create_file("bar.py", "x = 3 +\n")
+      cwd = os.getcwd()
+      response = server.run_request(["pytype", "-o", "-", "foo.py"], d.path)
+      self.assertEquals(0, response["exit_code"])
+      self.assertIn("x = ...  # type: int", response["stdout"])
+      response = server.run_request(["pytype", "bar.py"], d.path)
+      self.assertEquals(1, response["exit_code"])
+      self.assertIn("invalid syntax", response["stderr"])
+      self.assertEquals(cwd, os.getcwd())
+
+  def testRunRequestBadOption(self):
+    with utils.Tempdir() as d:
+      response = server.run_request(["pytype", "--nonexistent"], d.path)
+      self.assertEquals(2, response["exit_code"])
+      self.assertIn("nonexistent", response["stderr"])
+
+  def testRunRequestVerbosity(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.py", "x = 3\n")
+      response = server.run_request(["pytype", "-o", "-", "foo.py"], d.path)
+      self.assertNotIn("INFO:", response["stderr"])
+      response = server.run_request(
+          ["pytype", "-v", "3", "-o", "-", "foo.py"], d.path)
+      self.assertIn("INFO:", response["stderr"])
+
+  def testRunRequestChangedTypeshed(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.py", "import mymod\ny = mymod.x\n")
+      stub = d.create_file(os.path.join("typeshed", "stdlib", "2and3",
+                                        "mymod.pyi"), "x = ...  # type: int")
+      old_typeshed = os.environ.get("TYPESHED_HOME")
+      os.environ["TYPESHED_HOME"] = os.path.join(d.path, "typeshed")
+      try:
+        response = server.run_request(["pytype", "-o", "-", "foo.py"], d.path)
+        self.assertIn("y = ...  # type: int", response["stdout"])
+        with open(stub, "w") as fi:
+          fi.write("x = ...  # type: str")
+        response = server.run_request(["pytype", "-o", "-", "foo.py"], d.path)
+        self.assertIn("y = ...  # type: str", response["stdout"])
+      finally:
+        if old_typeshed is None:
+          del os.environ["TYPESHED_HOME"]
+        else:
+          os.environ["TYPESHED_HOME"] = old_typeshed
+
+  def testNoServer(self):
+    with utils.Tempdir() as d:
+      socket_path = os.path.join(d.path, "socket")
+      self.assertIsNone(client.run(["pytype", "foo.py"], socket_path))
+      self.assertIsNone(client.run(["pytype", "foo.py"], ""))
+
+  def testServer(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.py", "def f(): return 3\n")
+      socket_path = os.path.join(d.path, "socket")
+      # A crashed server might leave its socket behind.
+      d.create_file("socket")
+      s = server.Server(socket_path)
+      thread = threading.Thread(target=s.serve_forever)
+      thread.start()
+      try:
+        self.assertRaises(server.ServerAlreadyRunningError,
+                          server.Server, socket_path)
+        old_stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        old_cwd = os.getcwd()
+        try:
+          os.chdir(d.path)
+          ret = client.run(["pytype", "-o", "-", "foo.py"], socket_path)
+          output = sys.stdout.getvalue()
+        finally:
+          os.chdir(old_cwd)
+          sys.stdout = old_stdout
+      finally:
+        s.shutdown()
+        thread.join()
+        s.server_close()
+      self.assertEquals(0, ret)
+      self.assertIn("def f() -> int", output)
+      self.assertFalse(os.path.exists(socket_path))
+
+  def testDifferentEnvironment(self):
+    with utils.Tempdir() as d:
+      socket_path = os.path.join(d.path, "socket")
+      s = server.Server(socket_path)
+      thread = threading.Thread(target=s.serve_forever)
+      thread.start()
+      old_typeshed_home = os.environ.get("TYPESHED_HOME")
+      os.environ["TYPESHED_HOME"] = d.path
+      try:
+        self.assertIsNone(client.run(["pytype", "foo.py"], socket_path))
+      finally:
+        if old_typeshed_home is None:
+          del os.environ["TYPESHED_HOME"]
+        else:
+          os.environ["TYPESHED_HOME"] = old_typeshed_home
+        s.shutdown()
+        thread.join()
+        s.server_close()
+
+  def testInsecureSocketDirectory(self):
+    with utils.Tempdir() as d:
+      os.chmod(d.path, 0o755)
+      socket_path = os.path.join(d.path, "socket")
+      self.assertRaises(server.InsecureSocketDirectoryError,
+                        server.Server, socket_path)
+      self.assertIsNone(client.run(["pytype", "foo.py"], socket_path))
+
+  def testCreateSocketDirectory(self):
+    with utils.Tempdir() as d:
+      socket_path = os.path.join(d.path, "pytype", "socket")
+      s = server.Server(socket_path)
+      s.server_close()
+      self.assertIsNone(
+          utils.private_directory_error(os.path.join(d.path, "pytype")))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -2,10 +2,13 @@
 
 import contextlib
 import errno
+import hashlib
 import itertools
 import os
 import re
 import shutil
+import stat
+import sys
 import tempfile
 import textwrap
 import threading
@@ -23,6 +26,30 @@ def replace_extension(filename, new_extension):
     return name + "." + new_extension
 
 
+# Set by pytype_fingerprint().
+_fingerprint = None
+
+
+def pytype_fingerprint():
+  """Hash the source code and the type definitions of pytype itself."""
+  global _fingerprint
+  if _fingerprint is None:
+    m = hashlib.md5(sys.version)
+    root = os.path.dirname(os.path.abspath(__file__))
+    for dirpath, dirnames, filenames in os.walk(root):
+      # Typeshed files are recorded as dependencies, when they're used.
+      dirnames[:] = sorted(d for d in dirnames
+                           if d not in ("typeshed", "tests", "test_data"))
+      for filename in sorted(filenames):
+        if filename.endswith((".py", ".pytd")):
+          path = os.path.join(dirpath, filename)
+          m.update(os.path.relpath(path, root))
+          with open(path, "rb") as fi:
+            m.update(fi.read())
+    _fingerprint = m.hexdigest()
+  return _fingerprint
+
+
 def variable_product(variables):
   """Take the Cartesian product of a number of Variables.
 
@@ -385,6 +412,29 @@ def _makedirs(path):
       raise
 
 
+def private_directory_error(directory):
+  """Check that only the current user can access a directory.
+
+  Args:
+    directory: A path.
+
+  Returns:
+    None if the directory is private to the current user, an error message
+    otherwise.
+  """
+  try:
+    st = os.lstat(directory)
+  except OSError as e:
+    return str(e)
+  if not stat.S_ISDIR(st.st_mode):
+    return "%s is not a directory" % directory
+  if st.st_uid != os.getuid():
+    return "%s is owned by another user" % directory
+  if st.st_mode & 0o077:
+    return "%s is accessible by other users" % directory
+  return None
+
+
 class Tempdir(object):
   """Context handler for creating temporary directories."""
 
@@ -509,13 +559,21 @@ class MonitorDict(dict):
   values. It increments a changestamp whenever a new value is added or more data
   is merged into a value. The changestamp is unaffected by the addition of
   another origin for existing data.
+
+  The class attribute global_changestamp is incremented whenever any
+  MonitorDict is created or changes, so it tells whether anything that
+  depends on the contents of MonitorDicts needs to be recomputed.
   """
 
+  global_changestamp = 0
+
   def __init__(self, *args, **kwargs):
     super(MonitorDict, self).__init__(*args, **kwargs)
     self.changestamp = 0
     for var in self.values():
       var.RegisterChangeListener(self._changed)
+    # A new dict might replace another one as the children of a value.
+    MonitorDict.global_changestamp += 1
 
   def __delitem__(self, name):
     self[name].UnregisterChangeListener(self._changed)
@@ -531,6 +589,7 @@ class MonitorDict(dict):
 
   def _changed(self):
     self.changestamp += 1
+    MonitorDict.global_changestamp += 1
 
   @property
   def data(self):
@@ -284,6 +284,17 @@ class UtilsTest(unittest.TestCase):
                       utils.mro_merge([[1, 3, 5], [2, 3, 4], [4, 5, 6]]))
     self.assertEquals([1, 2, 3], utils.mro_merge([[1, 2, 1], [2, 3, 2]]))
 
+  def testPrivateDirectoryError(self):
+    with utils.Tempdir() as d:
+      directory = d.create_directory("private")
+      os.chmod(directory, 0o700)
+      self.assertIsNone(utils.private_directory_error(directory))
+      os.chmod(directory, 0o755)
+      self.assertIn("accessible", utils.private_directory_error(directory))
+      self.assertIn("not a directory", utils.private_directory_error(
+          d.create_file("file")))
+      self.assertIsNotNone(utils.private_directory_error(d["missing"]))
+
   def testTempdir(self):
     with utils.Tempdir() as d:
       filename1 = d.create_file("foo.txt")
@@ -435,6 +446,21 @@ class UtilsTest(unittest.TestCase):
     del d["key"]
     self.assertGreater(d.changestamp, changestamp)
 
+  def testMonitorDictGlobalChangestamp(self):
+    d = utils.MonitorDict()
+    changestamp = utils.MonitorDict.global_changestamp
+    var = self.prog.NewVariable("var")
+    d["key"] = var
+    self.assertGreater(utils.MonitorDict.global_changestamp, changestamp)
+    changestamp = utils.MonitorDict.global_changestamp
+    var.AddBinding("data")
+    self.assertGreater(utils.MonitorDict.global_changestamp, changestamp)
+    changestamp = utils.MonitorDict.global_changestamp
+    var.AddBinding("data")  # No change because this is duplicate data
+    self.assertEquals(utils.MonitorDict.global_changestamp, changestamp)
+    utils.MonitorDict()
+    self.assertGreater(utils.MonitorDict.global_changestamp, changestamp)
+
   def testDynamicVar(self):
     var = utils.DynamicVar()
     self.assertIsNone(var.get())
@@ -22,6 +22,7 @@ import types
 
 from pytype import abstract
 from pytype import blocks
+from pytype import disk_cache
 from pytype import exceptions
 from pytype import load_pytd
 from pytype import metrics
@@ -56,6 +57,10 @@ Block = collections.namedtuple("Block", ["type", "handler", "level"])
 
 _opcode_counter = metrics.MapCounter("vm_opcode")
 
+# Compiled __builtin__.py, keyed by (source, python_version, python_exe). The VM
+# never modifies code objects, so all the VMs of a process can share them.
+_builtins_code_cache = {}
+
 
 class RecursionException(Exception):
   pass
@@ -92,7 +97,8 @@ class VirtualMachine(object):
     self.cache_unknowns = cache_unknowns
     self.loader = load_pytd.Loader(
         base_module=module_name,
-        options=options)
+        options=options,
+        lazy=True)
     # The call stack of frames.
     self.frames = []
     # The current frame.
@@ -104,6 +110,16 @@ class VirtualMachine(object):
     self.program.entrypoint = self.root_cfg_node
 
     self._convert_cache = {}
+    # Maps (class, formal class) to whether instances of the class match the
+    # formal class. See abstract.match_value_against_type.
+    self.match_cache = {}
+    # Used by abstract.InterpreterFunction.make_function. This lives here, and
+    # not in a class attribute, so that the functions (and with them, the whole
+    # typegraph) can be freed once we're done with this VM.
+    self.function_cache = {}
+    # Map from opcode class to the byte_* method implementing it. See
+    # _get_opcode_handler.
+    self._opcode_handlers = {}
 
     # Initialize primitive_classes to empty to allow convert_constant to run
     self.primitive_classes = {}
@@ -186,10 +202,11 @@ class VirtualMachine(object):
     self.frame.current_opcode = op
     try:
       # dispatch
-      bytecode_fn = getattr(self, "byte_%s" % op.name, None)
-      if bytecode_fn is None:
-        raise VirtualMachineError("Unknown opcode: %s" % op.name)
-      if op.has_arg():
+      try:
+        bytecode_fn, has_arg = self._opcode_handlers[op.__class__]
+      except KeyError:
+        bytecode_fn, has_arg = self._get_opcode_handler(op)
+      if has_arg:
         state = bytecode_fn(state, op)
       else:
         state = bytecode_fn(state)
@@ -211,6 +228,24 @@ class VirtualMachine(object):
     del self.frame.current_opcode
     return state
 
+  def _get_opcode_handler(self, op):
+    """Look up, and remember, the method implementing an opcode.
+
+    Args:
+      op: An opcode, instance of pyc.opcodes.Opcode.
+    Returns:
+      A tuple of the (bound) byte_* method, and whether it takes the opcode
+      as an argument.
+    Raises:
+      VirtualMachineError: If we don't support this opcode.
+    """
+    bytecode_fn = getattr(self, "byte_%s" % op.name, None)
+    if bytecode_fn is None:
+      raise VirtualMachineError("Unknown opcode: %s" % op.name)
+    handler = self._opcode_handlers[op.__class__] = (bytecode_fn,
+                                                     op.has_arg())
+    return handler
+
   def join_cfg_nodes(self, nodes):
     assert nodes
     if len(nodes) == 1:
@@ -875,7 +910,8 @@ class VirtualMachine(object):
     code = pyc.compile_src(
         src, python_version=self.python_version,
         python_exe=self.options.python_exe,
-        filename=filename)
+        filename=filename,
+        cache=disk_cache.get_cache(self.options, "pyc"))
     return blocks.process_code(code)
 
   def run_bytecode(self, node, code, f_globals=None, f_locals=None):
@@ -894,7 +930,10 @@ class VirtualMachine(object):
         src = fi.read()
     else:
       src = builtins.GetBuiltinsCode(self.python_version)
-    builtins_code = self.compile_src(src)
+    key = (src, self.python_version, self.options.python_exe)
+    builtins_code = _builtins_code_cache.get(key)
+    if builtins_code is None:
+      builtins_code = _builtins_code_cache[key] = self.compile_src(src)
     node, f_globals, f_locals = self.run_bytecode(node, builtins_code)
     # TODO(kramm): pytype doesn't support namespacing of the currently parsed
     # module, so add the module name manually.
@@ -2,10 +2,12 @@
 
 # pylint: disable=bad-indentation
 
+from distutils.command.build_py import build_py
 from distutils.core import setup
 
 import glob
 import os
+import sys
 
 
 def scan_package_data(path, pattern):
@@ -18,6 +20,30 @@ def scan_package_data(path, pattern):
     return result
 
 
+class BuildPyWithParserTables(build_py):
+    """Also generate the lexer and parser tables of the pyi parser.
+
+    Afterwards, precompile the builtins, so that pytype doesn't have to parse
+    them on every start.
+    """
+
+    def run(self):
+        build_py.run(self)
+        if self.dry_run:
+            return
+        sys.path.insert(0, self.build_lib)
+        # pylint: disable=g-import-not-at-top
+        from pytype.pytd.parse import parser
+        parser.generate_tables(
+            os.path.join(self.build_lib, 'pytype', 'pytd', 'parse'))
+        # The precompiled builtins are versioned with a hash of all of pytype's
+        # code, so this has to come after the parser tables are generated.
+        from pytype.pytd.parse import builtins
+        # pylint: enable=g-import-not-at-top
+        builtins.Precompile(os.path.join(
+            self.build_lib, 'pytype', 'pytd', 'builtins', 'precompiled.pickle'))
+
+
 typeshed = scan_package_data('typeshed', '*.pyi')
 assert 'typeshed/stdlib/2.7/*.pyi' in typeshed
 
@@ -34,11 +60,12 @@ setup(
               'pytype/pytd',
               'pytype/pytd/parse',
              ],
-    scripts=['scripts/pytype', 'scripts/pytd'],
+    scripts=['scripts/pytype', 'scripts/pytype-server', 'scripts/pytd'],
     package_data={'pytype': ['pytd/builtins/*.pytd',
                              'pytd/stdlib/*.pytd',
                              'pytd/stdlib/*/*.pytd',
                             ] + typeshed},
+    cmdclass={'build_py': BuildPyWithParserTables},
     requires=['ply (>=3.4)', 'pyyaml (>=3.11)'],
     install_requires=['ply>=3.4', 'pyyaml>=3.11'],
     classifier=["Programming Language :: Python :: 2.7"],